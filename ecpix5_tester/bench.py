@@ -0,0 +1,215 @@
+import sys
+import json
+import time
+import platform as _platform
+
+from nmigen import *
+from nmigen.back.pysim import Simulator
+
+from .blinky import Blinky
+from .dvi import (VideoTiming, SyncGenerator, TestCardGen, I2CInitializer, I2CWriteBurst,
+                  I2CReadModifyWrite)
+from .i2c import I2CTarget
+
+
+__all__ = ["BENCHMARKS", "run_benchmark", "run_benchmarks", "find_regressions"]
+
+
+def _i2c_pads():
+    return Record([
+        ("scl", [("i", 1), ("o", 1), ("oe", 1)]),
+        ("sda", [("i", 1), ("o", 1), ("oe", 1)]),
+    ])
+
+
+def _i2c_cmds(addr):
+    return [
+        (addr, 0x04, 0x20),
+        (addr, 0x04, 0x00),
+        I2CWriteBurst(addr, 0x10, range(16)),
+        I2CReadModifyWrite(addr, 0x04, 0x0f, 0x05),
+    ] * 4
+
+
+def _bench_blinky():
+    from .top import make_platform
+    return Blinky(), make_platform("85", ("blinky",), add_sources=False)
+
+
+def _bench_syncgen():
+    return SyncGenerator(VideoTiming(1024, 768, 60)), None
+
+
+def _bench_testcard():
+    # TestCardGen only does any work when fed a raster, so it is driven by a SyncGenerator.
+    timing = VideoTiming(1024, 768, 60)
+    m = Module()
+    m.submodules.syncgen = syncgen = SyncGenerator(timing)
+    m.submodules.tcgen   = tcgen   = TestCardGen(timing.h.visible, timing.v.visible)
+    m.d.comb += [
+        tcgen.i_de.eq(syncgen.de),
+        tcgen.i_hsync.eq(syncgen.hsync),
+        tcgen.i_vsync.eq(syncgen.vsync),
+        tcgen.x.eq(syncgen.x),
+        tcgen.y.eq(syncgen.y),
+    ]
+    return m, None
+
+
+def _bench_i2c_initializer():
+    # Nothing on the bus: SCL and SDA are only pulled up, and every byte is NACKed.
+    m = Module()
+    pads = _i2c_pads()
+    m.submodules.init = I2CInitializer(_i2c_cmds(0x4c), pads, 4_000_000)
+    m.d.comb += [
+        pads.scl.i.eq(~pads.scl.oe),
+        pads.sda.i.eq(~pads.sda.oe),
+    ]
+    return m, None
+
+
+def _bench_i2c_loopback():
+    m = Module()
+    i_pads = _i2c_pads()
+    t_pads = _i2c_pads()
+    m.submodules.init = I2CInitializer(_i2c_cmds(0x4c), i_pads, 4_000_000)
+    m.submodules.target = target = I2CTarget(t_pads)
+
+    scl = ~(i_pads.scl.oe | t_pads.scl.oe)
+    sda = ~(i_pads.sda.oe | t_pads.sda.oe)
+    m.d.comb += [
+        i_pads.scl.i.eq(scl),
+        t_pads.scl.i.eq(scl),
+        i_pads.sda.i.eq(sda),
+        t_pads.sda.i.eq(sda),
+        target.address.eq(0x4c),
+        target.ack_o.eq(1),
+        target.data_o.eq(0x5a),
+    ]
+    return m, None
+
+
+# Benchmark name: function returning an elaboratable and the platform to elaborate it for.
+BENCHMARKS = {
+    "blinky":          _bench_blinky,
+    "syncgen":         _bench_syncgen,
+    "testcard":        _bench_testcard,
+    "i2c_initializer": _bench_i2c_initializer,
+    "i2c_loopback":    _bench_i2c_loopback,
+}
+
+
+def run_benchmark(name, cycles=10_000):
+    """
+    Elaborate and simulate benchmark ``name`` for ``cycles`` clock cycles. Returns a dict
+    with the elaboration time, the simulator setup time and the simulation run time, in
+    seconds, and the simulation speed, in cycles per second.
+    """
+    design, platform = BENCHMARKS[name]()
+
+    start = time.perf_counter()
+    fragment = Fragment.get(design, platform)
+    elaborated = time.perf_counter()
+
+    sim = Simulator(fragment)
+    sim.add_clock(1e-6)
+    def process():
+        for _ in range(cycles):
+            yield
+    sim.add_sync_process(process)
+    prepared = time.perf_counter()
+
+    sim.run()
+    finished = time.perf_counter()
+
+    return {
+        "cycles":         cycles,
+        "elaborate_time": elaborated - start,
+        "setup_time":     prepared - elaborated,
+        "run_time":       finished - prepared,
+        "cycles_per_sec": cycles / (finished - prepared),
+    }
+
+
+def run_benchmarks(names=None, cycles=10_000):
+    """
+    Run the benchmarks in ``names`` (by default, all of them). Returns a JSON-serializable
+    report that includes the versions of Python and nMigen.
+    """
+    try:
+        from importlib.metadata import version
+        nmigen_version = version("nmigen")
+    except Exception:
+        nmigen_version = None
+    return {
+        "python":  _platform.python_version(),
+        "nmigen":  nmigen_version,
+        "results": {name: run_benchmark(name, cycles) for name in names or BENCHMARKS},
+    }
+
+
+def find_regressions(report, baseline, threshold=0.2):
+    """
+    Compare ``report`` against a ``baseline`` report. Returns a list of messages describing
+    each benchmark that simulates more than ``threshold`` (relative) slower, or elaborates
+    more than ``threshold`` slower, than in the baseline.
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        base = baseline["results"][name]
+        if result["cycles_per_sec"] < base["cycles_per_sec"] * (1 - threshold):
+            regressions.append("{}: simulation speed {:.0f} cycles/s, baseline {:.0f} cycles/s"
+                               .format(name, result["cycles_per_sec"], base["cycles_per_sec"]))
+        if result["elaborate_time"] > base["elaborate_time"] * (1 + threshold):
+            regressions.append("{}: elaboration time {:.3f}s, baseline {:.3f}s"
+                               .format(name, result["elaborate_time"], base["elaborate_time"]))
+    return regressions
+
+
+def _format_result(name, result):
+    return "{}: {:.0f} cycles/s, elaborate {:.3f}s, setup {:.3f}s".format(
+        name, result["cycles_per_sec"], result["elaborate_time"], result["setup_time"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def parse_names(spec):
+        names = spec.split(",")
+        for name in names:
+            if name not in BENCHMARKS:
+                raise argparse.ArgumentTypeError("Unknown benchmark {!r}".format(name))
+        return names
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmarks", type=parse_names, default=None,
+        help="comma-separated list of benchmarks to run, among {} (default: all)"
+             .format(", ".join(BENCHMARKS)))
+    parser.add_argument("--cycles", type=int, default=10_000,
+        help="number of clock cycles to simulate (default: %(default)s)")
+    parser.add_argument("--output", default=None,
+        help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None,
+        help="JSON file with the results of a previous run, to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+        help="relative slowdown against the baseline that counts as a regression "
+             "(default: %(default)s)")
+
+    args = parser.parse_args()
+    report = run_benchmarks(args.benchmarks, args.cycles)
+    for name, result in report["results"].items():
+        print(_format_result(name, result))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.threshold)
+        for regression in regressions:
+            print("regression: {}".format(regression), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
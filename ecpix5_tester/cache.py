@@ -0,0 +1,88 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+
+from nmigen.build.run import LocalBuildProducts
+
+
+__all__ = ["default_cache_dir", "plan_digest", "build_cached"]
+
+
+# Bitstream products of the Trellis toolchain that are worth keeping.
+_PRODUCTS = ("{name}.bit", "{name}.svf")
+
+# `src` attributes only carry Python file/line locations; they do not affect the bitstream,
+# and would otherwise invalidate the cache on every unrelated edit of the gateware sources.
+_RTLIL_SRC_ATTR = re.compile(rb"^\s*attribute \\src .*\n", re.MULTILINE)
+
+
+def default_cache_dir():
+    if "ECPIX5_TESTER_CACHE" in os.environ:
+        return os.environ["ECPIX5_TESTER_CACHE"]
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "ecpix5_tester")
+
+
+def plan_digest(platform, plan):
+    """
+    Content hash of a build plan.
+    Covers the elaborated design (RTLIL), every added file, the rendered toolchain scripts
+    (and thus all toolchain options, and the digests of the LiteX sources they read in place),
+    and toolchain overrides taken from the environment.
+    """
+    hasher = hashlib.sha256()
+    for filename in sorted(plan.files):
+        if filename.endswith(".debug.v"):
+            continue # derived from the RTLIL
+        content = plan.files[filename]
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if filename.endswith(".il"):
+            content = _RTLIL_SRC_ATTR.sub(b"", content)
+        hasher.update(filename.encode("utf-8") + b"\0")
+        hasher.update(hashlib.sha256(content).digest())
+    env_vars = ["NMIGEN_ENV_{}".format(platform.toolchain)]
+    env_vars += [tool.upper().replace("-", "_") for tool in platform.required_tools]
+    for env_var in env_vars:
+        hasher.update("{}={}\0".format(env_var, os.environ.get(env_var, "")).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def build_cached(platform, elaboratable, name="top", build_dir="build", cache_dir=None,
+                 do_program=False, program_opts=None, **kwargs):
+    """
+    Same as ``platform.build(...)``, except that the toolchain only runs if no bitstream
+    was previously built from an identical plan. Returns ``True`` on a cache hit.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    plan   = platform.prepare(elaboratable, name, **kwargs)
+    digest = plan_digest(platform, plan)
+    entry  = os.path.join(cache_dir, digest)
+    products = [product.format(name=name) for product in _PRODUCTS]
+
+    hit = all(os.path.exists(os.path.join(entry, product)) for product in products)
+    if hit:
+        os.makedirs(build_dir, exist_ok=True)
+        for product in products:
+            shutil.copyfile(os.path.join(entry, product), os.path.join(build_dir, product))
+    else:
+        plan.execute_local(build_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Populate a private directory first, so that concurrent builds never observe
+        # a partially written entry.
+        staging = tempfile.mkdtemp(dir=cache_dir)
+        for product in products:
+            shutil.copyfile(os.path.join(build_dir, product), os.path.join(staging, product))
+        try:
+            os.replace(staging, entry)
+        except OSError:
+            shutil.rmtree(staging) # another build stored the same entry first
+
+    if do_program:
+        platform.toolchain_program(LocalBuildProducts(os.path.abspath(build_dir)), name,
+                                   **(program_opts or {}))
+    return hit
@@ -0,0 +1,99 @@
+// Co-simulation testbench for the LiteX SoC, as instantiated by the nMigen tester top-level
+// (COSIM_DUT, see soc_cosim.py): the board clock and reset, a DDR3 model on the memory bus,
+// and the UART bridged to a host pseudo-terminal.
+//
+// Pass +max-time-us=<n> to end the simulation after n microseconds.
+
+`timescale 1ps/1ps
+
+module cosim_top;
+    reg clk100 = 1'b0;
+    always #5000 clk100 = !clk100;
+
+    reg rst_n = 1'b0;
+    initial #1us rst_n = 1'b1;
+
+    reg eth_clk_rx = 1'b0;
+    always #20000 eth_clk_rx = !eth_clk_rx;
+
+    wire        serial_tx;
+    wire        serial_rx;
+
+    wire [14:0] ddram_a;
+    wire [2:0]  ddram_ba;
+    wire        ddram_ras_n;
+    wire        ddram_cas_n;
+    wire        ddram_we_n;
+    wire [1:0]  ddram_dm;
+    wire [15:0] ddram_dq;
+    wire [1:0]  ddram_dqs_p;
+    wire        ddram_clk_p;
+    wire        ddram_cke;
+    wire        ddram_odt;
+
+    wire        eth_mdio;
+    pullup (eth_mdio);
+
+    // The tester top-level with only the LiteX SoC, elaborated by nMigen; ports are named after
+    // the platform resources they are requested from.
+    `COSIM_DUT dut (
+        .clk100_0__io(clk100),
+        .rst_0__io(rst_n),
+
+        .uart_0__rx__io(serial_rx),
+        .uart_0__tx__io(serial_tx),
+
+        .ddr3_0__a__io(ddram_a),
+        .ddr3_0__ba__io(ddram_ba),
+        .ddr3_0__ras__io(ddram_ras_n),
+        .ddr3_0__cas__io(ddram_cas_n),
+        .ddr3_0__we__io(ddram_we_n),
+        .ddr3_0__dm__io(ddram_dm),
+        .ddr3_0__dq__io(ddram_dq),
+        .ddr3_0__dqs__p(ddram_dqs_p),
+        .ddr3_0__clk__p(ddram_clk_p),
+        .ddr3_0__clk_en__io(ddram_cke),
+        .ddr3_0__odt__io(ddram_odt),
+
+        .eth_rgmii_0__tx_clk__io(),
+        .eth_rgmii_0__rx_clk__io(eth_clk_rx),
+        .eth_rgmii_0__rst__io(),
+        .eth_rgmii_0__mdio__io(eth_mdio),
+        .eth_rgmii_0__mdc__io(),
+        .eth_rgmii_0__rx_ctrl__io(1'b0),
+        .eth_rgmii_0__rx_data__io(4'b0),
+        .eth_rgmii_0__tx_ctrl__io(),
+        .eth_rgmii_0__tx_data__io()
+    );
+
+    ddr3_model ddram (
+        .ck(ddram_clk_p),
+        .cke(ddram_cke),
+        .ras_n(ddram_ras_n),
+        .cas_n(ddram_cas_n),
+        .we_n(ddram_we_n),
+        .ba(ddram_ba),
+        .a(ddram_a),
+        .dm(ddram_dm),
+        .odt(ddram_odt),
+        .dq(ddram_dq),
+        .dqs(ddram_dqs_p)
+    );
+
+    // The SoC UART runs at 1 Mbaud.
+    uart_pty #(
+        .CLKS_PER_BIT(100)
+    ) uart (
+        .clk(clk100),
+        .tx(serial_tx),
+        .rx(serial_rx)
+    );
+
+    int max_time_us;
+    initial begin
+        if ($value$plusargs("max-time-us=%d", max_time_us)) begin
+            #(max_time_us * 1us);
+            $finish;
+        end
+    end
+endmodule
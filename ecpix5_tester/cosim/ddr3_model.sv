@@ -0,0 +1,156 @@
+// Behavioral model of a x16 DDR3 SDRAM, for co-simulation of the LiteX SoC.
+//
+// Only what the LiteDRAM controller and the BIOS exercise is modeled: mode register writes
+// (CAS latency, CAS write latency and additive latency), row activation, and BL8 reads and
+// writes. Refresh, precharge and power-down commands are accepted and ignored, and no timing
+// parameter is checked. The array is sparse, so only written locations use host memory.
+
+`timescale 1ps/1ps
+
+module ddr3_model (
+    input         ck,
+    input         cke,
+    input         ras_n,
+    input         cas_n,
+    input         we_n,
+    input  [2:0]  ba,
+    input  [14:0] a,
+    input  [1:0]  dm,
+    input         odt,
+    inout  [15:0] dq,
+    inout  [1:0]  dqs
+);
+    logic [15:0] mem [bit [27:0]];
+
+    logic [14:0] rows [8];
+
+    int cl  = 6;
+    int cwl = 5;
+    int al  = 0;
+
+    function automatic bit [27:0] word_addr(bit [2:0] bank, bit [14:0] row, bit [9:0] col);
+        return {bank, row, col};
+    endfunction
+
+    // Pending bursts. Reads are started at a given clock cycle; writes are completed by
+    // each byte lane independently, as the lanes' strobes are not aligned.
+    typedef struct {
+        longint     cycle;
+        bit [27:0]  addr;
+    } burst_t;
+
+    burst_t reads  [$];
+    burst_t writes [$];
+
+    longint cycle = 0;
+
+    always @(posedge ck) begin
+        cycle <= cycle + 1;
+        if (cke) begin
+            case ({ras_n, cas_n, we_n})
+                3'b000: // MRS
+                    case (ba)
+                        3'd0: cl = a[6:4] + 4;
+                        3'd1: al = a[4:3] == 2'd1 ? cl - 1 : a[4:3] == 2'd2 ? cl - 2 : 0;
+                        3'd2: cwl = a[5:3] + 5;
+                        default: ;
+                    endcase
+                3'b011: // ACT
+                    rows[ba] <= a;
+                3'b101: // READ
+                    reads.push_back('{cycle + al + cl, word_addr(ba, rows[ba], {a[9:3], 3'b0})});
+                3'b100: // WRITE
+                    writes.push_back('{cycle + al + cwl, word_addr(ba, rows[ba], {a[9:3], 3'b0})});
+                default: ;
+            endcase
+        end
+    end
+
+    // Read path. DQ and DQS are driven edge-aligned, with a one cycle preamble and a half
+    // cycle postamble.
+
+    logic        rd_oe  = 1'b0;
+    logic [15:0] rd_dq  = 16'b0;
+    logic        rd_dqs = 1'b0;
+    int          rd_beat = -1;
+    bit   [27:0] rd_addr;
+
+    assign dq  = rd_oe ? rd_dq       : 16'bz;
+    assign dqs = rd_oe ? {2{rd_dqs}} : 2'bz;
+
+    function automatic logic [15:0] read_word(bit [27:0] addr);
+        return mem.exists(addr) ? mem[addr] : 16'b0;
+    endfunction
+
+    always @(posedge ck) begin
+        if (rd_beat == 2 || rd_beat == 4 || rd_beat == 6) begin
+            rd_dq   <= read_word(rd_addr + rd_beat);
+            rd_dqs  <= 1'b1;
+            rd_beat <= rd_beat + 1;
+        end else if (reads.size() != 0 && reads[0].cycle == cycle) begin
+            rd_addr = reads[0].addr;
+            void'(reads.pop_front());
+            rd_oe   <= 1'b1;
+            rd_dq   <= read_word(rd_addr);
+            rd_dqs  <= 1'b1;
+            rd_beat <= 1;
+        end else if (reads.size() != 0 && reads[0].cycle == cycle + 1) begin
+            rd_oe   <= 1'b1;
+            rd_dqs  <= 1'b0;
+            rd_beat <= -1;
+        end else if (rd_beat == 8) begin
+            rd_beat <= -1;
+        end
+    end
+
+    always @(negedge ck) begin
+        if (rd_beat == 1 || rd_beat == 3 || rd_beat == 5 || rd_beat == 7) begin
+            rd_dq   <= read_word(rd_addr + rd_beat);
+            rd_dqs  <= 1'b0;
+            rd_beat <= rd_beat + 1;
+        end else if (rd_beat == -1 && (reads.size() == 0 || reads[0].cycle > cycle + 1)) begin
+            rd_oe   <= 1'b0;
+        end
+    end
+
+    // Write path. Data is captured on both edges of the strobe of each byte lane, while the
+    // model is not driving the strobes itself.
+
+    for (genvar lane = 0; lane < 2; lane++) begin : lanes
+        int         beat = 0;
+        int         head = 0;
+        logic [7:0] data [8];
+        logic       mask [8];
+
+        task automatic capture();
+            if (rd_oe || head >= writes.size())
+                return;
+            data[beat] = dq[8 * lane +: 8];
+            mask[beat] = dm[lane];
+            beat++;
+            if (beat == 8) begin
+                for (int i = 0; i < 8; i++) begin
+                    bit [27:0] addr = writes[head].addr + i;
+                    logic [15:0] word = read_word(addr);
+                    if (!mask[i])
+                        word[8 * lane +: 8] = data[i];
+                    mem[addr] = word;
+                end
+                beat = 0;
+                head++;
+            end
+        endtask
+
+        always @(posedge dqs[lane]) capture();
+        always @(negedge dqs[lane]) if (beat != 0) capture();
+    end
+
+    // Retire a write once both lanes have stored it.
+    always @(posedge ck) begin
+        while (writes.size() != 0 && lanes[0].head > 0 && lanes[1].head > 0) begin
+            void'(writes.pop_front());
+            lanes[0].head--;
+            lanes[1].head--;
+        end
+    end
+endmodule
@@ -0,0 +1,577 @@
+// Behavioral models of the ECP5 primitives instantiated by the LiteX SoC (ecpix5.v) and by
+// the nMigen tester top-level, for co-simulation with Verilator (--timing).
+//
+// Only the data path of each primitive is modeled. Delay lines have no delay, PLLs have no
+// jitter and lock immediately, and DQSBUFM only generates the 90 degree shifted strobes and
+// the burst detection that the LiteX ECP5 DDR3 PHY relies on; its read/write pointers are
+// always zero and the read clock selection has no effect, so read leveling only has to find
+// the right bitslip.
+//
+// The gearboxes take their parallel inputs on the falling edge of SCLK before the rising edge
+// the hardware uses, and change their parallel outputs on the falling edge after it: their
+// SCLK is the clock of the logic on the other side, and a simulator may update that logic on
+// the rising edge either before or after the gearbox samples it.
+
+`timescale 1ps/1ps
+
+// Period of the DDR edge clock (sys2x), in ps.
+`ifndef ECP5_ECLK_PERIOD
+`define ECP5_ECLK_PERIOD 10000
+`endif
+
+// I/O
+
+module TRELLIS_IO #(
+    parameter DIR = "INPUT"
+) (
+    inout  B,
+    input  I,
+    input  T,
+    output O
+);
+    generate
+        if (DIR == "INPUT") begin
+            assign O = B;
+        end else if (DIR == "OUTPUT") begin
+            assign B = T ? 1'bz : I;
+            assign O = 1'b0;
+        end else begin
+            assign B = T ? 1'bz : I;
+            assign O = B;
+        end
+    endgenerate
+endmodule
+
+// I/O buffers of the nMigen ECP5 platform.
+
+module IB (
+    input  I,
+    output O
+);
+    assign O = I;
+endmodule
+
+module OB (
+    input  I,
+    output O
+);
+    assign O = I;
+endmodule
+
+module OBZ (
+    input  I,
+    input  T,
+    output O
+);
+    assign O = T ? 1'bz : I;
+endmodule
+
+module BB (
+    inout  B,
+    input  I,
+    input  T,
+    output O
+);
+    assign B = T ? 1'bz : I;
+    assign O = B;
+endmodule
+
+module DELAYG #(
+    parameter DEL_MODE  = "USER_DEFINED",
+    parameter DEL_VALUE = 0
+) (
+    input  A,
+    output Z
+);
+    assign Z = A;
+endmodule
+
+module DELAYF #(
+    parameter DEL_MODE  = "USER_DEFINED",
+    parameter DEL_VALUE = 0
+) (
+    input  A,
+    input  LOADN,
+    input  MOVE,
+    input  DIRECTION,
+    output Z,
+    output CFLAG
+);
+    assign Z     = A;
+    assign CFLAG = 1'b0;
+endmodule
+
+module USRMCLK (
+    input USRMCLKI,
+    input USRMCLKTS
+);
+endmodule
+
+module FD1S3BX #(
+    parameter GSR = "ENABLED"
+) (
+    input      CK,
+    input      D,
+    input      PD,
+    output reg Q = 1'b1
+);
+    always @(posedge CK or posedge PD)
+        if (PD)
+            Q <= 1'b1;
+        else
+            Q <= D;
+endmodule
+
+// Clocking
+
+module EHXPLLL #(
+    parameter CLKI_DIV         = 1,
+    parameter CLKFB_DIV        = 1,
+    parameter CLKOP_DIV        = 8,
+    parameter CLKOS_DIV        = 8,
+    parameter CLKOS2_DIV       = 8,
+    parameter CLKOS3_DIV       = 8,
+    parameter CLKOP_ENABLE     = "ENABLED",
+    parameter CLKOS_ENABLE     = "DISABLED",
+    parameter CLKOS2_ENABLE    = "DISABLED",
+    parameter CLKOS3_ENABLE    = "DISABLED",
+    parameter CLKOP_CPHASE     = 0,
+    parameter CLKOS_CPHASE     = 0,
+    parameter CLKOS2_CPHASE    = 0,
+    parameter CLKOS3_CPHASE    = 0,
+    parameter CLKOP_FPHASE     = 0,
+    parameter CLKOS_FPHASE     = 0,
+    parameter CLKOS2_FPHASE    = 0,
+    parameter CLKOS3_FPHASE    = 0,
+    parameter FEEDBK_PATH      = "CLKOP",
+    parameter CLKOP_TRIM_POL   = "RISING",
+    parameter CLKOP_TRIM_DELAY = 0,
+    parameter CLKOS_TRIM_POL   = "RISING",
+    parameter CLKOS_TRIM_DELAY = 0,
+    parameter OUTDIVIDER_MUXA  = "DIVA",
+    parameter OUTDIVIDER_MUXB  = "DIVB",
+    parameter OUTDIVIDER_MUXC  = "DIVC",
+    parameter OUTDIVIDER_MUXD  = "DIVD",
+    parameter PLL_LOCK_MODE    = 0,
+    parameter PLL_LOCK_DELAY   = 200,
+    parameter STDBY_ENABLE     = "DISABLED",
+    parameter REFIN_RESET      = "DISABLED",
+    parameter SYNC_ENABLE      = "DISABLED",
+    parameter INT_LOCK_STICKY  = "ENABLED",
+    parameter DPHASE_SOURCE    = "DISABLED",
+    parameter PLLRST_ENA       = "DISABLED",
+    parameter INTFB_WAKE       = "DISABLED"
+) (
+    input      CLKI,
+    input      CLKFB,
+    input      PHASESEL1,
+    input      PHASESEL0,
+    input      PHASEDIR,
+    input      PHASESTEP,
+    input      PHASELOADREG,
+    input      STDBY,
+    input      PLLWAKESYNC,
+    input      RST,
+    input      ENCLKOP,
+    input      ENCLKOS,
+    input      ENCLKOS2,
+    input      ENCLKOS3,
+    output reg CLKOP  = 1'b0,
+    output reg CLKOS  = 1'b0,
+    output reg CLKOS2 = 1'b0,
+    output reg CLKOS3 = 1'b0,
+    output reg LOCK   = 1'b0,
+    output     INTLOCK,
+    output     REFCLK,
+    output     CLKINTFB
+);
+    // The feedback path divides the VCO by the divider of the output it is taken from.
+    localparam FB_OUT_DIV =
+        (FEEDBK_PATH == "CLKOS"  || FEEDBK_PATH == "INT_OS")  ? CLKOS_DIV  :
+        (FEEDBK_PATH == "CLKOS2" || FEEDBK_PATH == "INT_OS2") ? CLKOS2_DIV :
+        (FEEDBK_PATH == "CLKOS3" || FEEDBK_PATH == "INT_OS3") ? CLKOS3_DIV :
+                                                                CLKOP_DIV;
+
+    assign INTLOCK  = LOCK;
+    assign REFCLK   = CLKI;
+    assign CLKINTFB = 1'b0;
+
+    // Measure the input period, then run each output from the VCO period it implies.
+    realtime clki_edge   = 0;
+    realtime vco_period  = 0;
+    always @(posedge CLKI) begin
+        if (clki_edge != 0) begin
+            vco_period = ($realtime - clki_edge) * CLKI_DIV / (CLKFB_DIV * FB_OUT_DIV);
+            LOCK <= !RST;
+        end
+        clki_edge = $realtime;
+    end
+
+    always begin
+        wait (vco_period != 0);
+        #(vco_period * CLKOP_DIV / 2) CLKOP = !CLKOP && (CLKOP_ENABLE == "ENABLED");
+    end
+    always begin
+        wait (vco_period != 0);
+        #(vco_period * CLKOS_DIV / 2) CLKOS = !CLKOS && (CLKOS_ENABLE == "ENABLED");
+    end
+    always begin
+        wait (vco_period != 0);
+        #(vco_period * CLKOS2_DIV / 2) CLKOS2 = !CLKOS2 && (CLKOS2_ENABLE == "ENABLED");
+    end
+    always begin
+        wait (vco_period != 0);
+        #(vco_period * CLKOS3_DIV / 2) CLKOS3 = !CLKOS3 && (CLKOS3_ENABLE == "ENABLED");
+    end
+endmodule
+
+module ECLKSYNCB (
+    input  ECLKI,
+    input  STOP,
+    output ECLKO
+);
+    assign ECLKO = ECLKI & !STOP;
+endmodule
+
+module CLKDIVF #(
+    parameter GSR = "DISABLED",
+    parameter DIV = "2.0"
+) (
+    input      CLKI,
+    input      RST,
+    input      ALIGNWD,
+    output reg CDIVX = 1'b0
+);
+    always @(posedge CLKI or posedge RST)
+        if (RST)
+            CDIVX <= 1'b0;
+        else
+            CDIVX <= !CDIVX;
+endmodule
+
+module DDRDLLA #(
+    parameter FORCE_MAX_DELAY = "NO",
+    parameter GSR             = "ENABLED"
+) (
+    input        CLK,
+    input        RST,
+    input        UDDCNTLN,
+    input        FREEZE,
+    output [7:0] DDRDEL,
+    output reg   LOCK = 1'b0,
+    output       DCNTL0,
+    output       DCNTL1,
+    output       DCNTL2,
+    output       DCNTL3,
+    output       DCNTL4,
+    output       DCNTL5,
+    output       DCNTL6,
+    output       DCNTL7
+);
+    assign DDRDEL = 8'b0;
+    assign {DCNTL7, DCNTL6, DCNTL5, DCNTL4, DCNTL3, DCNTL2, DCNTL1, DCNTL0} = 8'b0;
+
+    reg [3:0] count = 4'b0;
+    always @(posedge CLK or posedge RST)
+        if (RST) begin
+            count <= 4'b0;
+            LOCK  <= 1'b0;
+        end else if (count != 4'hf) begin
+            count <= count + 1'b1;
+        end else begin
+            LOCK  <= 1'b1;
+        end
+endmodule
+
+// DDR strobe control
+
+module DQSBUFM #(
+    parameter DQS_LI_DEL_VAL = 0,
+    parameter DQS_LI_DEL_ADJ = "FACTORYONLY",
+    parameter DQS_LO_DEL_VAL = 0,
+    parameter DQS_LO_DEL_ADJ = "FACTORYONLY",
+    parameter GSR            = "ENABLED"
+) (
+    input      DQSI,
+    input      READ1,
+    input      READ0,
+    input      READCLKSEL2,
+    input      READCLKSEL1,
+    input      READCLKSEL0,
+    input      DDRDEL,
+    input      ECLK,
+    input      SCLK,
+    input      RST,
+    input      DYNDELAY0,
+    input      DYNDELAY1,
+    input      DYNDELAY2,
+    input      DYNDELAY3,
+    input      DYNDELAY4,
+    input      DYNDELAY5,
+    input      DYNDELAY6,
+    input      DYNDELAY7,
+    input      PAUSE,
+    input      RDLOADN,
+    input      RDMOVE,
+    input      RDDIRECTION,
+    input      WRLOADN,
+    input      WRMOVE,
+    input      WRDIRECTION,
+    output reg DQSR90  = 1'b0,
+    output reg DQSW    = 1'b0,
+    output     DQSW270,
+    output     RDPNTR0,
+    output     RDPNTR1,
+    output     RDPNTR2,
+    output     WRPNTR0,
+    output     WRPNTR1,
+    output     WRPNTR2,
+    output     DATAVALID,
+    output reg BURSTDET = 1'b0,
+    output     RDCFLAG,
+    output     WRCFLAG
+);
+    localparam QUARTER = `ECP5_ECLK_PERIOD / 4;
+
+    always @(DQSI) DQSR90 <= #(QUARTER) DQSI;
+    always @(ECLK) DQSW   <= #(QUARTER) ECLK;
+    assign DQSW270 = !DQSW;
+
+    assign {RDPNTR2, RDPNTR1, RDPNTR0} = 3'b0;
+    assign {WRPNTR2, WRPNTR1, WRPNTR0} = 3'b0;
+    assign DATAVALID = 1'b0;
+    assign RDCFLAG   = 1'b0;
+    assign WRCFLAG   = 1'b0;
+
+    // High for every SCLK cycle during which a read burst toggled DQS.
+    reg dqs_seen  = 1'b0;
+    reg burst_det = 1'b0;
+    always @(posedge DQSI or posedge SCLK)
+        if (DQSI)
+            dqs_seen <= 1'b1;
+        else begin
+            burst_det <= dqs_seen;
+            dqs_seen  <= 1'b0;
+        end
+    always @(negedge SCLK) BURSTDET <= burst_det;
+endmodule
+
+// DDR gearboxes
+
+// 4:1 serializer shared by the X2 output primitives. D0..D3 are loaded on the rising edge of
+// SCLK, which coincides with a rising edge of CLK, and are output for one half CLK period each.
+// They are sampled on the falling edge of SCLK before it. With SLIP, each of them is output one
+// half CLK period later, after D3 of the previous SCLK cycle.
+module _ECP5_OSERDESX2 #(
+    parameter DELAY = 0,
+    parameter SLIP  = 0
+) (
+    input  [3:0] D,
+    input        CLK,
+    input        SCLK,
+    output       Q
+);
+    reg       sclk_d = 1'b0;
+    reg       clk_d  = 1'b0;
+    reg [3:0] d      = 4'b0;
+    reg [3:0] data   = 4'b0;
+    reg       d3     = 1'b0;
+    generate
+        if (DELAY == 0) begin
+            always @* sclk_d = SCLK;
+            always @* clk_d  = CLK;
+        end else begin
+            always @(SCLK) sclk_d <= #(DELAY) SCLK;
+            always @(CLK)  clk_d  <= #(DELAY) CLK;
+        end
+    endgenerate
+
+    always @(negedge sclk_d) d    <= D;
+    always @(posedge sclk_d) begin
+        data <= SLIP ? {d[2:0], d3} : d;
+        d3   <= d[3];
+    end
+    assign Q = data[{!sclk_d, !clk_d}];
+endmodule
+
+module ODDRX2F #(
+    parameter GSR = "ENABLED"
+) (
+    input  D0,
+    input  D1,
+    input  D2,
+    input  D3,
+    input  ECLK,
+    input  SCLK,
+    input  RST,
+    output Q
+);
+    _ECP5_OSERDESX2 oserdes (
+        .D({D3, D2, D1, D0}),
+        .CLK(ECLK),
+        .SCLK(SCLK),
+        .Q(Q)
+    );
+endmodule
+
+module ODDRX2DQA #(
+    parameter GSR = "ENABLED"
+) (
+    input  D0,
+    input  D1,
+    input  D2,
+    input  D3,
+    input  DQSW270,
+    input  ECLK,
+    input  SCLK,
+    input  RST,
+    output Q
+);
+    // Aligned to ECLK; DQS is delayed by three quarters of a period instead, so that its first
+    // rising edge after the preamble is centered on D0, see ODDRX2DQSB.
+    _ECP5_OSERDESX2 oserdes (
+        .D({D3, D2, D1, D0}),
+        .CLK(ECLK),
+        .SCLK(SCLK),
+        .Q(Q)
+    );
+endmodule
+
+module ODDRX2DQSB #(
+    parameter GSR = "ENABLED"
+) (
+    input  D0,
+    input  D1,
+    input  D2,
+    input  D3,
+    input  DQSW,
+    input  ECLK,
+    input  SCLK,
+    input  RST,
+    output Q
+);
+    _ECP5_OSERDESX2 #(
+        .DELAY(`ECP5_ECLK_PERIOD / 4),
+        .SLIP(1)
+    ) oserdes (
+        .D({D3, D2, D1, D0}),
+        .CLK(ECLK),
+        .SCLK(SCLK),
+        .Q(Q)
+    );
+endmodule
+
+module TSHX2DQA #(
+    parameter GSR = "ENABLED",
+    parameter REGSET = "SET"
+) (
+    input  T0,
+    input  T1,
+    input  DQSW270,
+    input  ECLK,
+    input  SCLK,
+    input  RST,
+    output Q
+);
+    _ECP5_OSERDESX2 oserdes (
+        .D({T1, T1, T0, T0}),
+        .CLK(ECLK),
+        .SCLK(SCLK),
+        .Q(Q)
+    );
+endmodule
+
+module TSHX2DQSA #(
+    parameter GSR = "ENABLED",
+    parameter REGSET = "SET"
+) (
+    input  T0,
+    input  T1,
+    input  DQSW,
+    input  ECLK,
+    input  SCLK,
+    input  RST,
+    output Q
+);
+    _ECP5_OSERDESX2 #(
+        .DELAY(`ECP5_ECLK_PERIOD / 4),
+        .SLIP(1)
+    ) oserdes (
+        .D({T1, T1, T0, T0}),
+        .CLK(ECLK),
+        .SCLK(SCLK),
+        .Q(Q)
+    );
+endmodule
+
+module IDDRX2DQA #(
+    parameter GSR = "ENABLED"
+) (
+    input      D,
+    input      DQSR90,
+    input      ECLK,
+    input      SCLK,
+    input      RST,
+    input      RDPNTR2,
+    input      RDPNTR1,
+    input      RDPNTR0,
+    input      WRPNTR2,
+    input      WRPNTR1,
+    input      WRPNTR0,
+    output reg Q0 = 1'b0,
+    output reg Q1 = 1'b0,
+    output reg Q2 = 1'b0,
+    output reg Q3 = 1'b0,
+    output     QWL
+);
+    // Samples are taken on both edges of the delayed strobe, and the last four at each rising
+    // edge of SCLK are presented LATENCY SCLK cycles later, from a falling edge, oldest first.
+    // LATENCY stands for the read FIFO of the DQSBUFM, and matches the fixed read latency of
+    // the LiteX PHY: its read leveling then only has to find the bitslip.
+    localparam LATENCY = 5;
+
+    reg [3:0]           samples = 4'b0;
+    reg [4*LATENCY+3:0] fifo    = 0;
+    always @(DQSR90) samples <= {D, samples[3:1]};
+    always @(posedge SCLK) fifo <= {samples, fifo[4*LATENCY+3:4]};
+    always @(negedge SCLK) {Q3, Q2, Q1, Q0} <= fifo[3:0];
+    assign QWL = 1'b0;
+endmodule
+
+module ODDRX1F #(
+    parameter GSR = "ENABLED"
+) (
+    input  D0,
+    input  D1,
+    input  SCLK,
+    input  RST,
+    output Q
+);
+    reg [1:0] d    = 2'b0;
+    reg [1:0] data = 2'b0;
+    always @(negedge SCLK) d    <= {D1, D0};
+    always @(posedge SCLK) data <= d;
+    assign Q = SCLK ? data[0] : data[1];
+endmodule
+
+module IDDRX1F #(
+    parameter GSR = "ENABLED"
+) (
+    input      D,
+    input      SCLK,
+    input      RST,
+    output reg Q0 = 1'b0,
+    output reg Q1 = 1'b0
+);
+    reg       rising  = 1'b0;
+    reg       falling = 1'b0;
+    reg [1:0] q       = 2'b0;
+    always @(posedge SCLK) begin
+        rising <= D;
+        q      <= {falling, rising};
+    end
+    always @(negedge SCLK) begin
+        falling  <= D;
+        {Q1, Q0} <= q;
+    end
+endmodule
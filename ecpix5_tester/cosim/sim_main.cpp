@@ -0,0 +1,69 @@
+// Verilator driver for the LiteX SoC co-simulation (cosim_top.sv).
+//
+// The SoC UART is connected to a pseudo-terminal, whose name is printed on startup; connect
+// to it with e.g. `picocom -b 1000000 /dev/pts/N`. Everything the SoC sends is also copied
+// to stdout.
+
+#include <cstdio>
+#include <cstdlib>
+#include <memory>
+
+#include <fcntl.h>
+#include <termios.h>
+#include <unistd.h>
+
+#include "verilated.h"
+#include "Vcosim_top.h"
+#include "Vcosim_top__Dpi.h"
+
+static int pty_fd = -1;
+
+extern "C" void pty_putc(char c) {
+    if (write(pty_fd, &c, 1) < 0) {
+        // Nobody has the terminal open and its buffer is full; drop the byte.
+    }
+    fputc(c, stdout);
+    fflush(stdout);
+}
+
+extern "C" int pty_getc() {
+    unsigned char c;
+    if (read(pty_fd, &c, 1) == 1)
+        return c;
+    return -1;
+}
+
+static void open_pty() {
+    pty_fd = posix_openpt(O_RDWR | O_NOCTTY);
+    if (pty_fd < 0 || grantpt(pty_fd) < 0 || unlockpt(pty_fd) < 0) {
+        perror("posix_openpt");
+        exit(1);
+    }
+
+    struct termios attrs;
+    tcgetattr(pty_fd, &attrs);
+    cfmakeraw(&attrs);
+    tcsetattr(pty_fd, TCSANOW, &attrs);
+    fcntl(pty_fd, F_SETFL, fcntl(pty_fd, F_GETFL) | O_NONBLOCK);
+
+    fprintf(stderr, "pty: %s\n", ptsname(pty_fd));
+}
+
+int main(int argc, char **argv) {
+    open_pty();
+
+    const std::unique_ptr<VerilatedContext> context{new VerilatedContext};
+    context->commandArgs(argc, argv);
+    const std::unique_ptr<Vcosim_top> top{new Vcosim_top{context.get()}};
+
+    while (!context->gotFinish()) {
+        top->eval();
+        if (!top->eventsPending())
+            break;
+        context->time(top->nextTimeSlot());
+    }
+    top->final();
+
+    close(pty_fd);
+    return 0;
+}
@@ -0,0 +1,65 @@
+// UART bridged to a host pseudo-terminal through DPI, for co-simulation of the LiteX SoC.
+//
+// Bytes sent by the SoC are passed to pty_putc(); pty_getc() is polled for bytes to send to
+// the SoC, and returns -1 when none are available. Polling is throttled to once per bit time,
+// as each call is a system call.
+
+`timescale 1ps/1ps
+
+module uart_pty #(
+    parameter CLKS_PER_BIT = 100
+) (
+    input            clk,
+    input            tx,
+    output reg       rx = 1'b1
+);
+    import "DPI-C" function void pty_putc(input byte c);
+    import "DPI-C" function int  pty_getc();
+
+    // SoC to host.
+    int       tx_count = 0;
+    int       tx_bit   = -1;
+    reg [7:0] tx_data  = 8'b0;
+    always @(posedge clk) begin
+        if (tx_bit < 0) begin
+            if (!tx) begin
+                tx_bit   <= 0;
+                tx_count <= CLKS_PER_BIT + CLKS_PER_BIT / 2 - 1;
+            end
+        end else if (tx_count != 0) begin
+            tx_count <= tx_count - 1;
+        end else if (tx_bit < 8) begin
+            tx_data  <= {tx, tx_data[7:1]};
+            tx_bit   <= tx_bit + 1;
+            tx_count <= CLKS_PER_BIT - 1;
+        end else begin
+            // Stop bit.
+            if (tx)
+                pty_putc(tx_data);
+            tx_bit   <= -1;
+        end
+    end
+
+    // Host to SoC.
+    int       rx_count = 0;
+    int       rx_bit   = -1;
+    reg [9:0] rx_frame = 10'h3ff;
+    always @(posedge clk) begin
+        if (rx_count != 0) begin
+            rx_count <= rx_count - 1;
+        end else if (rx_bit < 0) begin
+            automatic int c = pty_getc();
+            rx_count <= CLKS_PER_BIT - 1;
+            if (c >= 0) begin
+                rx_frame <= {1'b1, c[7:0], 1'b0};
+                rx_bit   <= 0;
+            end
+        end else if (rx_bit < 10) begin
+            rx       <= rx_frame[rx_bit];
+            rx_bit   <= rx_bit + 1;
+            rx_count <= CLKS_PER_BIT - 1;
+        end else begin
+            rx_bit   <= -1;
+        end
+    end
+endmodule
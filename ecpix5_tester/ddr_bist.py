@@ -0,0 +1,160 @@
+import sys
+import time
+
+
+__all__ = ["BIST_PATTERNS", "run_bist", "read_latency_histogram", "format_result"]
+
+
+# Pattern name: (random data, random addresses).
+BIST_PATTERNS = {
+    "sequential": (False, False),
+    "random-data": (True, False),
+    "random-addr": (False, True),
+    "random": (True, True),
+}
+
+
+def _wait_done(reg, timeout):
+    deadline = time.monotonic() + timeout
+    while not reg.read():
+        if time.monotonic() > deadline:
+            raise TimeoutError("DDR BIST did not complete in {}s".format(timeout))
+
+
+def read_latency_histogram(regs, nbins=16):
+    """
+    Read back the read latency histogram of the DDR BIST (see ``litex.bist``).
+    Returns a dict with the minimum and maximum latency, in cycles, and the count of each bin.
+    """
+    counts = []
+    for index in range(nbins):
+        regs.ddr_bist_latency_select.write(index)
+        counts.append(regs.ddr_bist_latency_count.read())
+    return {
+        "min":   regs.ddr_bist_latency_min.read(),
+        "max":   regs.ddr_bist_latency_max.read(),
+        "shift": regs.ddr_bist_latency_shift.read(),
+        "bins":  counts,
+    }
+
+
+def run_bist(regs, base=0, length=0x200000, pattern="sequential", latency_shift=0,
+             nbins=16, timeout=10.0):
+    """
+    Write ``length`` bytes at DRAM offset ``base`` with the BIST generator, then read them
+    back with the checker, using the named ``pattern`` (see ``BIST_PATTERNS``). ``regs`` is
+    the CSR accessor of a LiteX remote client, e.g. ``RemoteClient(...).regs``.
+    Returns a dict with the number of cycles each direction took, the resulting throughput in
+    bytes per cycle, the number of errors, and the read latency histogram.
+    """
+    random_data, random_addr = BIST_PATTERNS[pattern]
+    random = random_data | (random_addr << 1)
+
+    for unit in ("generator", "checker"):
+        getattr(regs, "ddr_bist_{}_reset".format(unit)).write(1)
+        getattr(regs, "ddr_bist_{}_reset".format(unit)).write(0)
+        getattr(regs, "ddr_bist_{}_random".format(unit)).write(random)
+        getattr(regs, "ddr_bist_{}_base".format(unit)).write(base)
+        getattr(regs, "ddr_bist_{}_end".format(unit)).write(base + length)
+        getattr(regs, "ddr_bist_{}_length".format(unit)).write(length)
+
+    regs.ddr_bist_generator_start.write(1)
+    _wait_done(regs.ddr_bist_generator_done, timeout)
+    write_ticks = regs.ddr_bist_generator_ticks.read()
+
+    regs.ddr_bist_latency_shift.write(latency_shift)
+    regs.ddr_bist_latency_clear.write(1)
+    regs.ddr_bist_latency_enable.write(1)
+    regs.ddr_bist_checker_start.write(1)
+    _wait_done(regs.ddr_bist_checker_done, timeout)
+    regs.ddr_bist_latency_enable.write(0)
+    read_ticks = regs.ddr_bist_checker_ticks.read()
+
+    return {
+        "pattern":               pattern,
+        "length":                length,
+        "data_width":            regs.ddr_bist_data_width.read(),
+        "write_ticks":           write_ticks,
+        "read_ticks":            read_ticks,
+        "write_bytes_per_cycle": length / write_ticks if write_ticks else 0.0,
+        "read_bytes_per_cycle":  length / read_ticks if read_ticks else 0.0,
+        "errors":                regs.ddr_bist_checker_errors.read(),
+        "latency":               read_latency_histogram(regs, nbins),
+    }
+
+
+def format_result(result, clk_freq):
+    """
+    Format a ``run_bist`` result as text, with throughputs in MiB/s at ``clk_freq`` Hz.
+    """
+    latency = result["latency"]
+    lines = [
+        "DDR BIST ({}, {} KiB, {}-bit port):".format(
+            result["pattern"], result["length"] // 1024, result["data_width"]),
+        "  Write: {:.2f} B/cycle, {:.1f} MiB/s".format(
+            result["write_bytes_per_cycle"], result["write_bytes_per_cycle"] * clk_freq / 2**20),
+        "   Read: {:.2f} B/cycle, {:.1f} MiB/s".format(
+            result["read_bytes_per_cycle"], result["read_bytes_per_cycle"] * clk_freq / 2**20),
+        " Errors: {}".format(result["errors"]),
+        "Latency: min {} max {} cycles".format(latency["min"], latency["max"]),
+    ]
+    width = 1 << latency["shift"]
+    for index, count in enumerate(latency["bins"]):
+        if not count:
+            continue
+        if index == len(latency["bins"]) - 1:
+            label = "{:>4}+     ".format(index * width)
+        else:
+            label = "{:>4}-{:<4} ".format(index * width, (index + 1) * width - 1)
+        lines.append("  {}{}".format(label, count))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from litex import RemoteClient
+
+    parser = argparse.ArgumentParser(
+        description="Run the DDR bandwidth self-test of the SoC through a LiteX server "
+                    "(litex_server) connected to its UART bridge.")
+    parser.add_argument("--host", default="localhost",
+        help="litex_server host (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=1234,
+        help="litex_server port (default: %(default)s)")
+    parser.add_argument("--csr-csv", default="csr.csv",
+        help="CSR map of the SoC (default: %(default)s)")
+    parser.add_argument("--base", type=lambda s: int(s, 0), default=0,
+        help="DRAM offset to test at (default: %(default)s)")
+    parser.add_argument("--length", type=lambda s: int(s, 0), default=0x200000,
+        help="number of bytes to test (default: %(default)s)")
+    parser.add_argument("--patterns", default="sequential,random",
+        help="comma-separated list of patterns, among {} (default: %(default)s)"
+             .format(", ".join(BIST_PATTERNS)))
+    parser.add_argument("--latency-shift", type=int, default=0,
+        help="log2 of the width of a latency histogram bin, in cycles (default: %(default)s)")
+    parser.add_argument("--output", default=None,
+        help="write the results to this JSON file")
+
+    args = parser.parse_args()
+    bus = RemoteClient(host=args.host, port=args.port, csr_csv=args.csr_csv)
+    if not hasattr(bus.regs, "ddr_bist_generator_start"):
+        sys.exit("{} has no DDR BIST registers; the SoC must be generated with "
+                 "--with-ddr-bist (see the README)".format(args.csr_csv))
+    bus.open()
+    try:
+        clk_freq = bus.constants.config_clock_frequency
+        results = []
+        for pattern in args.patterns.split(","):
+            result = run_bist(bus.regs, args.base, args.length, pattern, args.latency_shift)
+            print(format_result(result, clk_freq))
+            results.append(result)
+    finally:
+        bus.close()
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if any(result["errors"] for result in results):
+        sys.exit(1)
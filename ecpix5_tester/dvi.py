@@ -1,5 +1,6 @@
+from functools import lru_cache
+
 from nmigen import *
-from nmigen.hdl.ast import Rose
 
 from .i2c import I2CInitiator
 
@@ -16,22 +17,133 @@ class _AxisTiming:
         self.whole = visible+front+sync+back
 
 
+# Standard modes, as (width, height, framerate): (horizontal timing, vertical timing, pixel
+# clock in Hz). Timings are (visible, front porch, sync, back porch).
+_STANDARD_MODES = {
+    # VESA DMT
+    ( 640,  480, 60): (( 640,  16,  96,  48), ( 480, 10, 2, 33),  25_175_000),
+    ( 800,  600, 60): (( 800,  40, 128,  88), ( 600,  1, 4, 23),  40_000_000),
+    (1024,  768, 60): ((1024,  24, 136, 160), ( 768,  3, 6, 29),  65_000_000),
+    (1280,  960, 60): ((1280,  96, 112, 312), ( 960,  1, 3, 36), 108_000_000),
+    (1280, 1024, 60): ((1280,  48, 112, 248), (1024,  1, 3, 38), 108_000_000),
+    (1366,  768, 60): ((1366,  70, 143, 213), ( 768,  3, 3, 24),  85_500_000),
+    (1440,  900, 60): ((1440,  80, 152, 232), ( 900,  3, 6, 25), 106_500_000),
+    (1600, 1200, 60): ((1600,  64, 192, 304), (1200,  1, 3, 46), 162_000_000),
+    (1680, 1050, 60): ((1680, 104, 176, 280), (1050,  3, 6, 30), 146_250_000),
+    # CEA-861
+    ( 720,  480, 60): (( 720,  16,  62,  60), ( 480,  9, 6, 30),  27_000_000),
+    ( 720,  576, 50): (( 720,  12,  64,  68), ( 576,  5, 5, 39),  27_000_000),
+    (1280,  720, 50): ((1280, 440,  40, 220), ( 720,  5, 5, 20),  74_250_000),
+    (1280,  720, 60): ((1280, 110,  40, 220), ( 720,  5, 5, 20),  74_250_000),
+    (1920, 1080, 24): ((1920, 638,  44, 148), (1080,  4, 5, 36),  74_250_000),
+    (1920, 1080, 25): ((1920, 528,  44, 148), (1080,  4, 5, 36),  74_250_000),
+    (1920, 1080, 30): ((1920,  88,  44, 148), (1080,  4, 5, 36),  74_250_000),
+    (1920, 1080, 50): ((1920, 528,  44, 148), (1080,  4, 5, 36), 148_500_000),
+    (1920, 1080, 60): ((1920,  88,  44, 148), (1080,  4, 5, 36), 148_500_000),
+    (3840, 2160, 30): ((3840, 176,  88, 296), (2160,  8, 10, 72), 297_000_000),
+}
+
+
+@lru_cache(maxsize=None)
+def _cvt_rb_mode(width, height, framerate):
+    # VESA Coordinated Video Timings 1.1, reduced blanking (v1).
+    min_v_blank = 460     # us
+    v_front     = 3
+    min_v_back  = 6
+    h_front     = 48
+    h_sync      = 32
+    h_back      = 80
+    clock_step  = 250_000 # Hz
+
+    if height * 4 == width * 3:
+        v_sync = 4  # 4:3
+    elif height * 16 == width * 9:
+        v_sync = 5  # 16:9
+    elif height * 16 == width * 10:
+        v_sync = 6  # 16:10
+    elif height * 5 == width * 4 or height * 15 == width * 9:
+        v_sync = 7  # 5:4, 15:9
+    else:
+        v_sync = 10 # custom
+
+    h_period_est = (1e6 / framerate - min_v_blank) / height # us
+    v_blank = max(int(min_v_blank / h_period_est) + 1, v_front + v_sync + min_v_back)
+
+    h_whole = width + h_front + h_sync + h_back
+    v_whole = height + v_blank
+    pixel_clock = int(framerate * h_whole * v_whole / clock_step) * clock_step
+    return ((width, h_front, h_sync, h_back),
+            (height, v_front, v_sync, v_blank - v_front - v_sync),
+            pixel_clock)
+
+
 class VideoTiming:
-    def __init__(self, width, height, framerate):
-        # TODO: calculate video timing according to the given resolution
-        # this is XGA@60fps
-        self.h = _AxisTiming(1024, 24, 136, 160)
-        self.v = _AxisTiming(768, 3, 6, 29)
+    """
+    Video timing for the given resolution and framerate.
+    Standard VESA DMT and CEA-861 modes are looked up in a table; other modes, or any mode
+    if ``reduced_blanking`` is set, are computed with CVT reduced blanking, which requires
+    a lower pixel clock.
+    :attr pixel_clock:
+        Required pixel clock, in Hz.
+    """
+    def __init__(self, width, height, framerate, reduced_blanking=False):
+        mode = (width, height, framerate)
+        if not reduced_blanking and mode in _STANDARD_MODES:
+            h, v, pixel_clock = _STANDARD_MODES[mode]
+        else:
+            h, v, pixel_clock = _cvt_rb_mode(*mode)
+        self.h = _AxisTiming(*h)
+        self.v = _AxisTiming(*v)
+        self.pixel_clock = pixel_clock
+
+    @classmethod
+    def custom(cls, h, v, pixel_clock):
+        """
+        Video timing with explicit horizontal and vertical ``(visible, front porch, sync,
+        back porch)`` timings.
+        """
+        timing = cls.__new__(cls)
+        timing.h = _AxisTiming(*h)
+        timing.v = _AxisTiming(*v)
+        timing.pixel_clock = pixel_clock
+        return timing
+
+    def scaled(self, width=32, height=24, ppc=1):
+        """
+        Same timing, shrunk to ``width`` by ``height`` visible pixels for fast simulation.
+        Porches and sync pulses are scaled proportionally, but last at least one pixel or line
+        (horizontal ones, at least ``ppc`` pixels). The pixel clock is unchanged, so each
+        frame only takes a few thousand cycles.
+        """
+        if width % ppc != 0:
+            raise ValueError("Width {} is not a multiple of {} pixels per clock"
+                             .format(width, ppc))
+        def scale(axis, visible, step):
+            return (visible, *(max(step, round(length * visible / axis.visible / step) * step)
+                               for length in (axis.front, axis.sync, axis.back)))
+        return VideoTiming.custom(scale(self.h, width, ppc), scale(self.v, height, 1),
+                                  self.pixel_clock)
+
+    @property
+    def framerate(self):
+        return self.pixel_clock / (self.h.whole * self.v.whole)
 
 
 class SyncGenerator(Elaboratable):
     """
-    Note: this module assumes running at PCLK
+    Note: this module assumes running at PCLK/ppc, and generates ``ppc`` pixels per cycle.
+    ``x`` is the horizontal position of the first of them; ``de`` and sync signals apply to
+    all of them.
     """
-    def __init__(self, timing):
+    def __init__(self, timing, ppc=1):
         if not isinstance(timing, VideoTiming):
             raise TypeError("Object {!r} is not a VideoTiming object".format(timing))
+        for name in ("visible", "front", "sync", "back"):
+            if getattr(timing.h, name) % ppc != 0:
+                raise ValueError("Horizontal {} timing {} is not a multiple of {} pixels per clock"
+                                 .format(name, getattr(timing.h, name), ppc))
         self.timing = timing
+        self.ppc = ppc
 
         self.hsync = Signal()
         self.vsync = Signal()
@@ -42,132 +154,399 @@ class SyncGenerator(Elaboratable):
     def elaborate(self, platform):
         m = Module()
 
-        hcounter = Signal(range(self.timing.h.whole))
+        # The horizontal counter counts groups of `ppc` pixels.
+        hwhole = self.timing.h.whole // self.ppc
+        hcounter = Signal(range(hwhole))
         vcounter = Signal(range(self.timing.v.whole))
 
-        with m.If(hcounter != self.timing.h.whole-1):
+        with m.If(hcounter != hwhole-1):
             m.d.sync += hcounter.eq(hcounter+1)
         with m.Else():
             m.d.sync += hcounter.eq(0)
 
-        with m.If(hcounter == self.timing.h.whole-1):
+        with m.If(hcounter == hwhole-1):
             with m.If(vcounter != self.timing.v.whole-1):
                 m.d.sync += vcounter.eq(vcounter+1)
             with m.Else():
                 m.d.sync += vcounter.eq(0)
 
-        startsynch = self.timing.h.visible+self.timing.h.front
-        stopsynch = self.timing.h.visible+self.timing.h.front+self.timing.h.sync
+        hvisible = self.timing.h.visible//self.ppc
+        startsynch = (self.timing.h.visible+self.timing.h.front)//self.ppc
+        stopsynch = (self.timing.h.visible+self.timing.h.front+self.timing.h.sync)//self.ppc
 
         startsyncv = self.timing.v.visible+self.timing.v.front
         stopsyncv = self.timing.v.visible+self.timing.v.front+self.timing.v.sync
 
         m.d.comb += [
-            self.de.eq((hcounter < self.timing.h.visible) & (vcounter < self.timing.v.visible)),
+            self.de.eq((hcounter < hvisible) & (vcounter < self.timing.v.visible)),
             self.hsync.eq((hcounter >= startsynch) & (hcounter < stopsynch)),
             self.vsync.eq((vcounter >= startsyncv) & (vcounter < stopsyncv)),
-            self.x.eq(hcounter[0:self.x.width]),
+            self.x.eq((hcounter * self.ppc)[0:self.x.width]),
             self.y.eq(vcounter[0:self.y.width]),
         ]
 
         return m
 
 
+class PixelGearbox(Elaboratable):
+    """
+    Serializes ``ppc`` pixels per cycle of ``i_domain`` into one pixel per cycle of the
+    ``sync`` domain. Both clocks must come from the same PLL, with ``sync`` exactly ``ppc``
+    times faster than ``i_domain``.
+    :attr i:
+        Input pixels, first pixel in the least significant bits. Sampled in ``i_domain``.
+    :attr o:
+        Output pixel.
+    """
+    def __init__(self, width, ppc, *, i_domain):
+        self.width = width
+        self.ppc = ppc
+        self.i_domain = i_domain
+
+        self.i = Signal(width * ppc)
+        self.o = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Data is registered in the slow domain along with a toggle flag; a change of the
+        # flag as seen from the fast domain marks the first fast cycle of each slow cycle.
+        i_data   = Signal.like(self.i)
+        i_toggle = Signal()
+        m.d[self.i_domain] += [
+            i_data.eq(self.i),
+            i_toggle.eq(~i_toggle),
+        ]
+
+        data     = Signal.like(self.i)
+        toggle   = Signal()
+        toggle_r = Signal()
+        m.d.sync += [
+            data.eq(i_data),
+            toggle.eq(i_toggle),
+            toggle_r.eq(toggle),
+        ]
+
+        shreg = Signal.like(self.i)
+        with m.If(toggle != toggle_r):
+            m.d.sync += shreg.eq(data)
+        with m.Else():
+            m.d.sync += shreg.eq(shreg[self.width:])
+        m.d.comb += self.o.eq(shreg[:self.width])
+
+        return m
+
+
+# I2C bus speeds, in Hz
+I2C_STANDARD_MODE  = 100_000
+I2C_FAST_MODE      = 400_000
+I2C_FAST_MODE_PLUS = 1_000_000
+
+
+def i2c_period_cyc(clk_freq, bus_freq):
+    """
+    ``I2CInitiator`` period that runs the bus as close to ``bus_freq`` as possible without
+    exceeding it, given a ``clk_freq`` system clock.
+    """
+    # I2CInitiator divides each SCL period into 4 phases of `period_cyc // 4 + 1` cycles.
+    phase_cyc = -(-int(clk_freq) // (4 * int(bus_freq)))
+    if phase_cyc < 2:
+        raise ValueError("Cannot run an I2C bus at {:g} kHz from a {:g} MHz clock"
+                         .format(bus_freq / 1e3, clk_freq / 1e6))
+    return 4 * (phase_cyc - 1)
+
+
+class I2CWrite:
+    """
+    Write ``value`` to register ``reg`` of the device at 7-bit address ``addr``.
+    """
+    def __init__(self, addr, reg, value):
+        self.addr = addr
+        self.reg = reg
+        self.value = value
+
+
+class I2CWriteBurst:
+    """
+    Write ``values`` to consecutive registers starting at ``reg`` of the device at 7-bit
+    address ``addr``, in a single transaction. The device must auto-increment its register
+    address, and the burst must not run past register 0xff.
+    """
+    def __init__(self, addr, reg, values):
+        self.addr = addr
+        self.reg = reg
+        self.values = list(values)
+        if not self.values:
+            raise ValueError("Burst write to register {:#04x} has no data".format(reg))
+        if reg + len(self.values) > 0x100:
+            raise ValueError("Burst write of {} bytes to register {:#04x} runs past register 0xff"
+                             .format(len(self.values), reg))
+
+
+class I2CReadModifyWrite:
+    """
+    Read register ``reg`` of the device at 7-bit address ``addr``, replace the bits set
+    in ``mask`` with those of ``value``, and write it back.
+    """
+    def __init__(self, addr, reg, mask, value):
+        self.addr = addr
+        self.reg = reg
+        self.mask = mask
+        self.value = value
+
+
+class I2CDelay:
+    """
+    Wait for ``cycles`` clock cycles.
+    """
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+
 class I2CInitializer(Elaboratable):
-    def __init__(self, cmdpairs, pads):
-        self.cmdpairs = cmdpairs
+    """
+    Runs a sequence of I2C commands once after reset, then asserts ``done``.
+    The sequence is stored in a memory and walked by a fixed sequencer, so logic size does
+    not depend on its length.
+    :param cmds:
+        List of ``I2CWrite``, ``I2CWriteBurst``, ``I2CReadModifyWrite`` or ``I2CDelay``
+        commands. An ``(addr, reg, value)`` tuple is a shorthand for ``I2CWrite``.
+    :param clk_freq:
+        Frequency of the clock domain this module runs in, in Hz.
+    :param bus_freq:
+        Maximum SCL frequency, in Hz, e.g. ``I2C_STANDARD_MODE`` or ``I2C_FAST_MODE``.
+    :param initiator:
+        Replaces the ``I2CInitiator`` driving ``pads``, e.g. with a transaction-level
+        ``sim.I2CInitiatorModel`` to simulate the sequence quickly.
+    """
+    OP_END   = 0
+    OP_WRITE = 1
+    OP_RMW   = 2
+    OP_DELAY = 3
+    OP_BURST = 4
+    OP_DATA  = 5
+
+    entry_layout = [
+        ("op",   3),
+        ("addr", 7),
+        ("reg",  8),
+        ("arg0", 8),
+        ("arg1", 8),
+    ]
+
+    def __init__(self, cmds, pads, clk_freq, bus_freq=I2C_STANDARD_MODE, initiator=None):
+        self.cmds = [I2CWrite(*cmd) if isinstance(cmd, tuple) else cmd for cmd in cmds]
         self.pads = pads
+        self.period_cyc = i2c_period_cyc(clk_freq, bus_freq)
+        self.initiator = initiator
         self.done = Signal()
 
+    @classmethod
+    def _encode(cls, op, addr=0, reg=0, arg0=0, arg1=0):
+        return op | addr << 3 | reg << 10 | arg0 << 18 | arg1 << 26
+
+    def encode(self):
+        """
+        Command table, as memory words.
+        """
+        words = []
+        for cmd in self.cmds:
+            if isinstance(cmd, I2CWrite):
+                words.append(self._encode(self.OP_WRITE, cmd.addr, cmd.reg, cmd.value))
+            elif isinstance(cmd, I2CWriteBurst):
+                # A header with the byte count, followed by one entry per byte.
+                words.append(self._encode(self.OP_BURST, cmd.addr, cmd.reg,
+                                          len(cmd.values) - 1))
+                words += [self._encode(self.OP_DATA, arg0=value) for value in cmd.values]
+            elif isinstance(cmd, I2CReadModifyWrite):
+                words.append(self._encode(self.OP_RMW, cmd.addr, cmd.reg, cmd.mask, cmd.value))
+            elif isinstance(cmd, I2CDelay):
+                # The 24-bit cycle count spans the reg, arg0 and arg1 fields.
+                cycles = cmd.cycles
+                while cycles > 0:
+                    chunk = min(cycles, 2**24)
+                    words.append(self._encode(self.OP_DELAY, 0, (chunk-1) & 0xff,
+                                              (chunk-1) >> 8 & 0xff, (chunk-1) >> 16))
+                    cycles -= chunk
+            else:
+                raise TypeError("Object {!r} is not an I2C command".format(cmd))
+        words.append(self._encode(self.OP_END))
+        return words
+
     def elaborate(self, platform):
         m = Module()
 
-        i2c = I2CInitiator(self.pads, 1000)
+        i2c = self.initiator
+        if i2c is None:
+            i2c = I2CInitiator(self.pads, self.period_cyc)
         m.submodules += i2c
 
-        with m.FSM():
-            for i in range(len(self.cmdpairs)):
-                # Wait until busy=0
-                with m.State("{}-Wait-Busy-Init".format(i)):
-                    with m.If(~i2c.busy):
-                        m.next = "{}-Start".format(i)
-
-                # Send start for 1 cycle
-                with m.State("{}-Start".format(i)):
-                    m.d.comb += i2c.start.eq(1)
-                    m.next = "{}-Wait-Start".format(i)
-
-                # Wait until busy = 0
-                with m.State("{}-Wait-Start".format(i)):
-                    m.d.comb += i2c.start.eq(0)
-                    with m.If(~i2c.busy):
-                        m.next = "{}-Write-Slave-Addr".format(i)
-
-                # Write slave address
-                with m.State("{}-Write-Slave-Addr".format(i)):
-                    m.d.comb += [
-                        i2c.write.eq(1),
-                        i2c.data_i.eq(self.cmdpairs[i][0] << 1),
-                    ]
-                    m.next = "{}-Wait-Write-Slave-Addr".format(i)
+        words = self.encode()
+        table = Memory(width=len(Record(self.entry_layout)), depth=len(words), init=words)
+        m.submodules.rdport = rdport = table.read_port()
+
+        pc = Signal(range(len(words)))
+        entry = Record(self.entry_layout)
+        m.d.comb += [
+            rdport.addr.eq(pc),
+            entry.eq(rdport.data),
+        ]
 
-                # Wait until busy = 0
-                with m.State("{}-Wait-Write-Slave-Addr".format(i)):
-                    m.d.comb += i2c.write.eq(0)
-                    with m.If(~i2c.busy):
-                        m.next = "{}-Write-Reg-Addr".format(i)
+        data  = Signal(8)
+        timer = Signal(24)
+        read_done  = Signal()
+        write_done = Signal()
+        burst      = Signal()
+        burst_left = Signal(8)
 
-                # Write register address
-                with m.State("{}-Write-Reg-Addr".format(i)):
+        def i2c_cmd(state, next_state, *stmts):
+            # Issue a command as soon as the initiator is idle.
+            with m.State(state):
+                with m.If(~i2c.busy):
+                    m.d.comb += stmts
+                    m.next = next_state
+
+        with m.FSM():
+            # Wait for the entry at `pc` to be read from the table.
+            with m.State("FETCH"):
+                m.next = "DECODE"
+
+            with m.State("DECODE"):
+                with m.Switch(entry.op):
+                    with m.Case(self.OP_WRITE, self.OP_RMW):
+                        m.d.sync += data.eq(entry.arg0)
+                        m.next = "START"
+                    with m.Case(self.OP_BURST):
+                        m.d.sync += [
+                            burst.eq(1),
+                            burst_left.eq(entry.arg0),
+                        ]
+                        m.next = "START"
+                    with m.Case(self.OP_DELAY):
+                        m.d.sync += timer.eq(Cat(entry.reg, entry.arg0, entry.arg1))
+                        m.next = "DELAY"
+                    with m.Default():
+                        m.next = "DONE"
+
+            with m.State("DELAY"):
+                with m.If(timer == 0):
+                    m.next = "NEXT"
+                with m.Else():
+                    m.d.sync += timer.eq(timer - 1)
+
+            i2c_cmd("START", "WRITE-SLAVE-ADDR",
+                i2c.start.eq(1),
+            )
+            i2c_cmd("WRITE-SLAVE-ADDR", "WRITE-REG-ADDR",
+                i2c.write.eq(1),
+                i2c.data_i.eq(entry.addr << 1),
+            )
+            with m.State("WRITE-REG-ADDR"):
+                with m.If(~i2c.busy):
                     m.d.comb += [
                         i2c.write.eq(1),
-                        i2c.data_i.eq(self.cmdpairs[i][1]),
+                        i2c.data_i.eq(entry.reg),
                     ]
-                    m.next = "{}-Wait-Write-Reg-Addr".format(i)
-
-                # Wait until busy = 0
-                with m.State("{}-Wait-Write-Reg-Addr".format(i)):
-                    m.d.comb += i2c.write.eq(0)
-                    with m.If(~i2c.busy):
-                        m.next = "{}-Write-Reg-Val".format(i)
+                    with m.If((entry.op == self.OP_RMW) & ~read_done):
+                        m.next = "RESTART"
+                    with m.Elif(burst):
+                        m.next = "BURST-FETCH"
+                    with m.Else():
+                        m.next = "WRITE-REG-VAL"
+
+            # Read-modify-write: read the register in a separate transaction...
+            i2c_cmd("RESTART", "READ-SLAVE-ADDR",
+                i2c.start.eq(1),
+            )
+            i2c_cmd("READ-SLAVE-ADDR", "READ-REG-VAL",
+                i2c.write.eq(1),
+                i2c.data_i.eq(entry.addr << 1 | 1),
+            )
+            i2c_cmd("READ-REG-VAL", "MODIFY-REG-VAL",
+                i2c.read.eq(1),
+                i2c.ack_i.eq(0), # last byte read
+            )
+            with m.State("MODIFY-REG-VAL"):
+                with m.If(~i2c.busy):
+                    m.d.sync += [
+                        data.eq((i2c.data_o & ~entry.arg0) | (entry.arg1 & entry.arg0)),
+                        read_done.eq(1),
+                    ]
+                    m.next = "STOP"
 
-                # Write register value
-                with m.State("{}-Write-Reg-Val".format(i)):
+            # ... then write it back as a regular write.
+            with m.State("WRITE-REG-VAL"):
+                with m.If(~i2c.busy):
                     m.d.comb += [
                         i2c.write.eq(1),
-                        i2c.data_i.eq(self.cmdpairs[i][2]),
+                        i2c.data_i.eq(data),
                     ]
-                    m.next = "{}-Wait-Write-Reg-Val".format(i)
-
-                # Wait until busy = 0
-                with m.State("{}-Wait-Write-Reg-Val".format(i)):
-                    m.d.comb += i2c.write.eq(0)
-                    with m.If(~i2c.busy):
-                        m.next = "{}-Send-Stop".format(i)
-
-                # Send stop for 1 cycle
-                with m.State("{}-Send-Stop".format(i)):
-                    m.d.comb += i2c.stop.eq(1)
-                    m.next = "{}-Wait-Stop".format(i)
-
-                # Wait until busy = 0
-                with m.State("{}-Wait-Stop".format(i)):
-                    m.d.comb += i2c.stop.eq(0)
-                    if i == len(self.cmdpairs)-1:
-                        with m.If(~i2c.busy):
-                            m.next = "Init-Done"
-                    else:
-                        m.next = "{}-Wait-Busy-Init".format(i+1)
-
-            with m.State("Init-Done"):
+                    with m.If(burst & (burst_left != 0)):
+                        m.d.sync += burst_left.eq(burst_left - 1)
+                        m.next = "BURST-FETCH"
+                    with m.Else():
+                        m.d.sync += write_done.eq(1)
+                        m.next = "STOP"
+
+            # Burst writes: fetch each data byte from the following entries, while the
+            # initiator is busy shifting out the previous one.
+            with m.State("BURST-FETCH"):
+                m.d.sync += pc.eq(pc + 1)
+                m.next = "BURST-WAIT"
+            with m.State("BURST-WAIT"):
+                m.next = "BURST-LOAD"
+            with m.State("BURST-LOAD"):
+                m.d.sync += data.eq(entry.arg0)
+                m.next = "WRITE-REG-VAL"
+
+            i2c_cmd("STOP", "WAIT-STOP",
+                i2c.stop.eq(1),
+            )
+            with m.State("WAIT-STOP"):
+                with m.If(~i2c.busy):
+                    with m.If(write_done):
+                        m.next = "NEXT"
+                    with m.Else():
+                        m.next = "START"
+
+            with m.State("NEXT"):
+                m.d.sync += [
+                    pc.eq(pc + 1),
+                    read_done.eq(0),
+                    write_done.eq(0),
+                    burst.eq(0),
+                ]
+                m.next = "FETCH"
+
+            with m.State("DONE"):
                 m.d.comb += self.done.eq(1)
 
         return m
 
 class TestCardGen(Elaboratable):
-    def __init__(self, width, height, depth=12):
+    """
+    Note: this module expects ``x``/``y`` as produced by SyncGenerator, i.e. ``x`` counts up
+    from 0 in steps of ``ppc`` while ``i_de`` is high. The squared distance to the center of
+    the screen is then updated incrementally along each scanline, and no multipliers are
+    needed. Outputs lag the inputs by ``latency`` cycles.
+    With ``ppc`` pixels per clock, pixel ``i`` of each cycle is at ``x+i`` and its color
+    is in bits ``[i*depth:(i+1)*depth]`` of ``r``, ``g`` and ``b``.
+    """
+    latency = 2
+
+    # Colors, as 12-bit (r, g, b)
+    circle_color = (0xF01, 0X394, 0XF39)
+    bkg_grid = (0x600, 0x600, 0x600)
+    frg_grid = (0xFFF, 0xFFF, 0xFFF)
+
+    def __init__(self, width, height, depth=12, ppc=1):
         self.width = width
         self.height = height
+        self.depth = depth
+        self.ppc = ppc
+
+        # Radius is 80% of the smallest dimension of the screen
+        self.radius = int(min(self.width, self.height) * 0.8 / 2)
 
         self.i_de = Signal()
         self.i_hsync = Signal()
@@ -179,69 +558,153 @@ class TestCardGen(Elaboratable):
         self.o_hsync = Signal()
         self.o_vsync = Signal()
 
-        self.r = Signal(depth)
-        self.g = Signal(depth)
-        self.b = Signal(depth)
+        self.r = Signal(depth * ppc)
+        self.g = Signal(depth * ppc)
+        self.b = Signal(depth * ppc)
 
-    def sendColor(self, m, color):
+    def sendColor(self, m, color, lane=0):
+        lane_bits = slice(lane * self.depth, (lane+1) * self.depth)
         m.d.sync += [
-            self.r.eq(color[0]),
-            self.g.eq(color[1]),
-            self.b.eq(color[2]),
+            self.r[lane_bits].eq(color[0]),
+            self.g[lane_bits].eq(color[1]),
+            self.b[lane_bits].eq(color[2]),
         ]
 
     def elaborate(self, platform):
         m = Module()
 
-        # Sync buffering
+        # Edges are detected with explicit registers rather than Rose()/Fell(), whose
+        # sampling domain is not changed by DomainRenamer.
+        i_de_r = Signal()
+        i_vsync_r = Signal()
         m.d.sync += [
-            self.o_de.eq(self.i_de),
-            self.o_hsync.eq(self.i_hsync),
-            self.o_vsync.eq(self.i_vsync),
+            i_de_r.eq(self.i_de),
+            i_vsync_r.eq(self.i_vsync),
         ]
 
         counter = Signal(6)
-        with m.If(Rose(self.i_vsync)):
+        with m.If(self.i_vsync & ~i_vsync_r):
             m.d.sync += counter.eq(counter+1)
 
-        # Colors
-        bkg_grid = (0x600, 0x600, 0x600)
-        frg_grid = (0xFFF, 0xFFF, 0xFFF)
-
         # Geometry
         grid = 50
         linewidth = 5
-
-        # Calculate positions relative to the center
-        x_rel = Signal(Shape(width=self.x.width+1, signed=True))
-        y_rel = Signal(Shape(width=self.y.width+1, signed=True))
-        m.d.comb += [
-            x_rel.eq(self.x - self.width//2),
-            y_rel.eq(self.y - self.height//2),
+        radius = self.radius
+
+        # Squared distances to the center, along each axis. Since (x+n)^2 = x^2 + 2nx+n^2,
+        # each one is advanced by adding a step that itself increases by 2n^2.
+        # (Both run one step past the last visible pixel/line before being rewound.)
+        n = self.ppc
+        x_first = -(self.width//2)
+        x_last  = self.width-1 - self.width//2 + n
+        y_first = -(self.height//2)
+        y_last  = self.height-1 - self.height//2 + 1
+
+        x_sqs = []
+        for lane in range(self.ppc):
+            x_start = x_first + lane
+            x_sq   = Signal(range(max(x_first**2, x_last**2)+1), reset=x_start**2,
+                            name="x_sq_{}".format(lane))
+            x_step = Signal(range(2*n*x_first + n*n, 2*n*x_last + n*n + 1),
+                            reset=2*n*x_start + n*n, name="x_step_{}".format(lane))
+            x_sqs.append(x_sq)
+
+            # Advance along the scanline; rewind during horizontal blanking.
+            with m.If(self.i_de):
+                m.d.sync += [
+                    x_sq.eq(x_sq + x_step),
+                    x_step.eq(x_step + 2*n*n),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    x_sq.eq(x_sq.reset),
+                    x_step.eq(x_step.reset),
+                ]
+
+        y_sq   = Signal(range(max(y_first**2, y_last**2)+1), reset=y_first**2)
+        y_step = Signal(range(2*y_first+1, 2*y_last+2), reset=2*y_first+1)
+
+        # Advance at the end of each visible line; rewind during vertical sync.
+        with m.If(self.i_vsync):
+            m.d.sync += [
+                y_sq.eq(y_sq.reset),
+                y_step.eq(y_step.reset),
+            ]
+        with m.Elif(~self.i_de & i_de_r):
+            m.d.sync += [
+                y_sq.eq(y_sq + y_step),
+                y_step.eq(y_step + 2),
+            ]
+
+        # y_sq only changes outside of visible pixels, so the per-line bound on x_sq is
+        # computed ahead of time, leaving a single comparison per pixel.
+        x_sq_max = Signal(range(-max(y_first**2, y_last**2), radius**2+1))
+        m.d.sync += x_sq_max.eq(radius*radius - y_sq)
+
+        # Stage 1: classify the pixels
+        de     = Signal()
+        hsync  = Signal()
+        vsync  = Signal()
+        circle = Signal(self.ppc)
+        line   = Signal(self.ppc)
+        m.d.sync += [
+            de.eq(self.i_de),
+            hsync.eq(self.i_hsync),
+            vsync.eq(self.i_vsync),
         ]
+        for lane, x_sq in enumerate(x_sqs):
+            m.d.sync += [
+                circle[lane].eq(x_sq <= x_sq_max),
+                line[lane].eq(((self.x + lane)[0:6] == counter) | (self.y[0:6] == counter)),
+            ]
 
-        # Radius is 80% of the smallest dimension of the screen
-        radius = int(min(self.width, self.height) * 0.8 / 2)
+        # Stage 2: pick their colors
+        m.d.sync += [
+            self.o_de.eq(de),
+            self.o_hsync.eq(hsync),
+            self.o_vsync.eq(vsync),
+        ]
 
-        with m.If(self.i_de):
-            with m.If(x_rel*x_rel+y_rel*y_rel <= radius*radius):
-                self.sendColor(m, (0xF01, 0X394, 0XF39))
-            with m.Else():
-                with m.If((self.x[0:6] == counter) | (self.y[0:6] == counter)):
-                    self.sendColor(m, frg_grid)
+        for lane in range(self.ppc):
+            with m.If(de):
+                with m.If(circle[lane]):
+                    self.sendColor(m, self.circle_color, lane)
                 with m.Else():
-                    self.sendColor(m, bkg_grid)
-        with m.Else():
-            self.sendColor(m, (0,0,0))
+                    with m.If(line[lane]):
+                        self.sendColor(m, self.frg_grid, lane)
+                    with m.Else():
+                        self.sendColor(m, self.bkg_grid, lane)
+            with m.Else():
+                self.sendColor(m, (0,0,0), lane)
 
         return m
 
 
 class DVITester(Elaboratable):
+    """
+    Note: this module runs at PCLK. With ``ppc`` pixels per clock, video is generated in
+    ``core_domain`` at PCLK/ppc instead, and serialized by a gearbox.
+    For simulation, ``pads`` replaces the ``it6613e`` platform resource (see
+    ``sim.it6613e_pads``), and ``i2c_initiator`` the bit-level I2C initiator (see
+    ``sim.I2CInitiatorModel``).
+    """
+    def __init__(self, timing=None, ppc=1, core_domain="pixel_div", i2c_freq=I2C_STANDARD_MODE,
+                 pads=None, i2c_initiator=None):
+        if timing is None:
+            timing = VideoTiming(1024, 768, 60)
+        self.timing = timing
+        self.ppc = ppc
+        self.core_domain = core_domain
+        self.i2c_freq = i2c_freq
+        self.pads = pads
+        self.i2c_initiator = i2c_initiator
+
     def elaborate(self, platform):
         m = Module()
 
-        hdmi = platform.request("it6613e", 0)
+        hdmi = self.pads
+        if hdmi is None:
+            hdmi = platform.request("it6613e", 0)
 
         # I2C control
         # This is pretty much the vanilla init sequence from
@@ -252,52 +715,86 @@ class DVITester(Elaboratable):
             (cat6613addr, 0x04, 0x00), # Clear reset
             (cat6613addr, 0x61, 0x10), # Enable "clock ring"
             (cat6613addr, 0xF8, 0xFF), # Dunno
-            (cat6613addr, 0x09, 0xFF), # Disable IRQs (0x09-0x0B)
-            (cat6613addr, 0x0A, 0xFF),
-            (cat6613addr, 0x0B, 0xFF),
-            (cat6613addr, 0x0C, 0xFF), # Clear interrupts (0x0C-0x0D)
-            (cat6613addr, 0x0D, 0xFF),
+            I2CWriteBurst(cat6613addr, 0x09, [
+                0xFF, 0xFF, 0xFF,      # Disable IRQs (0x09-0x0B)
+                0xFF, 0xFF,            # Clear interrupts (0x0C-0x0D)
+            ]),
             (cat6613addr, 0xC0, 0x00), # DVI mode
             (cat6613addr, 0xC1, 0x03), # Mute screen
             (cat6613addr, 0xC6, 0x03),
             # TODO: match register choice with PCLK value
-            (cat6613addr, 0x61, 0x03), # REG_DRV_PDRXDET | REG_DRV_TERMON
-            (cat6613addr, 0x62, 0x18), # REG_XP_ER0 | REG_XP_RESETB
-            (cat6613addr, 0x63, 0x10), # todo: document
-            (cat6613addr, 0x64, 0x04), # todo: document
+            I2CWriteBurst(cat6613addr, 0x61, [
+                0x03,                  # REG_DRV_PDRXDET | REG_DRV_TERMON
+                0x18,                  # REG_XP_ER0 | REG_XP_RESETB
+                0x10,                  # todo: document
+                0x04,                  # todo: document
+            ]),
             (cat6613addr, 0xC1, 0x00), # Unmute screen
         ]
-        i2cinit = I2CInitializer(cmds, hdmi)
+        i2cinit = I2CInitializer(cmds, hdmi, self.timing.pixel_clock, self.i2c_freq,
+                                 initiator=self.i2c_initiator)
         m.submodules += i2cinit
 
         # Video signal
-        timing = VideoTiming(1024, 768, 60)
-        syncgen = SyncGenerator(timing)
-        m.submodules += syncgen
+        timing = self.timing
+        syncgen = SyncGenerator(timing, self.ppc)
         m.d.comb += [
             hdmi.rst.eq(1),
             hdmi.pclk.eq(ClockSignal("sync")),
         ]
 
         # Test card generation
-        tcgen = TestCardGen(1024, 768)
-        m.submodules += tcgen
+        tcgen = TestCardGen(timing.h.visible, timing.v.visible, ppc=self.ppc)
         m.d.comb += [
             tcgen.i_de.eq(syncgen.de),
             tcgen.i_hsync.eq(syncgen.hsync),
             tcgen.i_vsync.eq(syncgen.vsync),
             tcgen.x.eq(syncgen.x),
             tcgen.y.eq(syncgen.y),
+        ]
 
-            hdmi.hsync.eq(tcgen.o_hsync),
-            hdmi.vsync.eq(tcgen.o_vsync),
-            hdmi.de.eq(tcgen.o_de),
+        # Each color channel is 12-bits wide on ECPIX5-85, 8 on ECPIX5-45.
+        def lane(color, index, width):
+            return color[index*tcgen.depth:(index+1)*tcgen.depth][-width:]
+
+        pixel = Record([
+            ("r",     len(hdmi.d.r)),
+            ("g",     len(hdmi.d.g)),
+            ("b",     len(hdmi.d.b)),
+            ("de",    1),
+            ("hsync", 1),
+            ("vsync", 1),
+        ])
+        pixels = [Cat(lane(tcgen.r, index, len(pixel.r)),
+                      lane(tcgen.g, index, len(pixel.g)),
+                      lane(tcgen.b, index, len(pixel.b)),
+                      tcgen.o_de, tcgen.o_hsync, tcgen.o_vsync)
+                  for index in range(self.ppc)]
+
+        if self.ppc == 1:
+            m.submodules += [syncgen, tcgen]
+            m.d.comb += pixel.eq(pixels[0])
+        else:
+            m.submodules += [
+                DomainRenamer(self.core_domain)(syncgen),
+                DomainRenamer(self.core_domain)(tcgen),
+            ]
+            m.submodules.gearbox = gearbox = PixelGearbox(len(pixel), self.ppc,
+                                                          i_domain=self.core_domain)
+            m.d.comb += [
+                gearbox.i.eq(Cat(*pixels)),
+                pixel.eq(gearbox.o),
+            ]
+
+        m.d.comb += [
+            hdmi.hsync.eq(pixel.hsync),
+            hdmi.vsync.eq(pixel.vsync),
+            hdmi.de.eq(pixel.de),
             hdmi.rst.eq(0),
 
-            # Each color channel is 12-bits wide on ECPIX5-85, 8 on ECPIX5-45.
-            hdmi.d.r.eq(tcgen.r[-len(hdmi.d.r):]),
-            hdmi.d.g.eq(tcgen.g[-len(hdmi.d.g):]),
-            hdmi.d.b.eq(tcgen.b[-len(hdmi.d.b):]),
+            hdmi.d.r.eq(pixel.r),
+            hdmi.d.g.eq(pixel.g),
+            hdmi.d.b.eq(pixel.b),
         ]
 
         return m
@@ -0,0 +1,475 @@
+import zlib
+import struct
+from functools import reduce
+from operator import and_, xor
+
+from nmigen import *
+from nmigen.lib.cdc import FFSynchronizer
+
+from .prbs import PRBSGenerator, PRBSChecker, prbs_bytes
+from .uart import RegisterBridge, read_register, write_register
+
+
+__all__ = ["ETH_REGISTERS", "EthernetGenerator", "EthernetChecker", "EthernetTester",
+           "test_frame"]
+
+
+ETH_PREAMBLE  = bytes([0x55] * 7 + [0xd5])
+ETH_DST       = bytes([0xff] * 6)
+ETH_SRC       = bytes([0x02, 0x00, 0x00, 0x00, 0x00, 0x01])
+# IEEE 802 local experimental EtherType.
+ETH_TYPE      = 0x88b5
+ETH_HEADER    = ETH_DST + ETH_SRC + struct.pack(">H", ETH_TYPE)
+# Value of the CRC register after a frame and its (correct) FCS.
+ETH_CRC_RESIDUE = 0xdebb20e3
+
+# Registers of the ``RegisterBridge`` of ``EthernetTester``, in order: (name, writable).
+ETH_REGISTERS = (
+    ("control",         True),  # bit 0: enable the generator; bit 1: clear the counters
+    ("payload_len",     True),  # in bytes, from 46 to 1500
+    ("ifg",             True),  # inter-frame gap, in bytes, at least 12
+    ("tx_frames",       False),
+    ("tx_bytes",        False),
+    ("tx_cycles",       False),
+    ("rx_frames",       False),
+    ("rx_bytes",        False),
+    ("rx_cycles",       False),
+    ("rx_crc_errors",   False),
+    ("rx_bit_errors",   False),
+    ("rx_other_frames", False),
+)
+
+
+def _crc32_next(crc, data):
+    # Update the Ethernet (reflected) CRC register ``crc`` with the byte ``data``, each bit
+    # of the result being unrolled into an XOR of bits of ``crc`` and ``data``.
+    state = [{("c", i)} for i in range(32)]
+    for i in range(8):
+        feedback = state[0] ^ {("d", i)}
+        state = state[1:] + [set()]
+        for bit in range(32):
+            if (0xedb88320 >> bit) & 1:
+                state[bit] = state[bit] ^ feedback
+    bits = {"c": crc, "d": data}
+    return Cat(reduce(xor, (bits[kind][index] for kind, index in sorted(terms)))
+               for terms in state)
+
+
+def test_frame(payload_len):
+    """
+    Return the frame sent by ``EthernetGenerator`` with a payload of ``payload_len`` bytes,
+    from the destination address to the FCS (without the preamble).
+    """
+    frame = ETH_HEADER + prbs_bytes(payload_len)
+    return frame + struct.pack("<I", zlib.crc32(frame))
+
+
+class EthernetGenerator(Elaboratable):
+    """
+    Ethernet frame generator, one byte per cycle.
+    While ``enable`` is asserted, sends broadcast frames with a PRBS payload of
+    ``payload_len`` bytes, separated by ``ifg`` idle cycles. The PRBS restarts with each
+    frame. ``data`` and ``valid`` are meant for the transmit side of a GMII or RGMII PHY.
+    ``frames``, ``bytes`` (from the destination address to the FCS) and ``cycles`` (while
+    enabled) are cleared by ``clear``.
+    """
+    def __init__(self):
+        self.enable      = Signal()
+        self.clear       = Signal()
+        self.payload_len = Signal(16)
+        self.ifg         = Signal(16)
+
+        self.data        = Signal(8)
+        self.valid       = Signal()
+
+        self.frames      = Signal(32)
+        self.bytes       = Signal(32)
+        self.cycles      = Signal(32)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.prbs = prbs = PRBSGenerator(8)
+
+        count = Signal(16)
+        crc   = Signal(32)
+        fcs   = Signal(32)
+        m.d.comb += fcs.eq(~crc)
+
+        preamble = Array(Const(byte, 8) for byte in ETH_PREAMBLE)
+        header   = Array(Const(byte, 8) for byte in ETH_HEADER)
+
+        with m.If(self.clear):
+            m.d.sync += [
+                self.frames.eq(0),
+                self.bytes.eq(0),
+                self.cycles.eq(0),
+            ]
+        with m.Elif(self.enable):
+            m.d.sync += self.cycles.eq(self.cycles + 1)
+
+        with m.FSM():
+            with m.State("IDLE"):
+                m.d.comb += prbs.restart.eq(1)
+                m.d.sync += [
+                    count.eq(0),
+                    crc.eq(0xffffffff),
+                ]
+                with m.If(self.enable):
+                    m.next = "PREAMBLE"
+
+            with m.State("PREAMBLE"):
+                m.d.comb += [
+                    self.data.eq(preamble[count[:3]]),
+                    self.valid.eq(1),
+                ]
+                m.d.sync += count.eq(count + 1)
+                with m.If(count == len(ETH_PREAMBLE) - 1):
+                    m.d.sync += count.eq(0)
+                    m.next = "HEADER"
+
+            with m.State("HEADER"):
+                m.d.comb += [
+                    self.data.eq(header[count[:4]]),
+                    self.valid.eq(1),
+                ]
+                m.d.sync += [
+                    count.eq(count + 1),
+                    crc.eq(_crc32_next(crc, self.data)),
+                ]
+                with m.If(count == len(ETH_HEADER) - 1):
+                    m.d.sync += count.eq(0)
+                    m.next = "PAYLOAD"
+
+            with m.State("PAYLOAD"):
+                m.d.comb += [
+                    self.data.eq(prbs.data),
+                    self.valid.eq(1),
+                    prbs.next.eq(1),
+                ]
+                m.d.sync += [
+                    count.eq(count + 1),
+                    crc.eq(_crc32_next(crc, self.data)),
+                ]
+                with m.If(count == self.payload_len - 1):
+                    m.d.sync += count.eq(0)
+                    m.next = "FCS"
+
+            with m.State("FCS"):
+                m.d.comb += [
+                    self.data.eq(fcs.word_select(count[:2], 8)),
+                    self.valid.eq(1),
+                ]
+                m.d.sync += count.eq(count + 1)
+                with m.If(count == 3):
+                    m.d.sync += [
+                        count.eq(0),
+                        self.frames.eq(self.frames + 1),
+                        self.bytes.eq(self.bytes + len(ETH_HEADER) + self.payload_len + 4),
+                    ]
+                    m.next = "GAP"
+
+            with m.State("GAP"):
+                m.d.comb += prbs.restart.eq(1)
+                m.d.sync += [
+                    count.eq(count + 1),
+                    crc.eq(0xffffffff),
+                ]
+                with m.If(count >= self.ifg - 1):
+                    m.d.sync += count.eq(0)
+                    with m.If(self.enable):
+                        m.next = "PREAMBLE"
+                    with m.Else():
+                        m.next = "IDLE"
+
+        return m
+
+
+class EthernetChecker(Elaboratable):
+    """
+    Ethernet frame checker, one byte per cycle.
+    Receives frames from ``data`` and ``valid`` (with ``error`` marking receive errors), as
+    from the receive side of a GMII or RGMII PHY, and checks their FCS. The payload of frames
+    sent by ``EthernetGenerator`` is also checked against the PRBS; other frames are only
+    counted in ``other_frames``.
+    ``frames`` and ``bytes`` count every frame, ``crc_errors`` the frames with an incorrect FCS
+    or a receive error, ``bit_errors`` the payload bits that differ from the PRBS, and
+    ``cycles`` the cycles since the counters were last cleared by ``clear``.
+    """
+    def __init__(self):
+        self.clear        = Signal()
+
+        self.data         = Signal(8)
+        self.valid        = Signal()
+        self.error        = Signal()
+
+        self.frames       = Signal(32)
+        self.bytes        = Signal(32)
+        self.cycles       = Signal(32)
+        self.crc_errors   = Signal(32)
+        self.bit_errors   = Signal(32)
+        self.other_frames = Signal(32)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.prbs = prbs = PRBSChecker(8)
+
+        count = Signal(16)
+        crc   = Signal(32)
+        m.d.comb += prbs.data.eq(0)
+
+        # The FCS is only known to be the last 4 bytes once the frame ends, so the payload is
+        # checked 4 bytes late.
+        delayed = Array(Signal(8, name="delayed{}".format(i)) for i in range(4))
+        index   = Signal(16)
+        m.d.comb += index.eq(count - 4)
+
+        frame_type   = Signal(16)
+        frame_errors = Signal(32)
+        frame_failed = Signal()
+
+        with m.If(self.clear):
+            m.d.sync += [
+                self.frames.eq(0),
+                self.bytes.eq(0),
+                self.cycles.eq(0),
+                self.crc_errors.eq(0),
+                self.bit_errors.eq(0),
+                self.other_frames.eq(0),
+            ]
+        with m.Else():
+            m.d.sync += self.cycles.eq(self.cycles + 1)
+
+        with m.FSM():
+            with m.State("IDLE"):
+                with m.If(self.valid & (self.data == 0x55)):
+                    m.next = "PREAMBLE"
+
+            with m.State("PREAMBLE"):
+                m.d.comb += prbs.restart.eq(1)
+                m.d.sync += [
+                    count.eq(0),
+                    crc.eq(0xffffffff),
+                    frame_errors.eq(0),
+                    frame_failed.eq(0),
+                ]
+                with m.If(~self.valid):
+                    m.next = "IDLE"
+                with m.Elif(self.data == 0xd5):
+                    m.next = "FRAME"
+                with m.Elif(self.data != 0x55):
+                    m.next = "DROP"
+
+            with m.State("FRAME"):
+                with m.If(self.valid):
+                    m.d.sync += [
+                        count.eq(count + 1),
+                        crc.eq(_crc32_next(crc, self.data)),
+                        delayed[0].eq(self.data),
+                        delayed[1].eq(delayed[0]),
+                        delayed[2].eq(delayed[1]),
+                        delayed[3].eq(delayed[2]),
+                    ]
+                    with m.If(self.error):
+                        m.d.sync += frame_failed.eq(1)
+                    with m.If(count >= 4):
+                        with m.If(index == 12):
+                            m.d.sync += frame_type[8:].eq(delayed[3])
+                        with m.If(index == 13):
+                            m.d.sync += frame_type[:8].eq(delayed[3])
+                        with m.If(index >= len(ETH_HEADER)):
+                            m.d.comb += [
+                                prbs.data.eq(delayed[3]),
+                                prbs.valid.eq(1),
+                            ]
+                            m.d.sync += frame_errors.eq(frame_errors + prbs.errors)
+                with m.Else():
+                    m.d.sync += [
+                        self.frames.eq(self.frames + 1),
+                        self.bytes.eq(self.bytes + count),
+                    ]
+                    with m.If(frame_failed | (crc != ETH_CRC_RESIDUE)):
+                        m.d.sync += self.crc_errors.eq(self.crc_errors + 1)
+                    with m.If(frame_type == ETH_TYPE):
+                        m.d.sync += self.bit_errors.eq(self.bit_errors + frame_errors)
+                    with m.Else():
+                        m.d.sync += self.other_frames.eq(self.other_frames + 1)
+                    m.next = "IDLE"
+
+            with m.State("DROP"):
+                with m.If(~self.valid):
+                    m.next = "IDLE"
+
+        return m
+
+
+class EthernetTester(Elaboratable):
+    """
+    Gigabit Ethernet line-rate tester, on the RGMII port.
+    Frames from an ``EthernetGenerator`` are sent in the ``eth_tx`` domain (125 MHz), and
+    received frames are checked by an ``EthernetChecker`` in the ``eth_rx`` domain, clocked
+    by the PHY. It is controlled, and its counters are read, through a ``RegisterBridge`` on
+    the UART (see ``ETH_REGISTERS``), running in the ``sync`` domain at ``clk_freq``.
+    Connect the port to a gigabit loopback plug, or to a link partner that reflects frames.
+
+    For simulation, ``pads`` replaces the ``eth_rgmii`` and ``uart`` platform resources (see
+    ``sim.rgmii_pads``); the transmit clock is then output without its delay line.
+    """
+    tx_clk_delay = 2e-9
+
+    def __init__(self, clk_freq=100e6, baudrate=1_000_000, pads=None):
+        self.clk_freq = clk_freq
+        self.baudrate = baudrate
+        self.pads = pads
+
+    def elaborate(self, platform):
+        m = Module()
+
+        if self.pads is not None:
+            rgmii = uart = self.pads
+        else:
+            rgmii = platform.request("eth_rgmii", 0, xdr={
+                "tx_data": 2, "tx_ctrl": 2, "rx_data": 2, "rx_ctrl": 2,
+            }, dir={"tx_clk": "-"})
+            uart = platform.request("uart", 0)
+
+        m.domains.eth_rx = ClockDomain("eth_rx", reset_less=True)
+        m.d.comb += ClockSignal("eth_rx").eq(rgmii.rx_clk.i)
+
+        # PHY
+        m.d.comb += [
+            rgmii.rst.o.eq(0),
+            rgmii.mdc.o.eq(0),
+            rgmii.mdio.oe.eq(0),
+        ]
+
+        m.submodules.generator = generator = DomainRenamer("eth_tx")(EthernetGenerator())
+        m.d.comb += [
+            rgmii.tx_data.o_clk.eq(ClockSignal("eth_tx")),
+            rgmii.tx_data.o0.eq(generator.data[:4]),
+            rgmii.tx_data.o1.eq(generator.data[4:]),
+            rgmii.tx_ctrl.o_clk.eq(ClockSignal("eth_tx")),
+            rgmii.tx_ctrl.o0.eq(generator.valid),
+            rgmii.tx_ctrl.o1.eq(generator.valid),
+        ]
+        if self.pads is not None:
+            m.d.comb += rgmii.tx_clk.eq(ClockSignal("eth_tx"))
+        else:
+            # The transmit clock is delayed by a quarter period, to be centered on the data.
+            tx_clk = Signal()
+            m.submodules.tx_clk_oddr = Instance("ODDRX1F",
+                i_SCLK = ClockSignal("eth_tx"),
+                i_RST  = Const(0),
+                i_D0   = Const(1),
+                i_D1   = Const(0),
+                o_Q    = tx_clk,
+            )
+            m.submodules.tx_clk_delay = Instance("DELAYG",
+                p_DEL_MODE  = "SCLK_ALIGNED",
+                p_DEL_VALUE = int(self.tx_clk_delay / 25e-12),
+                i_A         = tx_clk,
+                o_Z         = rgmii.tx_clk,
+            )
+
+        m.submodules.checker = checker = DomainRenamer("eth_rx")(EthernetChecker())
+        m.d.comb += [
+            rgmii.rx_data.i_clk.eq(ClockSignal("eth_rx")),
+            rgmii.rx_ctrl.i_clk.eq(ClockSignal("eth_rx")),
+            checker.data.eq(Cat(rgmii.rx_data.i0, rgmii.rx_data.i1)),
+            checker.valid.eq(rgmii.rx_ctrl.i0),
+            checker.error.eq(rgmii.rx_ctrl.i0 ^ rgmii.rx_ctrl.i1),
+        ]
+
+        # Registers
+        regs = {name: Signal(32, name=name) for name, writable in ETH_REGISTERS}
+        m.submodules.bridge = bridge = RegisterBridge(
+            [(regs[name], writable) for name, writable in ETH_REGISTERS],
+            divisor=int(self.clk_freq // self.baudrate), external_snapshot=True)
+        m.d.comb += [
+            bridge.rx.eq(uart.rx.i),
+            uart.tx.o.eq(bridge.tx),
+        ]
+        # Configuration is only expected to change while the generator is disabled, so it is
+        # synchronized bit by bit.
+        for i, o, domain in (
+                (regs["control"][0],   generator.enable,      "eth_tx"),
+                (regs["control"][1],   generator.clear,       "eth_tx"),
+                (regs["control"][1],   checker.clear,         "eth_rx"),
+                (regs["payload_len"],  generator.payload_len, "eth_tx"),
+                (regs["ifg"],          generator.ifg,         "eth_tx")):
+            m.submodules += FFSynchronizer(i[:len(o)], o, o_domain=domain)
+
+        # Counters are captured by each domain on request, then read once both domains have
+        # acknowledged the request.
+        snapshot_req = Signal()
+        with m.If(bridge.snapshot):
+            m.d.sync += snapshot_req.eq(~snapshot_req)
+        acks = []
+        for domain, counters in (
+                ("eth_tx", {"tx_frames": generator.frames, "tx_bytes": generator.bytes,
+                            "tx_cycles": generator.cycles}),
+                ("eth_rx", {"rx_frames": checker.frames, "rx_bytes": checker.bytes,
+                            "rx_cycles": checker.cycles, "rx_crc_errors": checker.crc_errors,
+                            "rx_bit_errors": checker.bit_errors,
+                            "rx_other_frames": checker.other_frames})):
+            req = Signal(name="{}_snapshot_req".format(domain))
+            ack = Signal(name="{}_snapshot_ack".format(domain))
+            ack_sync = Signal(name="{}_snapshot_ack_sync".format(domain))
+            m.submodules += FFSynchronizer(snapshot_req, req, o_domain=domain)
+            m.submodules += FFSynchronizer(ack, ack_sync)
+            with m.If(req != ack):
+                m.d[domain] += ack.eq(req)
+                m.d[domain] += [regs[name].eq(counter) for name, counter in counters.items()]
+            acks.append(ack_sync)
+        m.d.comb += bridge.snapshot_done.eq(reduce(and_, (ack == snapshot_req for ack in acks)))
+
+        return m
+
+
+def _read_counters(port):
+    return {name: read_register(port, index)
+            for index, (name, writable) in enumerate(ETH_REGISTERS) if not writable}
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import argparse
+
+    import serial
+
+    parser = argparse.ArgumentParser(
+        description="Run the Ethernet tester of a board through its UART.")
+    parser.add_argument("--port", default="/dev/ttyUSB2",
+        help="serial port of the board (default: %(default)s)")
+    parser.add_argument("--baudrate", type=int, default=1_000_000,
+        help="(default: %(default)s)")
+    parser.add_argument("--payload-len", type=int, default=1500,
+        help="payload length of each frame, in bytes (default: %(default)s)")
+    parser.add_argument("--ifg", type=int, default=12,
+        help="inter-frame gap, in bytes (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+        help="test duration, in seconds (default: %(default)s)")
+
+    args = parser.parse_args()
+    regs = {name: index for index, (name, writable) in enumerate(ETH_REGISTERS)}
+    with serial.Serial(args.port, args.baudrate, timeout=1) as port:
+        write_register(port, regs["control"], 0b10)
+        write_register(port, regs["payload_len"], args.payload_len)
+        write_register(port, regs["ifg"], args.ifg)
+        write_register(port, regs["control"], 0b01)
+        time.sleep(args.duration)
+        write_register(port, regs["control"], 0b00)
+        time.sleep(0.1)
+        counters = _read_counters(port)
+
+    for name, value in counters.items():
+        print("{:>16}: {}".format(name, value))
+    if counters["tx_cycles"]:
+        # tx_cycles only counts while the generator is enabled.
+        print("{:>16}: {:.1f} Mbit/s".format("rx throughput",
+              counters["rx_bytes"] * 8 * 125e6 / counters["tx_cycles"] / 1e6))
+    failed = (counters["rx_frames"] != counters["tx_frames"] or counters["rx_crc_errors"] or
+              counters["rx_bit_errors"])
+    sys.exit(1 if failed else 0)
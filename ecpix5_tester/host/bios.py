@@ -0,0 +1,251 @@
+"""
+Incremental parser of LiteX BIOS (and Linux boot) console output.
+
+Bytes are fed as they are received, in chunks of any size; only the current line is kept, so
+a parser costs a few hundred bytes per console. Each complete line (ended by ``\\n`` or by
+``\\r``, as progress lines are) is turned into events, as dicts with a ``type`` key:
+
+- ``bios``: the BIOS started (``built``: its build date);
+- ``leveling``: one bitslip of one module scanned during read or write leveling
+  (``kind``, ``module``, ``bitslip``, ``window``: the scan bitmap, ``delay`` and ``margin``:
+  the center of the window and its half-width, in taps, or ``None`` without a window);
+- ``leveling_best``: the bitslip selected for a module (``module``, ``bitslip``, ``delay``,
+  ``margin``);
+- ``memtest``: the end of a memory test (``passed``, ``base`` and ``size``: the range tested,
+  ``write`` and ``read``: the last ``(start, end)`` ranges reported, ``errors``: a dict of
+  ``(errors, total)`` by kind, if any were reported);
+- ``memspeed``: the end of a memory speed test (``mode``, and ``write`` and ``read`` in MiB/s);
+- ``boot``: the BIOS is done initializing and tries to boot;
+- ``prompt``: the BIOS console is waiting for commands;
+- ``linux``: a Linux boot milestone (``milestone``, one of ``LINUX_MILESTONES``, ``time``: the
+  kernel timestamp, if any, and ``text``: the line).
+
+    $ python -m ecpix5_tester.host.bios logs/*.log
+"""
+
+import re
+
+
+__all__ = ["LINUX_MILESTONES", "BiosParser", "parse"]
+
+
+_UNITS = {b"": 1, b"Ki": 1 << 10, b"Mi": 1 << 20, b"Gi": 1 << 30}
+
+_BIOS           = re.compile(rb"^\s*BIOS built on (.*?)\s*$")
+_LEVELING_KIND  = re.compile(rb"^(Read|Write) leveling:")
+_LEVELING       = re.compile(rb"^\s*m(\d+), b(\d+): \|([01]+)\| delays: (?:(\d+)\+-(\d+)|-)")
+_LEVELING_BEST  = re.compile(rb"^\s*best: m(\d+), b(\d+) delays: (?:(\d+)\+-(\d+)|-)")
+_MEMTEST        = re.compile(rb"^Memtest at 0x([0-9a-fA-F]+) \(([\d.]+)(Ki|Mi|Gi|)B\)")
+_MEMTEST_RANGE  = re.compile(rb"^\s*(Write|Read): 0x([0-9a-fA-F]+)-0x([0-9a-fA-F]+)")
+_MEMTEST_ERRORS = re.compile(rb"^\s*(\w+) errors:\s*(\d+)/(\d+)")
+_MEMTEST_RESULT = re.compile(rb"^Memtest (OK|KO|failed)")
+_MEMSPEED       = re.compile(rb"^Memspeed at 0x[0-9a-fA-F]+ \((\w+)")
+_MEMSPEED_RATE  = re.compile(rb"^\s*(Write|Read) speed: ([\d.]+)(Ki|Mi|Gi|)B/s")
+_BOOT           = re.compile(rb"^--=+ Boot =+--")
+_PROMPT         = b"litex> "
+
+_NEWLINE        = re.compile(rb"[\r\n]")
+_KERNEL_TIME    = re.compile(rb"^\[\s*(\d+\.\d+)\] ")
+
+# Linux boot milestones, in the order they are expected.
+LINUX_MILESTONES = (
+    ("opensbi", re.compile(rb"^OpenSBI v")),
+    ("kernel",  re.compile(rb"^Linux version ")),
+    ("console", re.compile(rb"^printk: console \[\w+\] enabled")),
+    ("initrd",  re.compile(rb"^Freeing initrd memory")),
+    ("init",    re.compile(rb"^Run \S+ as init process")),
+)
+_LOGIN          = re.compile(rb"^\S+ login: ")
+
+# Longer lines are truncated; no line of interest comes close.
+_MAX_LINE       = 256
+
+
+def _size(value, unit):
+    return int(float(value) * _UNITS[unit])
+
+
+def _prompt(line):
+    # Prompts are not followed by a newline until a command is typed, so they are looked for
+    # at the start of lines, complete or not.
+    if line.startswith(_PROMPT):
+        return {"type": "prompt"}
+    match = _LOGIN.match(line)
+    if match:
+        return {"type": "linux", "milestone": "login", "time": None,
+                "text": match.group(0).decode("utf-8", "replace")}
+    return None
+
+
+def _delays(match, first):
+    if match.group(first) is None:
+        return None, None
+    return int(match.group(first)), int(match.group(first + 1))
+
+
+class BiosParser:
+    """
+    Incremental parser of a console. ``feed`` returns the events of the lines completed by
+    the given bytes (see the module documentation).
+    """
+    __slots__ = ("_line", "_prompted", "_leveling", "_memtest", "_memspeed")
+
+    def __init__(self):
+        self._line      = b""
+        self._prompted  = False
+        self._leveling  = "read"
+        self._memtest   = None
+        self._memspeed  = None
+
+    def feed(self, data):
+        events = []
+        *lines, rest = _NEWLINE.split(data)
+        if lines:
+            lines[0] = self._line + lines[0]
+            for line in lines:
+                self._parse_line(line[:_MAX_LINE], events)
+            line = rest[:_MAX_LINE]
+        else:
+            line = (self._line + rest)[:_MAX_LINE]
+        self._line = line
+
+        if not self._prompted:
+            event = _prompt(line)
+            if event is not None:
+                self._prompted = True
+                events.append(event)
+        return events
+
+    def close(self):
+        """
+        Parse the last, unterminated line, and return its events.
+        """
+        events = []
+        if self._line:
+            self._parse_line(self._line, events)
+            self._line = b""
+        return events
+
+    def _parse_line(self, line, events):
+        prompted, self._prompted = self._prompted, False
+        if not line:
+            return
+
+        event = _prompt(line)
+        if event is not None:
+            if not prompted:
+                events.append(event)
+            return
+
+        match = _KERNEL_TIME.match(line)
+        if match:
+            self._parse_linux(line[match.end():], float(match.group(1)), events)
+            return
+
+        match = _LEVELING.match(line)
+        if match:
+            delay, margin = _delays(match, 4)
+            events.append({"type": "leveling", "kind": self._leveling,
+                           "module": int(match.group(1)), "bitslip": int(match.group(2)),
+                           "window": match.group(3).decode(), "delay": delay,
+                           "margin": margin})
+            return
+        match = _LEVELING_BEST.match(line)
+        if match:
+            delay, margin = _delays(match, 3)
+            events.append({"type": "leveling_best", "kind": self._leveling,
+                           "module": int(match.group(1)), "bitslip": int(match.group(2)),
+                           "delay": delay, "margin": margin})
+            return
+        match = _LEVELING_KIND.match(line)
+        if match:
+            self._leveling = match.group(1).decode().lower()
+            return
+
+        if self._memtest is not None:
+            match = _MEMTEST_RANGE.match(line)
+            if match:
+                self._memtest[match.group(1).decode().lower()] = (
+                    int(match.group(2), 16), int(match.group(3), 16))
+                return
+            match = _MEMTEST_ERRORS.match(line)
+            if match:
+                self._memtest.setdefault("errors", {})[match.group(1).decode()] = (
+                    int(match.group(2)), int(match.group(3)))
+                return
+            match = _MEMTEST_RESULT.match(line)
+            if match:
+                self._memtest["passed"] = match.group(1) == b"OK"
+                events.append(self._memtest)
+                self._memtest = None
+                return
+        match = _MEMTEST.match(line)
+        if match:
+            self._memtest = {"type": "memtest", "passed": None,
+                             "base": int(match.group(1), 16),
+                             "size": _size(match.group(2), match.group(3)),
+                             "write": None, "read": None}
+            return
+
+        if self._memspeed is not None:
+            match = _MEMSPEED_RATE.match(line)
+            if match:
+                direction = match.group(1).decode().lower()
+                self._memspeed[direction] = (float(match.group(2)) * _UNITS[match.group(3)] /
+                                             _UNITS[b"Mi"])
+                if direction == "read":
+                    events.append(self._memspeed)
+                    self._memspeed = None
+                return
+        match = _MEMSPEED.match(line)
+        if match:
+            self._memspeed = {"type": "memspeed", "mode": match.group(1).decode(),
+                              "write": None, "read": None}
+            return
+
+        if _BOOT.match(line):
+            events.append({"type": "boot"})
+            return
+        match = _BIOS.match(line)
+        if match:
+            self._leveling = "read"
+            self._memtest = self._memspeed = None
+            events.append({"type": "bios", "built": match.group(1).decode("utf-8", "replace")})
+            return
+
+        self._parse_linux(line, None, events)
+
+    def _parse_linux(self, line, time, events):
+        for milestone, pattern in LINUX_MILESTONES:
+            if pattern.match(line):
+                events.append({"type": "linux", "milestone": milestone, "time": time,
+                               "text": line.decode("utf-8", "replace")})
+                return
+
+
+def parse(data):
+    """
+    Return all the events of the console output ``data``.
+    """
+    parser = BiosParser()
+    return parser.feed(data) + parser.close()
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Print the events of LiteX BIOS console logs, as JSON lines.")
+    parser.add_argument("logs", nargs="+", metavar="LOG",
+        help="console log file")
+
+    args = parser.parse_args()
+    for filename in args.logs:
+        bios = BiosParser()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                for event in bios.feed(chunk):
+                    print(json.dumps({"log": filename, **event}))
+        for event in bios.close():
+            print(json.dumps({"log": filename, **event}))
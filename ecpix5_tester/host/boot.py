@@ -0,0 +1,447 @@
+"""
+Fast serial boot of the images listed in a LiteX ``boot.json`` (e.g. ``firmware/boot.json``).
+
+The BIOS serialboot only loads the small stub of ``firmware/stub``, at ``STUB_ADDRESS``. The
+images are then sent to the stub in chunks compressed with raw deflate, as CRC-checked frames
+of which up to a window are in flight at once, and the stub decompresses them into place
+before jumping to the boot address. Chunks that already match the memory, as after a reboot
+(which only overwrites the memory tested by the BIOS), are not sent at all.
+
+Frames are little endian, with a CRC-32 of all fields but the magic:
+
+- to the stub: ``0x5a``, command (u8), seq (u8), payload length (u32), payload, CRC (u32);
+- from the stub: ``0xa5``, status (u8), seq (u8), payload length (u32), payload, CRC (u32).
+
+Data frames are numbered by ``seq`` and acknowledged one by one. After a corrupted frame, the
+stub answers ``STATUS_CRC`` with the seq it expects, and drops the frames that follow until
+the host goes back to it. Other commands are answered with the seq they were sent with.
+
+    $ ecpix5-boot /dev/ttyUSB2 firmware/boot.json
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import asyncio
+import binascii
+
+from .console import open_console
+
+
+__all__ = ["MAIN_RAM_BASE", "STAGING_BASE", "STUB_ADDRESS", "BootError", "load_images",
+           "encode_frame", "read_frame", "boot", "main"]
+
+
+# Memory map of the boot: images go below the staging area of the compressed chunks, which
+# ends where the stub is loaded. Must match firmware/stub/main.c and firmware/stub/linker.ld.
+MAIN_RAM_BASE = 0x40000000
+STAGING_BASE  = 0x42000000
+STUB_ADDRESS  = 0x47f00000
+
+# Serial flash loader (SFL) of the LiteX BIOS.
+SFL_MAGIC_REQ    = b"sL5DdSMmkekro"
+SFL_MAGIC_ACK    = b"z6IHG7cYDID6o\n"
+SFL_CMD_ABORT    = 0x00
+SFL_CMD_LOAD     = 0x01
+SFL_CMD_JUMP     = 0x02
+SFL_ACK_SUCCESS  = b"K"
+SFL_ACK_CRCERROR = b"C"
+SFL_MAX_DATA     = 251
+
+# Stub protocol. Must match firmware/stub/main.c.
+STUB_VERSION  = 1
+HOST_MAGIC    = 0x5a
+STUB_MAGIC    = 0xa5
+
+CMD_HELLO     = 0x01 # -> version (u8), window (u8), 2 bytes, max chunk (u32), staging (u32)
+CMD_CHECKSUM  = 0x02 # address, length, block size -> CRC-32 of each block of the memory
+CMD_DATA      = 0x03 # address, length, CRC-32, compressed chunk
+CMD_BOOT      = 0x04 # address, r1, r2, r3 -> number of chunks, then jumps to address
+
+STATUS_OK     = 0x00
+STATUS_CRC    = 0x01
+STATUS_ERROR  = 0x02 # -> error code (u32), chunk index (u32)
+
+ERROR_COMMAND = 1
+ERROR_RANGE   = 2
+ERROR_FULL    = 3
+ERROR_INFLATE = 4 # with the index of the chunk
+ERROR_CHECK   = 5 # with the index of the chunk
+
+STUB_ERRORS = {
+    ERROR_COMMAND: "invalid command",
+    ERROR_RANGE:   "address out of range",
+    ERROR_FULL:    "staging area full",
+    ERROR_INFLATE: "corrupted compressed data",
+    ERROR_CHECK:   "decompressed data mismatch",
+}
+
+# Largest chunk, most checksums in a reply, and longest payload of a frame.
+MAX_CHUNK     = 64 * 1024
+MAX_CHECKSUMS = 1024
+MAX_PAYLOAD   = 12 + MAX_CHUNK + MAX_CHUNK // 1024 + 64
+
+_RETRIES = 5
+
+
+class BootError(Exception):
+    pass
+
+
+def load_images(path):
+    """
+    Read the ``boot.json`` at ``path``, and return a tuple of its images, as a list of
+    ``(name, address, data)`` in file order, the boot address and the ``(r1, r2, r3)``
+    arguments. As with the LiteX terminal, the boot address and arguments are taken from
+    ``bootargs`` if given; otherwise, the last image is booted, without arguments.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    bootargs = config.pop("bootargs", {})
+
+    images = []
+    for name, address in config.items():
+        with open(os.path.join(os.path.dirname(path), name), "rb") as f:
+            images.append((name, int(address, 0), f.read()))
+    if not images:
+        raise ValueError("No images in {}".format(path))
+
+    address = int(bootargs["addr"], 0) if "addr" in bootargs else images[-1][1]
+    args = tuple(int(bootargs.get(name, "0"), 0) for name in ("r1", "r2", "r3"))
+    return images, address, args
+
+
+def encode_frame(magic, kind, seq, payload=b""):
+    """
+    Return the frame with the given ``magic``, command or status ``kind``, ``seq`` and
+    ``payload``.
+    """
+    header = struct.pack("<BBI", kind, seq & 0xff, len(payload))
+    return (bytes([magic]) + header + payload +
+            struct.pack("<I", zlib.crc32(payload, zlib.crc32(header))))
+
+
+async def read_frame(reader, magic, max_payload=MAX_PAYLOAD):
+    """
+    Read the next frame with the given ``magic`` from ``reader``, skipping anything before it,
+    and return its ``(kind, seq, payload)``, or ``None`` if it is corrupted.
+    """
+    while (await reader.readexactly(1))[0] != magic:
+        pass
+    header = await reader.readexactly(6)
+    kind, seq, length = struct.unpack("<BBI", header)
+    if length > max_payload:
+        return None
+    payload = await reader.readexactly(length)
+    crc, = struct.unpack("<I", await reader.readexactly(4))
+    if zlib.crc32(payload, zlib.crc32(header)) != crc:
+        return None
+    return kind, seq, payload
+
+
+async def _wait_for(reader, pattern):
+    data = b""
+    while pattern not in data:
+        chunk = await reader.read(4096)
+        if not chunk:
+            raise EOFError("console closed")
+        data = data[-len(pattern):] + chunk
+
+
+async def _sfl_command(console, cmd, payload, timeout):
+    crc = binascii.crc_hqx(bytes([cmd]) + payload, 0)
+    frame = struct.pack(">BHB", len(payload), crc, cmd) + payload
+    for _ in range(_RETRIES):
+        console.write(frame)
+        ack = await asyncio.wait_for(console.reader.readexactly(1), timeout)
+        if ack == SFL_ACK_SUCCESS:
+            return
+        if ack != SFL_ACK_CRCERROR:
+            raise BootError("serialboot error {!r}".format(ack))
+    raise BootError("serialboot: too many CRC errors")
+
+
+async def _load_stub(console, stub, command, timeout):
+    if command:
+        console.write(command)
+    try:
+        await asyncio.wait_for(_wait_for(console.reader, SFL_MAGIC_REQ), timeout)
+    except asyncio.TimeoutError:
+        raise BootError("no serialboot request from the BIOS") from None
+    console.write(SFL_MAGIC_ACK)
+    for offset in range(0, len(stub), SFL_MAX_DATA):
+        await _sfl_command(console, SFL_CMD_LOAD,
+                           struct.pack(">I", STUB_ADDRESS + offset) +
+                           stub[offset:offset + SFL_MAX_DATA], timeout)
+    await _sfl_command(console, SFL_CMD_JUMP, struct.pack(">I", STUB_ADDRESS), timeout)
+
+
+class _Stub:
+    def __init__(self, console, timeout, level):
+        self.console = console
+        self.timeout = timeout
+        self.level   = level
+        self.sent    = 0
+        self.resent  = 0
+        self._seq    = 0
+
+    def _write(self, frame):
+        self.console.write(frame)
+        self.sent += len(frame)
+
+    def _error(self, payload):
+        error, index = struct.unpack("<II", payload[:8].ljust(8, b"\0"))
+        message = "stub: {}".format(STUB_ERRORS.get(error, "error {}".format(error)))
+        if error in (ERROR_INFLATE, ERROR_CHECK):
+            message += " in chunk {}".format(index)
+        return BootError(message)
+
+    async def request(self, command, payload=b"", timeout=None, resend=True):
+        """
+        Send ``command``, and return the payload of its answer. Corrupted commands are sent
+        again, and so are unanswered ones if ``resend`` is true.
+        """
+        self._seq = (self._seq + 1) & 0xff
+        frame = encode_frame(HOST_MAGIC, command, self._seq, payload)
+        for _ in range(_RETRIES):
+            self._write(frame)
+            deadline = time.monotonic() + (timeout or self.timeout)
+            while True:
+                try:
+                    reply = await asyncio.wait_for(
+                        read_frame(self.console.reader, STUB_MAGIC),
+                        max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    if not resend:
+                        raise BootError("no answer from the stub") from None
+                    break
+                if reply is None:
+                    continue
+                status, seq, reply = reply
+                if status == STATUS_CRC:
+                    break
+                if seq != self._seq:
+                    continue # answer to an earlier attempt
+                if status != STATUS_OK:
+                    raise self._error(reply)
+                return reply
+        raise BootError("no answer from the stub")
+
+    async def send_chunks(self, chunks, window, timeout, callback=None):
+        """
+        Send ``chunks``, a list of ``(address, data)``, keeping up to ``window`` in flight,
+        and going back to the first unacknowledged one after a corrupted or lost frame.
+        ``callback`` is called with the index of each acknowledged chunk.
+        """
+        frames = {}
+        base = next_index = 0
+        stalls = 0
+        while base < len(chunks):
+            while next_index < len(chunks) and next_index - base < window:
+                if next_index not in frames:
+                    address, data = chunks[next_index]
+                    compress = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+                    frames[next_index] = encode_frame(HOST_MAGIC, CMD_DATA, next_index,
+                        struct.pack("<III", address, len(data), zlib.crc32(data)) +
+                        compress.compress(data) + compress.flush())
+                else:
+                    self.resent += 1
+                self._write(frames[next_index])
+                next_index += 1
+
+            try:
+                reply = await asyncio.wait_for(
+                    read_frame(self.console.reader, STUB_MAGIC), timeout)
+            except asyncio.TimeoutError:
+                stalls += 1
+                if stalls == _RETRIES:
+                    raise BootError("no acknowledgement from the stub") from None
+                next_index = base
+                continue
+            if reply is None:
+                continue
+            status, seq, payload = reply
+            index = base + ((seq - base) & 0xff)
+            if status == STATUS_ERROR:
+                raise self._error(payload)
+            if status == STATUS_OK and index < next_index:
+                for acked in range(base, index + 1):
+                    del frames[acked]
+                    if callback is not None:
+                        callback(acked)
+                base = index + 1
+                stalls = 0
+            elif status == STATUS_CRC and index <= next_index:
+                for acked in range(base, index):
+                    del frames[acked]
+                    if callback is not None:
+                        callback(acked)
+                base = next_index = index
+
+
+async def boot(console, images, address, args=(0, 0, 0), stub=None,
+               command=b"\nserialboot\n", window=8, chunk_size=32 * 1024, level=9,
+               baudrate=1_000_000, timeout=10.0, callback=None):
+    """
+    Boot ``images`` (as returned by ``load_images``) at ``address`` with ``args``, through
+    ``console`` (a ``console.Console``), and return statistics as a dict.
+
+    If ``stub`` (the binary of ``firmware/stub``) is given, it is first loaded through the
+    BIOS serialboot, after sending ``command`` (``reboot`` works too, or nothing at all if the
+    BIOS is about to try a serial boot itself); otherwise, the stub must already be running.
+    Images are sent in chunks of ``chunk_size`` bytes, compressed at ``level``, with up to
+    ``window`` chunks in flight. ``baudrate`` is only used for timeouts, which allow
+    ``timeout`` seconds for each answer besides transfers and computations.
+
+    ``callback``, if given, is called with the name of an image, and the number of its
+    chunks acknowledged and to be sent, as chunks are acknowledged.
+    """
+    start = time.monotonic()
+    if stub is not None:
+        await _load_stub(console, stub, command, timeout)
+
+    link = _Stub(console, timeout, level)
+    hello = await link.request(CMD_HELLO)
+    version, stub_window, max_chunk, staging = struct.unpack("<BBxxII", hello[:12])
+    if version != STUB_VERSION:
+        raise BootError("stub version {}, expected {}".format(version, STUB_VERSION))
+    if chunk_size > max_chunk:
+        raise BootError("chunks of {} bytes are over the stub limit of {} bytes".format(
+            chunk_size, max_chunk))
+    window = min(window, stub_window)
+
+    # Per-chunk checksums of the memory; the stub computes them at a few MB/s.
+    result = {"images": [], "sent": 0, "resent": 0, "time": 0.0}
+    chunks = []
+    owners = []
+    for name, base, data in images:
+        offsets = range(0, len(data), chunk_size)
+        checksums = []
+        for first in range(0, len(offsets), MAX_CHECKSUMS):
+            length = min(len(data) - offsets[first], MAX_CHECKSUMS * chunk_size)
+            reply = await link.request(CMD_CHECKSUM,
+                struct.pack("<III", base + offsets[first], length, chunk_size),
+                timeout=timeout + length * 1e-6)
+            checksums += struct.unpack("<{}I".format(len(reply) // 4), reply)
+        stats = {"name": name, "address": base, "size": len(data),
+                 "chunks": len(offsets), "sent": 0, "acknowledged": 0}
+        for offset, checksum in zip(offsets, checksums):
+            chunk = data[offset:offset + chunk_size]
+            if zlib.crc32(chunk) != checksum:
+                chunks.append((base + offset, chunk))
+                owners.append(stats)
+                stats["sent"] += 1
+        result["images"].append(stats)
+
+    def acknowledged(index):
+        stats = owners[index]
+        stats["acknowledged"] += 1
+        if callback is not None:
+            callback(stats["name"], stats["acknowledged"], stats["sent"])
+
+    frame_time = MAX_PAYLOAD * 10 / baudrate
+    await link.send_chunks(chunks, window, timeout + window * frame_time, acknowledged)
+
+    # The stub decompresses and checks everything before answering, at about 1 MB/s.
+    total = sum(len(chunk) for _, chunk in chunks)
+    await link.request(CMD_BOOT, struct.pack("<IIII", address, *args),
+                       timeout=timeout + total * 2e-6, resend=False)
+
+    result["sent"]   = link.sent
+    result["resent"] = link.resent
+    result["time"]   = time.monotonic() - start
+    return result
+
+
+def _format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024 or unit == "MiB":
+            break
+        size /= 1024
+    return "{:.1f}{}".format(size, unit) if unit != "B" else "{}B".format(size)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Boot the images of a LiteX boot.json quickly through the serial console.")
+    parser.add_argument("port",
+        help="serial port of the board")
+    parser.add_argument("config", nargs="?", default="firmware/boot.json",
+        help="boot.json listing the images and their addresses (default: %(default)s)")
+    parser.add_argument("--stub", default=None,
+        help="binary of the serial boot stub (default: stub/stub.bin next to the boot.json)")
+    parser.add_argument("--stub-running", action="store_true",
+        help="do not load the stub, it is already running")
+    parser.add_argument("--command", choices=("serialboot", "reboot", "none"),
+        default="serialboot",
+        help="BIOS command starting the serial boot; 'none' waits for the BIOS to start it, "
+             "e.g. after programming (default: %(default)s)")
+    parser.add_argument("--baudrate", type=int, default=1_000_000,
+        help="(default: %(default)s)")
+    parser.add_argument("--window", type=int, default=8,
+        help="chunks in flight (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=32 * 1024,
+        help="size of the chunks, in bytes (default: %(default)s)")
+    parser.add_argument("--level", type=int, choices=range(10), default=9, metavar="LEVEL",
+        help="compression level, 0-9 (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+        help="time allowed for each answer, in seconds (default: %(default)s)")
+
+    args = parser.parse_args(argv)
+    try:
+        images, address, boot_args = load_images(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    stub = None
+    if not args.stub_running:
+        stub_path = args.stub or os.path.join(os.path.dirname(args.config), "stub", "stub.bin")
+        try:
+            with open(stub_path, "rb") as f:
+                stub = f.read()
+        except OSError as e:
+            parser.error("{} (build it with make in firmware/stub)".format(e))
+    command = {"serialboot": b"\nserialboot\n", "reboot": b"\nreboot\n", "none": None}
+
+    progress = sys.stderr.isatty()
+    def callback(name, done, total):
+        if progress:
+            print("\r{}: {}/{} chunks".format(name, done, total), end="", file=sys.stderr,
+                  flush=True)
+
+    async def run():
+        console = await open_console(args.port, args.baudrate)
+        try:
+            return await boot(console, images, address, boot_args, stub,
+                command=command[args.command], window=args.window,
+                chunk_size=args.chunk_size, level=args.level, baudrate=args.baudrate,
+                timeout=args.timeout, callback=callback)
+        finally:
+            console.close()
+
+    try:
+        result = asyncio.run(run())
+    except (OSError, EOFError, BootError) as e:
+        if progress:
+            print(file=sys.stderr)
+        print("Boot failed: {}".format(e), file=sys.stderr)
+        return 1
+    if progress:
+        print("\r\033[K", end="", file=sys.stderr)
+
+    for image in result["images"]:
+        print("{name} at 0x{address:08x}: {size}, {sent}/{chunks} chunks sent".format(
+            **dict(image, size=_format_size(image["size"]))))
+    size = sum(image["size"] for image in result["images"])
+    print("Booted 0x{:08x} in {:.1f}s ({} sent for {} of images, {} chunks sent again)".format(
+        address, result["time"], _format_size(result["sent"]), _format_size(size),
+        result["resent"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
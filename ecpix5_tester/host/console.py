@@ -0,0 +1,121 @@
+import os
+import tty
+import asyncio
+import termios
+
+
+__all__ = ["Console", "open_console"]
+
+
+class Console:
+    """
+    Serial console, opened by ``open_console``. Received bytes are read from ``reader`` (an
+    ``asyncio.StreamReader``); ``write`` sends bytes without waiting.
+    """
+    def __init__(self, path, reader, transport):
+        self.path       = path
+        self.reader     = reader
+        self._transport = transport
+        self._closed    = False
+
+    def write(self, data):
+        self._transport.write(data)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._transport.close()
+
+
+class _ConsoleProtocol(asyncio.Protocol):
+    def __init__(self, reader):
+        self._reader = reader
+
+    def data_received(self, data):
+        self._reader.feed_data(data)
+
+    def eof_received(self):
+        self._reader.feed_eof()
+
+    def connection_lost(self, exc):
+        if exc is None:
+            self._reader.feed_eof()
+        else:
+            self._reader.set_exception(exc)
+
+
+class _ConsoleTransport:
+    # A single file descriptor is both read and written; asyncio only provides pipe
+    # transports for one direction each.
+    def __init__(self, loop, fd, protocol):
+        self._loop     = loop
+        self._fd       = fd
+        self._protocol = protocol
+        self._buffer   = bytearray()
+        loop.add_reader(fd, self._read_ready)
+
+    def _read_ready(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._loop.remove_reader(self._fd)
+            self._protocol.connection_lost(exc)
+            return
+        if data:
+            self._protocol.data_received(data)
+        else:
+            self._loop.remove_reader(self._fd)
+            self._protocol.eof_received()
+
+    def write(self, data):
+        if not self._buffer:
+            try:
+                data = data[os.write(self._fd, data):]
+            except BlockingIOError:
+                pass
+            if data:
+                self._loop.add_writer(self._fd, self._write_ready)
+        self._buffer += data
+
+    def _write_ready(self):
+        try:
+            del self._buffer[:os.write(self._fd, self._buffer)]
+        except BlockingIOError:
+            return
+        if not self._buffer:
+            self._loop.remove_writer(self._fd)
+
+    def close(self):
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        os.close(self._fd)
+
+
+async def open_console(path, baudrate=1_000_000):
+    """
+    Open the serial port (or pseudo-terminal) ``path`` in raw mode at ``baudrate``, 8N1,
+    without flow control, and return a ``Console``.
+    """
+    speed = getattr(termios, "B{}".format(baudrate), None)
+    if speed is None:
+        raise ValueError("Unsupported baud rate {}".format(baudrate))
+
+    loop = asyncio.get_running_loop()
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[2] &= ~(termios.CRTSCTS | termios.CSTOPB)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        termios.tcflush(fd, termios.TCIOFLUSH)
+    except (OSError, termios.error):
+        os.close(fd)
+        raise
+
+    reader = asyncio.StreamReader()
+    transport = _ConsoleTransport(loop, fd, _ConsoleProtocol(reader))
+    return Console(path, reader, transport)
@@ -0,0 +1,256 @@
+"""
+Test several boards concurrently through their serial consoles.
+
+Each board is (optionally) programmed, its LiteX BIOS is (re)started, and its console is
+watched until the BIOS is done initializing (or, with ``--until linux``, until Linux reaches
+its login prompt). With ``--boot``, Linux is booted from the BIOS prompt with the fast serial
+boot of ``boot``. The memory test decides whether the board passes; its result, the read
+leveling windows, the memory speed and the Linux boot milestones are collected for each
+board. Boards are independent: a slow or silent board only holds up its own result.
+
+    $ ecpix5-test --program "openFPGALoader --cable ft4232 --ftdi-serial {serial} \\
+          --bitstream build/top_85.bit" --config boards.json
+    $ ecpix5-test board0=/dev/ttyUSB2 board1=/dev/ttyUSB6
+    $ ecpix5-test --boot firmware/boot.json /dev/ttyUSB2
+
+``boards.json`` is a list of boards, each a dict with at least ``name`` and ``port``; all
+fields can be used in the ``--program`` command.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import asyncio
+
+from .console import open_console
+from .bios import BiosParser
+from .boot import BootError, load_images, boot as serial_boot
+
+
+__all__ = ["test_board", "run_boards", "main"]
+
+
+async def _program(board, command):
+    process = await asyncio.create_subprocess_exec(
+        *shlex.split(command.format(**board)),
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    output, _ = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("programming failed ({}): {}".format(
+            process.returncode, output.decode("utf-8", "replace").strip().splitlines()[-1:]))
+
+
+async def _watch(console, parser, result, log, until, start):
+    while True:
+        data = await console.reader.read(4096)
+        if not data:
+            raise EOFError("console closed")
+        if log is not None:
+            log.write(data)
+        for event in parser.feed(data):
+            kind = event.pop("type")
+            if kind == "bios" and result["memtest"] is not None:
+                raise RuntimeError("board restarted")
+            elif kind == "leveling":
+                result["leveling"].append(event)
+            elif kind == "memtest":
+                result["memtest"] = event
+            elif kind == "memspeed":
+                result["memspeed"] = {"write": event["write"], "read": event["read"]}
+            elif kind == "linux":
+                result["linux"].setdefault(event["milestone"], time.monotonic() - start)
+                if until == "linux" and event["milestone"] == "login":
+                    return
+            elif kind in ("boot", "prompt") and until == "bios":
+                return
+            elif kind == "prompt" and until == "prompt":
+                return
+            elif kind == "prompt":
+                raise RuntimeError("BIOS console reached instead of Linux")
+
+
+async def _test(console, result, log, until, boot):
+    start = time.monotonic()
+    if boot is not None:
+        await _watch(console, BiosParser(), result, log, "prompt", start)
+        if result["memtest"] is not None and not result["memtest"]["passed"]:
+            return
+        result["boot"] = await serial_boot(console, **boot)
+    # After a serial boot, the BIOS prompt is still the current line of the first parser.
+    await _watch(console, BiosParser(), result, log, until, start)
+
+
+async def test_board(board, baudrate=1_000_000, timeout=30.0, program=None, log_dir=None,
+                     until="bios", boot=None):
+    """
+    Test ``board`` (a dict with at least ``name`` and ``port``), and return the result as a
+    dict. If ``program`` is given, it is run (after formatting with the fields of ``board``)
+    to program the board, which then starts its BIOS; otherwise, the BIOS is restarted with
+    its ``reboot`` command. The test ends when the BIOS is done initializing, or if ``until``
+    is ``"linux"``, when Linux reaches its login prompt. The console output is saved in
+    ``log_dir``, if given.
+
+    If ``boot`` is given, as a dict of arguments of ``boot.boot`` (at least ``images`` and
+    ``address``), Linux is booted with it once the BIOS prompt is reached; ``until`` must
+    then be ``"linux"``. The output of the boot itself is not saved.
+
+    The result has the ``leveling`` and ``memtest`` events of ``bios.BiosParser`` (without
+    their type), the memory speed, the time each Linux milestone was reached at, and the
+    statistics of the serial boot, if any.
+    """
+    if until not in ("bios", "linux"):
+        raise ValueError("Unknown end of test {!r}; expected 'bios' or 'linux'".format(until))
+    if boot is not None and until != "linux":
+        raise ValueError("A serial boot must be followed until Linux")
+    result = {
+        "board":    board["name"],
+        "port":     board["port"],
+        "passed":   False,
+        "leveling": [],
+        "memtest":  None,
+        "memspeed": None,
+        "linux":    {},
+        "boot":     None,
+        "error":    None,
+    }
+    start = time.monotonic()
+    log = None
+    if log_dir is not None:
+        log = open(os.path.join(log_dir, "{}.log".format(board["name"])), "wb")
+    try:
+        console = await open_console(board["port"], baudrate)
+        try:
+            if program is not None:
+                await _program(board, program)
+            else:
+                console.write(b"\nreboot\n")
+            await asyncio.wait_for(_test(console, result, log, until, boot), timeout)
+        finally:
+            console.close()
+    except asyncio.TimeoutError:
+        result["error"] = "timeout after {:g}s".format(timeout)
+    except (OSError, EOFError, RuntimeError, ValueError, BootError) as e:
+        result["error"] = str(e)
+    finally:
+        if log is not None:
+            log.close()
+
+    result["passed"] = (result["error"] is None and result["memtest"] is not None and
+                        result["memtest"]["passed"])
+    result["time"] = time.monotonic() - start
+    return result
+
+
+async def run_boards(boards, jobs=None, callback=None, **kwargs):
+    """
+    Test ``boards`` concurrently, at most ``jobs`` at a time (all of them by default), and
+    return their results in the same order. ``callback`` is called with each result as soon
+    as it is available. Remaining arguments are passed to ``test_board``.
+    """
+    semaphore = asyncio.Semaphore(jobs or len(boards) or 1)
+    async def run(board):
+        async with semaphore:
+            result = await test_board(board, **kwargs)
+        if callback is not None:
+            callback(result)
+        return result
+    return await asyncio.gather(*(run(board) for board in boards))
+
+
+def _format_result(result):
+    details = []
+    margins = [window["margin"] for window in result["leveling"] if window["margin"] is not None]
+    if margins:
+        details.append("leveling margin {}".format(min(margins)))
+    if result["memtest"] is not None:
+        details.append("memtest {}".format("OK" if result["memtest"]["passed"] else "KO"))
+    if result["memspeed"] is not None:
+        details.append("write {write:.1f}MiB/s, read {read:.1f}MiB/s".format(**result["memspeed"]))
+    if result["boot"] is not None:
+        details.append("serial boot in {:.1f}s".format(result["boot"]["time"]))
+    if "login" in result["linux"]:
+        details.append("login after {:.1f}s".format(result["linux"]["login"]))
+    if result["error"] is not None:
+        details.append(result["error"])
+    return "{}: {} in {:.1f}s ({})".format(result["board"], "PASS" if result["passed"] else "FAIL",
+                                          result["time"], ", ".join(details))
+
+
+def _parse_board(spec):
+    name, sep, port = spec.rpartition("=")
+    if not sep:
+        name = os.path.basename(port)
+    return {"name": name, "port": port}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Test boards concurrently through their serial consoles.")
+    parser.add_argument("boards", nargs="*", metavar="[NAME=]PORT",
+        help="serial port of a board, optionally named")
+    parser.add_argument("--config", default=None,
+        help="JSON file listing boards, as dicts with at least 'name' and 'port'")
+    parser.add_argument("--baudrate", type=int, default=1_000_000,
+        help="(default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=30.0,
+        help="time allowed for each board, in seconds (default: %(default)s)")
+    parser.add_argument("--program", default=None, metavar="COMMAND",
+        help="command programming a board, with {field} replaced by the fields of the board; "
+             "without it, running boards are rebooted")
+    parser.add_argument("--until", choices=("bios", "linux"), default="bios",
+        help="end each test when the BIOS is done initializing, or when Linux reaches its "
+             "login prompt (default: %(default)s)")
+    parser.add_argument("--boot", default=None, metavar="BOOT_JSON",
+        help="boot the images of BOOT_JSON from the BIOS prompt with the fast serial boot, "
+             "and test until the Linux login prompt")
+    parser.add_argument("--stub", default=None,
+        help="binary of the serial boot stub (default: stub/stub.bin next to BOOT_JSON)")
+    parser.add_argument("--jobs", type=int, default=None,
+        help="maximum number of boards tested at once (default: all)")
+    parser.add_argument("--log-dir", default=None,
+        help="directory to save the console output of each board to")
+    parser.add_argument("--json", default=None, metavar="FILE",
+        help="write the results to FILE as JSON")
+
+    args = parser.parse_args(argv)
+    boards = [_parse_board(spec) for spec in args.boards]
+    if args.config is not None:
+        with open(args.config) as f:
+            boards += json.load(f)
+    if not boards:
+        parser.error("no boards given")
+    if args.log_dir is not None:
+        os.makedirs(args.log_dir, exist_ok=True)
+    boot = None
+    if args.boot is not None:
+        stub = args.stub or os.path.join(os.path.dirname(args.boot), "stub", "stub.bin")
+        try:
+            images, address, boot_args = load_images(args.boot)
+            with open(stub, "rb") as f:
+                boot = {"images": images, "address": address, "args": boot_args,
+                        "stub": f.read(), "baudrate": args.baudrate}
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    start = time.monotonic()
+    results = asyncio.run(run_boards(boards, jobs=args.jobs,
+        callback=lambda result: print(_format_result(result), flush=True),
+        baudrate=args.baudrate, timeout=args.timeout, program=args.program,
+        log_dir=args.log_dir, until="linux" if boot is not None else args.until, boot=boot))
+    elapsed = time.monotonic() - start
+
+    passed = sum(result["passed"] for result in results)
+    print("{}/{} passed in {:.1f}s ({:.0f} boards/hour)".format(
+        passed, len(results), elapsed, len(results) / elapsed * 3600))
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
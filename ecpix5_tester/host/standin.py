@@ -0,0 +1,407 @@
+"""
+Pseudo-terminal stand-ins for boards, replaying recorded console output, to exercise the
+host tools without hardware.
+
+    $ python -m ecpix5_tester.host.standin --count 4 --recording bios_ok.log
+    $ python -m ecpix5_tester.host.standin --serialboot --recording boot_linux.log
+"""
+
+import os
+import re
+import pty
+import tty
+import zlib
+import random
+import struct
+import asyncio
+import binascii
+from importlib import resources
+
+from . import recordings
+from .boot import (MAIN_RAM_BASE, STAGING_BASE, STUB_ADDRESS, read_frame, encode_frame,
+                   SFL_MAGIC_REQ, SFL_MAGIC_ACK, SFL_CMD_ABORT, SFL_CMD_LOAD, SFL_CMD_JUMP,
+                   SFL_ACK_SUCCESS, SFL_ACK_CRCERROR, STUB_VERSION, HOST_MAGIC, STUB_MAGIC,
+                   CMD_HELLO, CMD_CHECKSUM, CMD_DATA, CMD_BOOT, STATUS_OK, STATUS_CRC,
+                   STATUS_ERROR, ERROR_COMMAND, ERROR_RANGE, ERROR_FULL, ERROR_INFLATE,
+                   ERROR_CHECK, MAX_CHUNK, MAX_CHECKSUMS, MAX_PAYLOAD)
+
+
+__all__ = ["RECORDINGS", "load_recording", "BoardStandIn", "SerialBootStandIn"]
+
+
+RECORDINGS = ("bios_ok.log", "bios_memtest_ko.log", "boot_linux.log")
+
+
+def load_recording(name):
+    """
+    Return the recording ``name``: either one of ``RECORDINGS``, or the path of a file.
+    """
+    if name in RECORDINGS:
+        return resources.read_binary(recordings, name)
+    with open(name, "rb") as f:
+        return f.read()
+
+
+class BoardStandIn:
+    """
+    Board console on a pseudo-terminal, whose path is ``self.path``.
+    Each time a line containing ``trigger`` is received, as the LiteX BIOS ``reboot``
+    command, the ``recording`` is replayed from the start; with ``replay_on_start``, it is
+    also replayed once when ``serve`` is started, as after programming. The output is paced
+    as a UART at ``baudrate`` would send it, or sent at once if ``baudrate`` is ``None``.
+    """
+    def __init__(self, recording, baudrate=1_000_000, trigger=b"reboot", replay_on_start=False):
+        self.recording = recording
+        self.baudrate  = baudrate
+        self.trigger   = trigger
+        self.replay_on_start = replay_on_start
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.path = os.ttyname(self._slave)
+
+        self._replay = None
+
+    def close(self):
+        os.close(self._master)
+        os.close(self._slave)
+
+    async def _write(self, data):
+        loop = asyncio.get_running_loop()
+        while data:
+            try:
+                data = data[os.write(self._master, data):]
+            except BlockingIOError:
+                writable = loop.create_future()
+                loop.add_writer(self._master, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(self._master)
+
+    async def _send(self, data):
+        chunk = 64
+        for offset in range(0, len(data), chunk):
+            await self._write(data[offset:offset + chunk])
+            if self.baudrate is not None:
+                await asyncio.sleep(len(data[offset:offset + chunk]) * 10 / self.baudrate)
+
+    async def replay(self):
+        await self._send(self.recording)
+
+    def _restart(self):
+        if self._replay is not None:
+            self._replay.cancel()
+        self._replay = asyncio.ensure_future(self.replay())
+
+    async def serve(self):
+        """
+        Answer the console until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        received = asyncio.Queue()
+        def read_ready():
+            try:
+                received.put_nowait(os.read(self._master, 4096))
+            except (BlockingIOError, OSError):
+                # The master reports EIO while no process has the terminal open.
+                pass
+
+        if self.replay_on_start:
+            self._restart()
+        loop.add_reader(self._master, read_ready)
+        try:
+            line = b""
+            while True:
+                line += await received.get()
+                *lines, line = line.replace(b"\r", b"\n").split(b"\n")
+                if any(self.trigger in l for l in lines):
+                    self._restart()
+        finally:
+            loop.remove_reader(self._master)
+            if self._replay is not None:
+                self._replay.cancel()
+
+
+# LiteX BIOS output around serial boots.
+_SERIALBOOT         = b"Booting from serial...\nPress Q or ESC to abort boot completely.\n"
+_SERIALBOOT_TIMEOUT = b"             Timeout\n"
+_PROMPT             = b"\nlitex> "
+_LIFTOFF            = b"\n--============= Liftoff! ===============--\n"
+_RECORDED_LIFTOFF   = re.compile(rb"--=+ Liftoff! =+--\r?\n")
+
+# The BIOS tests (and overwrites) this much memory each time it starts.
+_MEMTEST_SIZE = 2 * 1024 * 1024
+
+# Constants of firmware/stub/main.c that the host learns from ``CMD_HELLO``.
+_STUB_WINDOW  = 16
+_STAGING_SIZE = STUB_ADDRESS - STAGING_BASE - MAX_PAYLOAD
+
+
+class _Memory:
+    # Sparse memory, random until written, as DRAM after power-up.
+    PAGE = 64 * 1024
+
+    def __init__(self, seed):
+        self._pages  = {}
+        self._random = random.Random(seed)
+
+    def _page(self, number):
+        if number not in self._pages:
+            self._pages[number] = bytearray(self._random.randbytes(self.PAGE))
+        return self._pages[number]
+
+    def read(self, address, length):
+        data = bytearray()
+        while length > 0:
+            offset = address % self.PAGE
+            size = min(length, self.PAGE - offset)
+            data += self._page(address // self.PAGE)[offset:offset + size]
+            address += size
+            length  -= size
+        return bytes(data)
+
+    def write(self, address, data):
+        while data:
+            offset = address % self.PAGE
+            size = min(len(data), self.PAGE - offset)
+            self._page(address // self.PAGE)[offset:offset + size] = data[:size]
+            address += size
+            data = data[size:]
+
+
+class SerialBootStandIn(BoardStandIn):
+    """
+    Board stand-in that also answers the serialboot of the BIOS, and runs a model of the
+    serial boot stub (see ``boot``) when it is loaded and jumped to, over a model of the main
+    RAM that is kept from boot to boot.
+
+    The ``recording`` is replayed up to the serialboot request of the BIOS. If the serialboot
+    times out, the rest of the recording is replayed, unless it is a Linux boot; if the stub
+    boots, only the output of the recording after ``Liftoff`` is. Each replay overwrites the
+    memory tested by the BIOS. The ``serialboot`` command also requests a serialboot.
+    Input is ignored while output is replayed.
+
+    Received frames are paced as a UART at ``baudrate`` would receive them, and each is
+    corrupted with probability ``errors``, to exercise retransmissions.
+    """
+    def __init__(self, recording, baudrate=1_000_000, trigger=b"reboot", replay_on_start=False,
+                 errors=0.0, seed=0):
+        super().__init__(recording, baudrate, trigger, replay_on_start)
+        self.errors  = errors
+        self.memory  = _Memory(seed)
+        self._random = random.Random(seed)
+
+        request = recording.find(SFL_MAGIC_REQ)
+        if request < 0:
+            self._bios, rest = recording, b""
+        else:
+            self._bios = recording[:recording.index(b"\n", request) + 1]
+            rest = recording[len(self._bios):]
+        liftoff = _RECORDED_LIFTOFF.search(rest)
+        if liftoff is None:
+            self._timeout, self._linux = rest, b""
+        else:
+            self._timeout, self._linux = _SERIALBOOT_TIMEOUT + _PROMPT, rest[liftoff.end():]
+
+    async def _pace(self, length):
+        if self.baudrate is not None:
+            await asyncio.sleep(length * 10 / self.baudrate)
+
+    async def _readline(self):
+        line = b""
+        while True:
+            char = await self._reader.readexactly(1)
+            if char in b"\r\n":
+                return line
+            line += char
+
+    async def serve(self):
+        """
+        Answer the console until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        self._reader = asyncio.StreamReader()
+        def read_ready():
+            try:
+                self._reader.feed_data(os.read(self._master, 65536))
+            except (BlockingIOError, OSError):
+                pass
+
+        loop.add_reader(self._master, read_ready)
+        try:
+            restart = self.replay_on_start
+            while True:
+                if restart:
+                    self.memory.write(MAIN_RAM_BASE, self._random.randbytes(_MEMTEST_SIZE))
+                    await self._send(self._bios)
+                    if SFL_MAGIC_REQ in self._bios:
+                        await self._serialboot(self._timeout)
+                line = await self._readline()
+                restart = self.trigger in line
+                if not restart and b"serialboot" in line:
+                    await self._send(_SERIALBOOT + SFL_MAGIC_REQ + b"\n")
+                    await self._serialboot(_SERIALBOOT_TIMEOUT + _PROMPT)
+        finally:
+            loop.remove_reader(self._master)
+
+    async def _serialboot(self, timeout_output):
+        try:
+            await asyncio.wait_for(self._reader.readuntil(SFL_MAGIC_ACK), 0.5)
+        except asyncio.TimeoutError:
+            await self._send(timeout_output)
+            return
+
+        while True:
+            header = await self._reader.readexactly(4)
+            length, crc, command = struct.unpack(">BHB", header)
+            payload = await self._reader.readexactly(length)
+            await self._pace(len(header) + length)
+            if binascii.crc_hqx(bytes([command]) + payload, 0) != crc:
+                await self._write(SFL_ACK_CRCERROR)
+                continue
+            await self._write(SFL_ACK_SUCCESS)
+            if command == SFL_CMD_LOAD:
+                self.memory.write(struct.unpack(">I", payload[:4])[0], payload[4:])
+            elif command == SFL_CMD_JUMP:
+                address, = struct.unpack(">I", payload[:4])
+                await self._send("Executing booted program at 0x{:08x}\n".format(
+                    address).encode() + _LIFTOFF)
+                if address == STUB_ADDRESS:
+                    await self._run_stub()
+                # Anything else is left hanging, until rebooted.
+                return
+            elif command == SFL_CMD_ABORT:
+                return
+
+    async def _reply(self, status, seq, payload=b""):
+        await self._write(encode_frame(STUB_MAGIC, status, seq, payload))
+
+    async def _run_stub(self):
+        # Model of firmware/stub/main.c.
+        chunks   = []
+        staged   = 0
+        expected = 0
+        while True:
+            frame = await read_frame(self._reader, HOST_MAGIC)
+            if frame is not None:
+                await self._pace(len(frame[2]) + 11)
+                if self._random.random() < self.errors:
+                    frame = None
+            if frame is None:
+                await self._reply(STATUS_CRC, expected)
+                continue
+
+            command, seq, payload = frame
+            if command == CMD_HELLO:
+                chunks, staged, expected = [], 0, 0
+                await self._reply(STATUS_OK, seq, struct.pack("<BBxxII",
+                    STUB_VERSION, _STUB_WINDOW, MAX_CHUNK, _STAGING_SIZE))
+
+            elif command == CMD_CHECKSUM and len(payload) == 12:
+                address, size, block = struct.unpack("<III", payload)
+                if block == 0 or size > MAX_CHECKSUMS * block:
+                    await self._reply(STATUS_ERROR, seq, struct.pack("<II", ERROR_COMMAND, 0))
+                    continue
+                data = self.memory.read(address, size)
+                await self._reply(STATUS_OK, seq, b"".join(
+                    struct.pack("<I", zlib.crc32(data[offset:offset + block]))
+                    for offset in range(0, size, block)))
+
+            elif command == CMD_DATA:
+                if seq != expected:
+                    if (expected - seq) & 0xff <= _STUB_WINDOW:
+                        await self._reply(STATUS_OK, (expected - 1) & 0xff)
+                    continue
+                if len(payload) < 12:
+                    await self._reply(STATUS_ERROR, seq, struct.pack("<II", ERROR_COMMAND, 0))
+                    continue
+                address, length, crc = struct.unpack("<III", payload[:12])
+                if length > MAX_CHUNK:
+                    error = ERROR_COMMAND
+                elif address < MAIN_RAM_BASE or address + length > STAGING_BASE:
+                    error = ERROR_RANGE
+                elif staged + len(payload) + 4 + MAX_PAYLOAD > STUB_ADDRESS - STAGING_BASE:
+                    error = ERROR_FULL
+                else:
+                    error = 0
+                if error:
+                    await self._reply(STATUS_ERROR, seq, struct.pack("<II", error, 0))
+                    continue
+                chunks.append((address, length, crc, payload[12:]))
+                staged += (len(payload) + 3) & ~3
+                await self._reply(STATUS_OK, seq)
+                expected = (expected + 1) & 0xff
+
+            elif command == CMD_BOOT and len(payload) == 16:
+                for index, (address, length, crc, data) in enumerate(chunks):
+                    decompress = zlib.decompressobj(-15)
+                    try:
+                        data = decompress.decompress(data, length)
+                        error = 0 if decompress.eof else ERROR_INFLATE
+                    except zlib.error:
+                        data, error = b"", ERROR_INFLATE
+                    self.memory.write(address, data)
+                    if not error and (len(data) != length or zlib.crc32(data) != crc):
+                        error = ERROR_CHECK
+                    if error:
+                        await self._reply(STATUS_ERROR, seq, struct.pack("<II", error, index))
+                        break
+                else:
+                    await self._reply(STATUS_OK, seq, struct.pack("<I", len(chunks)))
+                    await self._send(self._linux)
+                    return
+
+            else:
+                await self._reply(STATUS_ERROR, seq, struct.pack("<II", ERROR_COMMAND, 0))
+
+
+def main(argv=None):
+    import argparse
+    import itertools
+
+    parser = argparse.ArgumentParser(
+        description="Run board stand-ins on pseudo-terminals, and print their paths.")
+    parser.add_argument("--count", type=int, default=1,
+        help="number of stand-ins (default: %(default)s)")
+    parser.add_argument("--recording", action="append",
+        help="recording to replay, one of {} or a file; repeat to cycle through several "
+             "(default: {})".format(", ".join(RECORDINGS), RECORDINGS[0]))
+    parser.add_argument("--baudrate", type=int, default=1_000_000,
+        help="rate to replay at, 0 for as fast as possible (default: %(default)s)")
+    parser.add_argument("--replay-on-start", action="store_true",
+        help="replay the recording once when starting, as after programming")
+    parser.add_argument("--serialboot", action="store_true",
+        help="answer the BIOS serialboot, and run a model of the serial boot stub")
+    parser.add_argument("--errors", type=float, default=0.0, metavar="P",
+        help="with --serialboot, probability that a frame sent to the stub is corrupted "
+             "(default: %(default)s)")
+
+    args = parser.parse_args(argv)
+    names = itertools.cycle(args.recording or RECORDINGS[:1])
+    if args.serialboot:
+        standins = [SerialBootStandIn(load_recording(next(names)), args.baudrate or None,
+                                      replay_on_start=args.replay_on_start,
+                                      errors=args.errors, seed=index)
+                    for index in range(args.count)]
+    else:
+        standins = [BoardStandIn(load_recording(next(names)), args.baudrate or None,
+                                 replay_on_start=args.replay_on_start)
+                    for _ in range(args.count)]
+    for standin in standins:
+        print(standin.path, flush=True)
+
+    async def serve():
+        await asyncio.gather(*(standin.serve() for standin in standins))
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for standin in standins:
+            standin.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,14 @@
 # Copyright (C) 2018 whitequark@whitequark.org
 # I2C reference: https://www.nxp.com/docs/en/user-guide/UM10204.pdf
 
-from nmigen.compat import *
-from nmigen.compat.genlib.cdc import MultiReg
+from nmigen import *
+from nmigen.lib.cdc import FFSynchronizer
 
 
 __all__ = ["I2CInitiator", "I2CTarget"]
 
 
-class I2CBus(Module):
+class I2CBus(Elaboratable):
     """
     I2C bus.
     Decodes bus conditions (start, stop, sample and setup) and provides synchronization.
@@ -27,12 +27,13 @@ class I2CBus(Module):
         self.start  = Signal(name="bus_start")
         self.stop   = Signal(name="bus_stop")
 
-        ###
+    def elaborate(self, platform):
+        m = Module()
 
         scl_r = Signal(reset=1)
         sda_r = Signal(reset=1)
 
-        self.comb += [
+        m.d.comb += [
             self.scl_t.o.eq(0),
             self.scl_t.oe.eq(~self.scl_o),
             self.sda_t.o.eq(0),
@@ -43,17 +44,17 @@ class I2CBus(Module):
             self.start.eq(self.scl_i & sda_r & ~self.sda_i),
             self.stop.eq(self.scl_i & ~sda_r & self.sda_i),
         ]
-        self.sync += [
+        m.d.sync += [
             scl_r.eq(self.scl_i),
             sda_r.eq(self.sda_i),
         ]
-        self.specials += [
-            MultiReg(self.scl_t.i, self.scl_i, reset=1),
-            MultiReg(self.sda_t.i, self.sda_i, reset=1),
-        ]
+        m.submodules.scl_sync = FFSynchronizer(self.scl_t.i, self.scl_i, reset=1)
+        m.submodules.sda_sync = FFSynchronizer(self.sda_t.i, self.sda_i, reset=1)
+
+        return m
 
 
-class I2CInitiator(Module):
+class I2CInitiator(Elaboratable):
     """
     Simple I2C transaction initiator.
     Generates start and stop conditions, and transmits and receives octets.
@@ -91,6 +92,9 @@ class I2CInitiator(Module):
         Acknowledge bit to be transmitted. Latched immediately after ``read`` is asserted.
     """
     def __init__(self, pads, period_cyc, clk_stretch=True):
+        self.period_cyc  = int(period_cyc)
+        self.clk_stretch = clk_stretch
+
         self.busy   = Signal(reset=1)
         self.start  = Signal()
         self.stop   = Signal()
@@ -101,153 +105,151 @@ class I2CInitiator(Module):
         self.data_o = Signal(8)
         self.ack_i  = Signal()
 
-        self.submodules.bus = bus = I2CBus(pads)
+        self.bus = I2CBus(pads)
 
-        ###
+    def elaborate(self, platform):
+        m = Module()
 
-        period_cyc = int(period_cyc)
+        m.submodules.bus = bus = self.bus
 
-        timer = Signal(max=period_cyc)
+        timer = Signal(range(self.period_cyc))
         stb   = Signal()
 
-        self.sync += [
-            If((timer == 0) | ~self.busy,
-                timer.eq(period_cyc // 4)
-            ).Elif((not clk_stretch) | (bus.scl_o == bus.scl_i),
-                timer.eq(timer - 1)
-            )
-        ]
-        self.comb += stb.eq(timer == 0)
+        if self.clk_stretch:
+            scl_settled = bus.scl_o == bus.scl_i
+        else:
+            scl_settled = C(1)
+
+        with m.If((timer == 0) | ~self.busy):
+            m.d.sync += timer.eq(self.period_cyc // 4)
+        with m.Elif(scl_settled):
+            m.d.sync += timer.eq(timer - 1)
+        m.d.comb += stb.eq(timer == 0)
 
-        bitno   = Signal(max=8)
+        bitno   = Signal(range(8))
         r_shreg = Signal(8)
         w_shreg = Signal(8)
         r_ack   = Signal()
 
-        self.submodules.fsm = FSM(reset_state="IDLE")
-
         def scl_l(state, next_state, *exprs):
-            self.fsm.act(state,
-                If(stb,
-                   NextValue(bus.scl_o, 0),
-                   NextState(next_state),
-                   *exprs
-                )
-            )
+            with m.State(state):
+                with m.If(stb):
+                    m.d.sync += bus.scl_o.eq(0)
+                    m.d.sync += exprs
+                    m.next = next_state
+
         def scl_h(state, next_state, *exprs):
-            self.fsm.act(state,
-                If(stb,
-                    NextValue(bus.scl_o, 1)
-                ).Elif(bus.scl_o == 1,
-                    If((not clk_stretch) | (bus.scl_i == 1),
-                        NextState(next_state),
-                        *exprs
-                    )
-                )
-            )
+            with m.State(state):
+                with m.If(stb):
+                    m.d.sync += bus.scl_o.eq(1)
+                with m.Elif(bus.scl_o == 1):
+                    with m.If(~C(self.clk_stretch) | (bus.scl_i == 1)):
+                        m.d.sync += exprs
+                        m.next = next_state
+
         def stb_x(state, next_state, *exprs):
-            self.fsm.act(state,
-                If(stb,
-                    NextState(next_state),
-                    *exprs
-                )
-            )
+            with m.State(state):
+                with m.If(stb):
+                    m.d.sync += exprs
+                    m.next = next_state
 
-        self.fsm.act("IDLE",
-            NextValue(self.busy, 1),
-            If(self.start,
-                If(bus.scl_i & bus.sda_i,
-                    NextState("START-SDA-L")
-                ).Elif(~bus.scl_i,
-                    NextState("START-SCL-H")
-                ).Elif(bus.scl_i,
-                    NextState("START-SCL-L")
-                )
-            ).Elif(self.stop,
-                If(bus.scl_i & ~bus.sda_o,
-                    NextState("STOP-SDA-H")
-                ).Elif(~bus.scl_i,
-                    NextState("STOP-SCL-H")
-                ).Elif(bus.scl_i,
-                    NextState("STOP-SCL-L")
-                )
-            ).Elif(self.write,
-                NextValue(w_shreg, self.data_i),
-                NextState("WRITE-DATA-SCL-L")
-            ).Elif(self.read,
-                NextValue(r_ack, self.ack_i),
-                NextState("READ-DATA-SCL-L")
-            ).Else(
-                NextValue(self.busy, 0)
+        with m.FSM(reset="IDLE"):
+            with m.State("IDLE"):
+                m.d.sync += self.busy.eq(1)
+                with m.If(self.start):
+                    with m.If(bus.scl_i & bus.sda_i):
+                        m.next = "START-SDA-L"
+                    with m.Elif(~bus.scl_i):
+                        m.next = "START-SCL-H"
+                    with m.Elif(bus.scl_i):
+                        m.next = "START-SCL-L"
+                with m.Elif(self.stop):
+                    with m.If(bus.scl_i & ~bus.sda_o):
+                        m.next = "STOP-SDA-H"
+                    with m.Elif(~bus.scl_i):
+                        m.next = "STOP-SCL-H"
+                    with m.Elif(bus.scl_i):
+                        m.next = "STOP-SCL-L"
+                with m.Elif(self.write):
+                    m.d.sync += w_shreg.eq(self.data_i)
+                    m.next = "WRITE-DATA-SCL-L"
+                with m.Elif(self.read):
+                    m.d.sync += r_ack.eq(self.ack_i)
+                    m.next = "READ-DATA-SCL-L"
+                with m.Else():
+                    m.d.sync += self.busy.eq(0)
+
+            # start
+            scl_l("START-SCL-L", "START-SDA-H")
+            stb_x("START-SDA-H", "START-SCL-H",
+                bus.sda_o.eq(1)
+            )
+            scl_h("START-SCL-H", "START-SDA-L")
+            stb_x("START-SDA-L", "IDLE",
+                bus.sda_o.eq(0)
+            )
+            # stop
+            scl_l("STOP-SCL-L",  "STOP-SDA-L")
+            stb_x("STOP-SDA-L",  "STOP-SCL-H",
+                bus.sda_o.eq(0)
+            )
+            scl_h("STOP-SCL-H",  "STOP-SDA-H")
+            stb_x("STOP-SDA-H",  "IDLE",
+                bus.sda_o.eq(1)
+            )
+            # write data
+            scl_l("WRITE-DATA-SCL-L", "WRITE-DATA-SDA-X")
+            stb_x("WRITE-DATA-SDA-X", "WRITE-DATA-SCL-H",
+                bus.sda_o.eq(w_shreg[7])
+            )
+            scl_h("WRITE-DATA-SCL-H", "WRITE-DATA-SDA-N",
+                w_shreg.eq(Cat(C(0, 1), w_shreg[0:7]))
             )
-        )
-        # start
-        scl_l("START-SCL-L", "START-SDA-H")
-        stb_x("START-SDA-H", "START-SCL-H",
-            NextValue(bus.sda_o, 1)
-        )
-        scl_h("START-SCL-H", "START-SDA-L")
-        stb_x("START-SDA-L", "IDLE",
-            NextValue(bus.sda_o, 0)
-        )
-        # stop
-        scl_l("STOP-SCL-L",  "STOP-SDA-L")
-        stb_x("STOP-SDA-L",  "STOP-SCL-H",
-            NextValue(bus.sda_o, 0)
-        )
-        scl_h("STOP-SCL-H",  "STOP-SDA-H")
-        stb_x("STOP-SDA-H",  "IDLE",
-            NextValue(bus.sda_o, 1)
-        )
-        # write data
-        scl_l("WRITE-DATA-SCL-L", "WRITE-DATA-SDA-X")
-        stb_x("WRITE-DATA-SDA-X", "WRITE-DATA-SCL-H",
-            NextValue(bus.sda_o, w_shreg[7])
-        )
-        scl_h("WRITE-DATA-SCL-H", "WRITE-DATA-SDA-N",
-            NextValue(w_shreg, Cat(C(0, 1), w_shreg[0:7]))
-        )
-        stb_x("WRITE-DATA-SDA-N", "WRITE-DATA-SCL-L",
-            NextValue(bitno, bitno + 1),
-            If(bitno == 7,
-                NextState("WRITE-ACK-SCL-L")
+            with m.State("WRITE-DATA-SDA-N"):
+                with m.If(stb):
+                    m.d.sync += bitno.eq(bitno + 1)
+                    with m.If(bitno == 7):
+                        m.next = "WRITE-ACK-SCL-L"
+                    with m.Else():
+                        m.next = "WRITE-DATA-SCL-L"
+            # write ack
+            scl_l("WRITE-ACK-SCL-L", "WRITE-ACK-SDA-H")
+            stb_x("WRITE-ACK-SDA-H", "WRITE-ACK-SCL-H",
+                bus.sda_o.eq(1)
             )
-        )
-        # write ack
-        scl_l("WRITE-ACK-SCL-L", "WRITE-ACK-SDA-H")
-        stb_x("WRITE-ACK-SDA-H", "WRITE-ACK-SCL-H",
-            NextValue(bus.sda_o, 1)
-        )
-        scl_h("WRITE-ACK-SCL-H", "WRITE-ACK-SDA-N",
-            NextValue(self.ack_o, ~bus.sda_i)
-        )
-        stb_x("WRITE-ACK-SDA-N", "IDLE")
-        # read data
-        scl_l("READ-DATA-SCL-L", "READ-DATA-SDA-H")
-        stb_x("READ-DATA-SDA-H", "READ-DATA-SCL-H",
-            NextValue(bus.sda_o, 1)
-        )
-        scl_h("READ-DATA-SCL-H", "READ-DATA-SDA-N",
-            NextValue(r_shreg, Cat(bus.sda_i, r_shreg[0:7]))
-        )
-        stb_x("READ-DATA-SDA-N", "READ-DATA-SCL-L",
-            NextValue(bitno, bitno + 1),
-            If(bitno == 7,
-                NextState("READ-ACK-SCL-L")
+            scl_h("WRITE-ACK-SCL-H", "WRITE-ACK-SDA-N",
+                self.ack_o.eq(~bus.sda_i)
             )
-        )
-        # read ack
-        scl_l("READ-ACK-SCL-L", "READ-ACK-SDA-X")
-        stb_x("READ-ACK-SDA-X", "READ-ACK-SCL-H",
-            NextValue(bus.sda_o, ~r_ack),
-        )
-        scl_h("READ-ACK-SCL-H", "READ-ACK-SDA-N",
-            NextValue(self.data_o, r_shreg)
-        )
-        stb_x("READ-ACK-SDA-N", "IDLE")
-
-
-class I2CTarget(Module):
+            stb_x("WRITE-ACK-SDA-N", "IDLE")
+            # read data
+            scl_l("READ-DATA-SCL-L", "READ-DATA-SDA-H")
+            stb_x("READ-DATA-SDA-H", "READ-DATA-SCL-H",
+                bus.sda_o.eq(1)
+            )
+            scl_h("READ-DATA-SCL-H", "READ-DATA-SDA-N",
+                r_shreg.eq(Cat(bus.sda_i, r_shreg[0:7]))
+            )
+            with m.State("READ-DATA-SDA-N"):
+                with m.If(stb):
+                    m.d.sync += bitno.eq(bitno + 1)
+                    with m.If(bitno == 7):
+                        m.next = "READ-ACK-SCL-L"
+                    with m.Else():
+                        m.next = "READ-DATA-SCL-L"
+            # read ack
+            scl_l("READ-ACK-SCL-L", "READ-ACK-SDA-X")
+            stb_x("READ-ACK-SDA-X", "READ-ACK-SCL-H",
+                bus.sda_o.eq(~r_ack),
+            )
+            scl_h("READ-ACK-SCL-H", "READ-ACK-SDA-N",
+                self.data_o.eq(r_shreg)
+            )
+            stb_x("READ-ACK-SDA-N", "IDLE")
+
+        return m
+
+
+class I2CTarget(Elaboratable):
     """
     Simple I2C target.
     Clock stretching is not supported.
@@ -294,164 +296,157 @@ class I2CTarget(Module):
         self.data_o  = Signal(8)
         self.ack_i   = Signal()
 
-        self.submodules.axi = bus = I2CBus(pads)
+        self.bus = I2CBus(pads)
+
+    def elaborate(self, platform):
+        m = Module()
 
-        ###
+        m.submodules.bus = bus = self.bus
 
-        bitno   = Signal(max=8)
+        bitno   = Signal(range(8))
         shreg_i = Signal(8)
         shreg_o = Signal(8)
 
-        self.submodules.fsm = FSM(reset_state="IDLE")
-        self.fsm.act("IDLE",
-            If(bus.start,
-                NextState("START"),
-            )
-        )
-        self.fsm.act("START",
-            If(bus.stop,
-                # According to the spec, technically illegal, "but many devices handle
-                # this anyway". Can Philips, like, decide on whether they want it or not??
-                NextState("IDLE")
-            ).Elif(bus.setup,
-                NextValue(bitno, 0),
-                NextState("ADDR-SHIFT")
-            )
-        )
-        self.fsm.act("ADDR-SHIFT",
-            If(bus.stop,
-                NextState("IDLE")
-            ).Elif(bus.start,
-                NextState("START")
-            ).Elif(bus.sample,
-                NextValue(shreg_i, (shreg_i << 1) | bus.sda_i),
-            ).Elif(bus.setup,
-                NextValue(bitno, bitno + 1),
-                If(bitno == 7,
-                    If(shreg_i[1:] == self.address,
-                        self.start.eq(1),
-                        NextValue(bus.sda_o, 0),
-                        NextState("ADDR-ACK")
-                    ).Else(
-                        NextState("IDLE")
-                    )
-                )
-            )
-        )
-        self.fsm.act("ADDR-ACK",
-            If(bus.stop,
-                self.stop.eq(1),
-                NextState("IDLE")
-            ).Elif(bus.start,
-                self.restart.eq(1),
-                NextState("START")
-            ).Elif(bus.setup,
-                If(~shreg_i[0],
-                    NextValue(bus.sda_o, 1),
-                    NextState("WRITE-SHIFT")
-                )
-            ).Elif(bus.sample,
-                If(shreg_i[0],
-                    NextValue(shreg_o, self.data_o),
-                    NextState("READ-STRETCH")
-                )
-            )
-        )
-        self.fsm.act("WRITE-SHIFT",
-            If(bus.stop,
-                self.stop.eq(1),
-                NextState("IDLE")
-            ).Elif(bus.start,
-                self.restart.eq(1),
-                NextState("START")
-            ).Elif(bus.sample,
-                NextValue(shreg_i, (shreg_i << 1) | bus.sda_i),
-            ).Elif(bus.setup,
-                NextValue(bitno, bitno + 1),
-                If(bitno == 7,
-                    NextValue(self.data_i, shreg_i),
-                    NextState("WRITE-ACK")
-                )
-            )
-        )
-        self.comb += self.write.eq(self.fsm.after_entering("WRITE-ACK"))
-        self.fsm.act("WRITE-ACK",
-            If(bus.stop,
-                self.stop.eq(1),
-                NextState("IDLE")
-            ).Elif(bus.start,
-                self.restart.eq(1),
-                NextState("START")
-            ).Elif(bus.setup,
-                NextValue(bus.sda_o, 1),
-                NextState("WRITE-SHIFT")
-            ).Elif(~bus.scl_i,
-                NextValue(bus.scl_o, ~self.busy),
-                If(self.ack_o,
-                    NextValue(bus.sda_o, 0)
-                )
-            )
-        )
-        self.comb += self.read.eq(self.fsm.before_entering("READ-STRETCH"))
-        self.fsm.act("READ-STRETCH",
-            If(self.busy,
-                NextValue(shreg_o, self.data_o)
-            ),
-            If(bus.stop,
-                self.stop.eq(1),
-                NextState("IDLE")
-            ).Elif(bus.start,
-                NextState("START")
-            ).Elif(self.busy,
-                If(~bus.scl_i,
-                    NextValue(bus.scl_o, 0)
-                )
-            ).Else(
-                If(~bus.scl_i,
-                    NextValue(bus.sda_o, shreg_o[7])
-                ),
-                NextValue(bus.scl_o, 1),
-                NextState("READ-SHIFT")
-            )
-        )
-        self.fsm.act("READ-SHIFT",
-            If(bus.stop,
-                self.stop.eq(1),
-                NextState("IDLE")
-            ).Elif(bus.start,
-                self.restart.eq(1),
-                NextState("START")
-            ).Elif(bus.setup,
-                NextValue(bus.sda_o, shreg_o[7]),
-            ).Elif(bus.sample,
-                NextValue(shreg_o, shreg_o << 1),
-                NextValue(bitno, bitno + 1),
-                If(bitno == 7,
-                    NextState("READ-ACK")
-                )
-            )
-        )
-        self.fsm.act("READ-ACK",
-            If(bus.stop,
-                self.stop.eq(1),
-                NextState("IDLE")
-            ).Elif(bus.start,
-                self.restart.eq(1),
-                NextState("START")
-            ).Elif(bus.setup,
-                NextValue(bus.sda_o, 1),
-            ).Elif(bus.sample,
-                If(~bus.sda_i,
-                    NextValue(shreg_o, self.data_o),
-                    NextState("READ-STRETCH")
-                ).Else(
-                    self.stop.eq(1),
-                    NextState("IDLE")
-                )
-            )
-        )
+        # `write` is asserted for the first cycle spent in WRITE-ACK.
+        m.d.sync += self.write.eq(0)
+
+        with m.FSM(reset="IDLE"):
+            with m.State("IDLE"):
+                with m.If(bus.start):
+                    m.next = "START"
+
+            with m.State("START"):
+                with m.If(bus.stop):
+                    # According to the spec, technically illegal, "but many devices handle
+                    # this anyway". Can Philips, like, decide on whether they want it or not??
+                    m.next = "IDLE"
+                with m.Elif(bus.setup):
+                    m.d.sync += bitno.eq(0)
+                    m.next = "ADDR-SHIFT"
+
+            with m.State("ADDR-SHIFT"):
+                with m.If(bus.stop):
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.next = "START"
+                with m.Elif(bus.sample):
+                    m.d.sync += shreg_i.eq((shreg_i << 1) | bus.sda_i)
+                with m.Elif(bus.setup):
+                    m.d.sync += bitno.eq(bitno + 1)
+                    with m.If(bitno == 7):
+                        with m.If(shreg_i[1:] == self.address):
+                            m.d.comb += self.start.eq(1)
+                            m.d.sync += bus.sda_o.eq(0)
+                            m.next = "ADDR-ACK"
+                        with m.Else():
+                            m.next = "IDLE"
+
+            with m.State("ADDR-ACK"):
+                with m.If(bus.stop):
+                    m.d.comb += self.stop.eq(1)
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.d.comb += self.restart.eq(1)
+                    m.next = "START"
+                with m.Elif(bus.setup):
+                    with m.If(~shreg_i[0]):
+                        m.d.sync += bus.sda_o.eq(1)
+                        m.next = "WRITE-SHIFT"
+                with m.Elif(bus.sample):
+                    with m.If(shreg_i[0]):
+                        m.d.comb += self.read.eq(1)
+                        m.d.sync += shreg_o.eq(self.data_o)
+                        m.next = "READ-STRETCH"
+
+            with m.State("WRITE-SHIFT"):
+                with m.If(bus.stop):
+                    m.d.comb += self.stop.eq(1)
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.d.comb += self.restart.eq(1)
+                    m.next = "START"
+                with m.Elif(bus.sample):
+                    m.d.sync += shreg_i.eq((shreg_i << 1) | bus.sda_i)
+                with m.Elif(bus.setup):
+                    m.d.sync += bitno.eq(bitno + 1)
+                    with m.If(bitno == 7):
+                        m.d.sync += [
+                            self.data_i.eq(shreg_i),
+                            self.write.eq(1),
+                        ]
+                        m.next = "WRITE-ACK"
+
+            with m.State("WRITE-ACK"):
+                with m.If(bus.stop):
+                    m.d.comb += self.stop.eq(1)
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.d.comb += self.restart.eq(1)
+                    m.next = "START"
+                with m.Elif(bus.setup):
+                    m.d.sync += bus.sda_o.eq(1)
+                    m.next = "WRITE-SHIFT"
+                with m.Elif(~bus.scl_i):
+                    m.d.sync += bus.scl_o.eq(~self.busy)
+                    with m.If(self.ack_o):
+                        m.d.sync += bus.sda_o.eq(0)
+
+            with m.State("READ-STRETCH"):
+                with m.If(self.busy):
+                    m.d.sync += shreg_o.eq(self.data_o)
+                with m.If(bus.stop):
+                    m.d.comb += self.stop.eq(1)
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.next = "START"
+                with m.Elif(self.busy):
+                    with m.If(~bus.scl_i):
+                        m.d.sync += bus.scl_o.eq(0)
+                with m.Else():
+                    with m.If(~bus.scl_i):
+                        m.d.sync += bus.sda_o.eq(shreg_o[7])
+                    m.d.sync += bus.scl_o.eq(1)
+                    m.next = "READ-SHIFT"
+
+            with m.State("READ-SHIFT"):
+                with m.If(bus.stop):
+                    m.d.comb += self.stop.eq(1)
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.d.comb += self.restart.eq(1)
+                    m.next = "START"
+                with m.Elif(bus.setup):
+                    m.d.sync += bus.sda_o.eq(shreg_o[7])
+                with m.Elif(bus.sample):
+                    m.d.sync += [
+                        shreg_o.eq(shreg_o << 1),
+                        bitno.eq(bitno + 1),
+                    ]
+                    with m.If(bitno == 7):
+                        m.next = "READ-ACK"
+
+            with m.State("READ-ACK"):
+                with m.If(bus.stop):
+                    m.d.comb += self.stop.eq(1)
+                    m.next = "IDLE"
+                with m.Elif(bus.start):
+                    m.d.comb += self.restart.eq(1)
+                    m.next = "START"
+                with m.Elif(bus.setup):
+                    m.d.sync += bus.sda_o.eq(1)
+                with m.Elif(bus.sample):
+                    with m.If(~bus.sda_i):
+                        m.d.comb += self.read.eq(1)
+                        m.d.sync += shreg_o.eq(self.data_o)
+                        m.next = "READ-STRETCH"
+                    with m.Else():
+                        m.d.comb += self.stop.eq(1)
+                        m.next = "IDLE"
+
+        return m
+
 
-class _DummyPads(Module):
+class _DummyPads:
     def __init__(self):
-        self.scl_t = TSTriple()
-        self.sda_t = TSTriple()
+        self.scl_t = Record([("i", 1), ("o", 1), ("oe", 1)])
+        self.sda_t = Record([("i", 1), ("o", 1), ("oe", 1)])
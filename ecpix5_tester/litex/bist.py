@@ -0,0 +1,121 @@
+"""
+DDR3 bandwidth self-test, for inclusion in the LiteX SoC.
+
+This module is Migen/LiteX code, to be used when (re)generating the SoC; it is not imported
+by the nMigen design. It adds a LiteDRAM BIST generator and checker, each on its own native
+port of the controller's full width, and a histogram of the read latencies seen by the
+checker. Everything is controlled and read back through CSRs, which the host reaches through
+a UART bridge (UARTBone) on the ``serial`` pins; see ``ecpix5_tester.ddr_bist`` for the host
+side.
+"""
+
+from migen import *
+from migen.genlib.fifo import SyncFIFO
+
+from litex.soc.interconnect.csr import AutoCSR, CSR, CSRStatus, CSRStorage
+from litex.soc.cores.uart import UARTPHY, UARTBone
+
+from litedram.frontend.bist import LiteDRAMBISTGenerator, LiteDRAMBISTChecker
+
+
+__all__ = ["LatencyHistogram", "DDRBIST", "add_ddr_bist"]
+
+
+class LatencyHistogram(Module, AutoCSR):
+    """
+    Histogram of the latency of the read commands issued on a LiteDRAM native ``port``, from
+    the cycle the command is accepted to the cycle its data is returned.
+    Latencies are counted in ``nbins`` bins of ``2 ** shift`` cycles each; the last bin also
+    counts every longer latency. Up to ``depth`` reads can be in flight; enable the histogram
+    before starting the reads to be measured.
+    """
+    def __init__(self, port, nbins=16, depth=32, counter_width=32):
+        self.enable = CSRStorage(1)
+        self.clear  = CSR()
+        self.shift  = CSRStorage(4)
+        self.select = CSRStorage(bits_for(nbins - 1))
+        self.count  = CSRStatus(counter_width)
+        self.min    = CSRStatus(16, reset=2**16 - 1)
+        self.max    = CSRStatus(16)
+
+        # # #
+
+        now = Signal(16)
+        self.sync += now.eq(now + 1)
+
+        timestamps = SyncFIFO(16, depth)
+        self.submodules += timestamps
+
+        issued   = Signal()
+        returned = Signal()
+        self.comb += [
+            issued.eq(port.cmd.valid & port.cmd.ready & ~port.cmd.we),
+            returned.eq(port.rdata.valid & port.rdata.ready),
+            timestamps.din.eq(now),
+            timestamps.we.eq(issued & self.enable.storage & timestamps.writable),
+            timestamps.re.eq(returned & timestamps.readable),
+        ]
+
+        latency = Signal(16)
+        binned  = Signal(16)
+        index   = Signal(max=nbins)
+        self.comb += [
+            latency.eq(now - timestamps.dout),
+            binned.eq(latency >> self.shift.storage),
+            If(binned >= nbins - 1,
+                index.eq(nbins - 1)
+            ).Else(
+                index.eq(binned)
+            ),
+        ]
+
+        bins = Array(Signal(counter_width) for _ in range(nbins))
+        self.sync += [
+            If(self.clear.re,
+                *[b.eq(0) for b in bins],
+                self.min.status.eq(2**16 - 1),
+                self.max.status.eq(0),
+            ).Elif(returned & timestamps.readable,
+                bins[index].eq(bins[index] + 1),
+                If(latency < self.min.status,
+                    self.min.status.eq(latency)
+                ),
+                If(latency > self.max.status,
+                    self.max.status.eq(latency)
+                ),
+            ),
+            self.count.status.eq(bins[self.select.storage]),
+        ]
+
+
+class DDRBIST(Module, AutoCSR):
+    """
+    Bandwidth self-test of the DDR3 controller ``sdram``. The generator writes, and the
+    checker reads back, sequential or random data at sequential or random addresses, in
+    bursts of the controller's native width; each reports the number of cycles it took.
+    """
+    def __init__(self, sdram, nbins=16):
+        write_port = sdram.crossbar.get_port()
+        read_port  = sdram.crossbar.get_port()
+
+        self.submodules.generator = LiteDRAMBISTGenerator(write_port)
+        self.submodules.checker   = LiteDRAMBISTChecker(read_port)
+        self.submodules.latency   = LatencyHistogram(read_port, nbins)
+
+        self.data_width = CSRStatus(16, reset=write_port.data_width)
+
+
+def add_ddr_bist(soc, nbins=16, baudrate=1_000_000):
+    """
+    Add a DDR bandwidth self-test to ``soc``, which must already have its SDRAM controller
+    (``soc.sdram``). Its CSRs are named ``ddr_bist_*``.
+
+    A UART bridge to the SoC bus is added on the ``serial`` pins, at ``baudrate``, for
+    ``litex_server``; the SoC console must not use them (e.g. ``uart_name="crossover"``).
+    """
+    soc.submodules.ddr_bist = DDRBIST(soc.sdram, nbins)
+
+    soc.submodules.uartbone_phy = UARTPHY(soc.platform.request("serial"), soc.sys_clk_freq,
+                                          baudrate)
+    soc.submodules.uartbone = UARTBone(soc.uartbone_phy, soc.sys_clk_freq)
+    soc.bus.add_master(name="uartbone", master=soc.uartbone.wishbone)
@@ -0,0 +1,209 @@
+"""
+Generator of the LiteX SoC wrapped by ``LitexSoC``.
+
+The SoC is described by the parameters in ``soc.json``; this script rebuilds ``ecpix5.v``,
+the VexRiscv SMP core and the memory initialization files from them, copies the results into
+this package, and records the parameters and the list of sources back into ``soc.json``.
+``LitexSoC`` derives its port list from the generated ``ecpix5.v``.
+
+It requires LiteX, LiteX-Boards, LiteDRAM, LiteEth, the VexRiscv SMP CPU data package, and a
+RISC-V toolchain to build the BIOS. Like ``bist.py``, it is Migen code and is not imported by
+the nMigen design.
+
+There is no DDR port width parameter: the width of the LiteDRAM native ports is set by the
+PHY, 128 bits for the ECP5 DDR3 PHY (1:2 rate, burst of 8) on the 16-bit memory of the
+ECPIX-5. What can be chosen is how the CPU reaches it: with ``wishbone_memory``, through the
+32-bit Wishbone bus and the L2 cache; otherwise, the VexRiscv SMP memory buses are native
+ports of that width.
+
+With ``--uart-name stream``, the UART of the SoC has no PHY: its byte streams are brought out
+to ``uart_stream_*`` ports, along with the SoC clock, and ``LitexSoC`` connects them to the
+USB console without going through serial lines (see ``soc.UART_STREAM_LAYOUT``).
+
+    $ python -m ecpix5_tester.litex.generate --l2-size 8192 --icache-size 8192 --dcache-size 8192
+"""
+
+import os
+import json
+import shutil
+import argparse
+
+
+__all__ = ["PACKAGE_DIR", "load_params", "cpu_args", "add_uart_stream_ports", "build_soc",
+           "generate"]
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_params():
+    """
+    Return the parameters the SoC in this package was generated with.
+    """
+    with open(os.path.join(PACKAGE_DIR, "soc.json")) as f:
+        return json.load(f)["params"]
+
+
+def cpu_args(params):
+    """
+    Return the VexRiscv SMP command line arguments, as accepted by ``VexRiscvSMP.args_fill``,
+    corresponding to ``params``.
+    """
+    args = [
+        "--cpu-count",    str(params["cpu_count"]),
+        "--icache-width", str(params["cpu_bus_width"]),
+        "--dcache-width", str(params["cpu_bus_width"]),
+        "--icache-size",  str(params["icache_size"]),
+        "--dcache-size",  str(params["dcache_size"]),
+        "--icache-ways",  str(params["icache_ways"]),
+        "--dcache-ways",  str(params["dcache_ways"]),
+        "--itlb-size",    str(params["itlb_size"]),
+        "--dtlb-size",    str(params["dtlb_size"]),
+    ]
+    if not params["out_of_order_decoder"]:
+        args.append("--without-out-of-order-decoder")
+    if params["wishbone_memory"]:
+        args.append("--with-wishbone-memory")
+    return args
+
+
+def add_uart_stream_ports(soc):
+    """
+    Bring the byte streams of the ``stream`` UART of ``soc`` out to ``uart_stream_*`` ports,
+    along with the SoC clock they are synchronous to.
+    """
+    from migen import ClockSignal
+    from litex.build.generic_platform import Pins, Subsignal
+
+    soc.platform.add_extension([
+        ("uart_stream", 0,
+            Subsignal("clk",      Pins(1)),
+            Subsignal("rx_data",  Pins(8)),
+            Subsignal("rx_valid", Pins(1)),
+            Subsignal("rx_ready", Pins(1)),
+            Subsignal("tx_data",  Pins(8)),
+            Subsignal("tx_valid", Pins(1)),
+            Subsignal("tx_ready", Pins(1)),
+        ),
+    ])
+    pads = soc.platform.request("uart_stream")
+    soc.comb += [
+        pads.clk.eq(ClockSignal("sys")),
+        soc.uart.sink.data.eq(pads.rx_data),
+        soc.uart.sink.valid.eq(pads.rx_valid),
+        pads.rx_ready.eq(soc.uart.sink.ready),
+        pads.tx_data.eq(soc.uart.source.data),
+        pads.tx_valid.eq(soc.uart.source.valid),
+        soc.uart.source.ready.eq(pads.tx_ready),
+    ]
+
+
+def build_soc(params):
+    """
+    Construct the LiteX SoC described by ``params``.
+    """
+    from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
+    from litex_boards.targets.lambdaconcept_ecpix5 import BaseSoC
+
+    if params["with_ddr_bist"] and params["uart_name"] == "serial":
+        raise ValueError("The DDR BIST bridges the SoC bus to the UART pins, so the console "
+                         "cannot use them; use e.g. --uart-name crossover")
+
+    # The VexRiscv SMP configuration is global to its class, and is normally read from the
+    # command line.
+    parser = argparse.ArgumentParser()
+    VexRiscvSMP.args_fill(parser)
+    VexRiscvSMP.args_read(parser.parse_args(cpu_args(params)))
+
+    soc = BaseSoC(
+        device          = params["device"],
+        sys_clk_freq    = int(params["sys_clk_freq"]),
+        with_ethernet   = params["with_ethernet"],
+        with_led_chaser = params["with_led_chaser"],
+        cpu_type        = "vexriscv_smp",
+        cpu_variant     = params["cpu_variant"],
+        uart_name       = params["uart_name"],
+        uart_baudrate   = params["uart_baudrate"],
+        integrated_sram_size = params["sram_size"],
+        l2_size         = params["l2_size"],
+    )
+    if params["uart_name"] == "stream":
+        add_uart_stream_ports(soc)
+    if params["with_ddr_bist"]:
+        from .bist import add_ddr_bist
+        add_ddr_bist(soc, baudrate=params["uart_baudrate"])
+    return soc
+
+
+def generate(params, build_dir="build/litex", output_dir=PACKAGE_DIR):
+    """
+    Generate the SoC described by ``params`` in ``build_dir``, and copy its sources into
+    ``output_dir``, along with a ``soc.json`` that records ``params`` and the sources.
+    Returns the list of sources.
+    """
+    from litex.soc.integration.builder import Builder
+
+    # ``LitexSoC`` instantiates the SoC as ``ecpix5``, whatever the board target calls it.
+    top_name = "ecpix5"
+
+    soc = build_soc(params)
+    builder = Builder(soc, output_dir=build_dir, compile_gateware=False,
+                      csr_csv=os.path.join(build_dir, "csr.csv"))
+    builder.build(build_name=top_name, run=False)
+
+    gateware_dir = os.path.join(build_dir, "gateware")
+
+    # CPU sources first, then memory initialization files, then the SoC itself; this is the
+    # order in which they are added to the nMigen platform. Recent LiteX versions list the
+    # SoC itself among the platform sources too.
+    sources = []
+    for source in soc.platform.sources:
+        filename = source[0]
+        if filename.endswith(".v") and os.path.basename(filename) != "{}.v".format(top_name):
+            shutil.copy(filename, output_dir)
+            sources.append(os.path.basename(filename))
+    for filename in sorted(os.listdir(gateware_dir)):
+        if filename.endswith(".init"):
+            shutil.copy(os.path.join(gateware_dir, filename), output_dir)
+            sources.append(filename)
+    shutil.copy(os.path.join(gateware_dir, "{}.v".format(top_name)), output_dir)
+    sources.append("{}.v".format(top_name))
+
+    # Remove the sources of the previous generation that are no longer used.
+    manifest = os.path.join(output_dir, "soc.json")
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            for filename in set(json.load(f)["sources"]) - set(sources):
+                os.remove(os.path.join(output_dir, filename))
+
+    with open(manifest, "w") as f:
+        json.dump({"params": params, "sources": sources}, f, indent=1)
+        f.write("\n")
+    return sources
+
+
+if __name__ == "__main__":
+    params = load_params()
+
+    parser = argparse.ArgumentParser(
+        description="Regenerate the LiteX SoC. Parameters default to those it was last "
+                    "generated with.")
+    for name, value in params.items():
+        option = "--{}".format(name.replace("_", "-"))
+        if isinstance(value, bool):
+            parser.add_argument(option, type=lambda s: s.lower() in ("1", "yes", "true"),
+                default=value, metavar="BOOL",
+                help="(default: %(default)s)")
+        else:
+            parser.add_argument(option, type=type(value), default=value,
+                help="(default: %(default)s)")
+    parser.add_argument("--build-dir", default="build/litex",
+        help="directory to generate the SoC in (default: %(default)s)")
+    parser.add_argument("--output-dir", default=PACKAGE_DIR,
+        help="directory to copy the sources to (default: this package)")
+
+    args = parser.parse_args()
+    params = {name: getattr(args, name) for name in params}
+    sources = generate(params, args.build_dir, args.output_dir)
+    for filename in sources:
+        print(filename)
@@ -0,0 +1,167 @@
+import os
+import json
+import tempfile
+import warnings
+from functools import lru_cache
+
+from .cache import default_cache_dir
+
+
+__all__ = ["PLLConfig", "solve_pll"]
+
+
+# ECP5 EHXPLLL limits (ECP5 and ECP5-5G Family Data Sheet, sysCLOCK PLL timing)
+_DIV_RANGE  = (1, 128)
+_FB_RANGE   = (1, 80)
+_CLKI_RANGE = (8e6, 400e6)
+_PFD_RANGE  = (3.125e6, 400e6)
+_VCO_RANGE  = (400e6, 800e6)
+_CLKO_RANGE = (3.125e6, 400e6)
+
+# CLKOP, CLKOS, CLKOS2, CLKOS3
+_MAX_OUTPUTS = 4
+
+
+class PLLConfig:
+    """
+    EHXPLLL configuration, with CLKOP used as feedback.
+    :attr clki_div:
+        Input divider.
+    :attr clkfb_div:
+        Feedback divider.
+    :attr clko_divs:
+        Output dividers, for CLKOP, then CLKOS, CLKOS2 and CLKOS3 as needed.
+    :attr vco_freq:
+        VCO frequency, in Hz.
+    :attr freqs:
+        Achieved output frequencies, in Hz.
+    """
+    def __init__(self, clki_freq, clki_div, clkfb_div, clko_divs):
+        self.clki_freq = clki_freq
+        self.clki_div  = clki_div
+        self.clkfb_div = clkfb_div
+        self.clko_divs = list(clko_divs)
+
+        self.vco_freq  = clki_freq / clki_div * clkfb_div * self.clko_divs[0]
+        self.freqs     = [self.vco_freq / div for div in self.clko_divs]
+
+    def cphase(self, output):
+        return (self.clko_divs[output] - 1) // 2
+
+    def __repr__(self):
+        return "PLLConfig(clki_div={}, clkfb_div={}, clko_divs={}, vco={:.3f} MHz)".format(
+            self.clki_div, self.clkfb_div, self.clko_divs, self.vco_freq / 1e6)
+
+
+def _search(clki_freq, freqs, tolerance):
+    import numpy as np
+
+    divs    = np.arange(_DIV_RANGE[0], _DIV_RANGE[1] + 1)
+    fb_divs = np.arange(_FB_RANGE[0], _FB_RANGE[1] + 1)
+
+    # CLKOP is fed back, so it only depends on CLKI_DIV and CLKFB_DIV.
+    clki_div, clkfb_div = (a.ravel() for a in np.meshgrid(divs, fb_divs, indexing="ij"))
+    pfd   = clki_freq / clki_div
+    clkop = pfd * clkfb_div
+    error = np.abs(clkop - freqs[0]) / freqs[0]
+    legal = ((pfd >= _PFD_RANGE[0]) & (pfd <= _PFD_RANGE[1]) &
+             (clkop >= _CLKO_RANGE[0]) & (clkop <= _CLKO_RANGE[1]) &
+             (error <= tolerance))
+    clki_div, clkfb_div, clkop, error = clki_div[legal], clkfb_div[legal], clkop[legal], error[legal]
+
+    # CLKOP_DIV then sets the VCO frequency, from which the other outputs are divided.
+    clkop_div = divs[None, :]
+    vco   = clkop[:, None] * clkop_div
+    legal = (vco >= _VCO_RANGE[0]) & (vco <= _VCO_RANGE[1])
+    error = np.broadcast_to(error[:, None], vco.shape).copy()
+    clkos_divs = []
+    for freq in freqs[1:]:
+        div = np.clip(np.rint(vco / freq), *_DIV_RANGE)
+        out = vco / div
+        out_error = np.abs(out - freq) / freq
+        legal &= (out >= _CLKO_RANGE[0]) & (out <= _CLKO_RANGE[1]) & (out_error <= tolerance)
+        error += out_error
+        clkos_divs.append(div.astype(int))
+
+    if not legal.any():
+        return None
+    # Least total error first; among equivalent solutions, highest VCO frequency (lowest jitter).
+    rows, cols = np.nonzero(legal)
+    order = np.lexsort((-vco[rows, cols], np.round(error[rows, cols], 12)))
+    row, col = rows[order[0]], cols[order[0]]
+    return PLLConfig(clki_freq, int(clki_div[row]), int(clkfb_div[row]),
+                     [int(divs[col])] + [int(div[row, col]) for div in clkos_divs])
+
+
+def _load_disk_cache(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_disk_cache(filename, key, entry):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    entries = _load_disk_cache(filename)
+    entries[key] = entry
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename))
+    with os.fdopen(fd, "w") as f:
+        json.dump(entries, f, indent=1, sort_keys=True)
+    os.replace(tmpname, filename)
+
+
+@lru_cache(maxsize=None)
+def _solve_pll(clki_freq, freqs, tolerance, cache_file):
+    # Entries cached before the feedback divider range was corrected had no version.
+    key = "2:{}:{}:{}".format(clki_freq, ",".join(map(str, freqs)), tolerance)
+    if cache_file is not None:
+        entry = _load_disk_cache(cache_file).get(key)
+        if entry is not None:
+            return PLLConfig(clki_freq, entry["clki_div"], entry["clkfb_div"],
+                             entry["clko_divs"])
+
+    config = _search(clki_freq, freqs, tolerance)
+    if config is None:
+        # Settle for the closest frequencies; solve_pll() warns about them.
+        config = _search(clki_freq, freqs, float("inf"))
+    if config is None:
+        raise ValueError("No EHXPLLL configuration generates {} MHz from {:g} MHz"
+                         .format(", ".join("{:g}".format(f / 1e6) for f in freqs),
+                                 clki_freq / 1e6))
+
+    if cache_file is not None:
+        _store_disk_cache(cache_file, key, {
+            "clki_div":  config.clki_div,
+            "clkfb_div": config.clkfb_div,
+            "clko_divs": config.clko_divs,
+        })
+    return config
+
+
+def solve_pll(clki_freq, freqs, tolerance=0.005, cache_file=None, use_cache=True):
+    """
+    Find the EHXPLLL configuration generating ``freqs`` (CLKOP first, then CLKOS, CLKOS2
+    and CLKOS3) from ``clki_freq`` that has the least total relative error, with each output
+    within ``tolerance``. If there is none, the configuration with the least total error is
+    returned, with a warning for each output outside ``tolerance``. Results are memoized, in
+    memory and in ``cache_file`` (by default, ``pll.json`` in the build cache directory).
+    """
+    freqs = tuple(int(freq) for freq in freqs)
+    if not 1 <= len(freqs) <= _MAX_OUTPUTS:
+        raise ValueError("EHXPLLL has between 1 and {} outputs, not {}"
+                         .format(_MAX_OUTPUTS, len(freqs)))
+    if not _CLKI_RANGE[0] <= clki_freq <= _CLKI_RANGE[1]:
+        raise ValueError("EHXPLLL input frequency must be between {:g} and {:g} MHz, not {:g}"
+                         .format(_CLKI_RANGE[0] / 1e6, _CLKI_RANGE[1] / 1e6, clki_freq / 1e6))
+    if not use_cache:
+        cache_file = None
+    elif cache_file is None:
+        cache_file = os.path.join(default_cache_dir(), "pll.json")
+    config = _solve_pll(int(clki_freq), freqs, tolerance, cache_file)
+    for freq, achieved in zip(freqs, config.freqs):
+        if abs(achieved - freq) / freq > tolerance:
+            warnings.warn("EHXPLLL output is {:.4f} MHz instead of {:g} MHz, outside the "
+                          "{:g}% tolerance".format(achieved / 1e6, freq / 1e6, tolerance * 100),
+                          stacklevel=2)
+    return config
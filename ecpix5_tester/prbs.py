@@ -0,0 +1,114 @@
+from functools import reduce
+from operator import xor
+
+from nmigen import *
+
+
+__all__ = ["PRBS7", "PRBS15", "PRBS23", "PRBS31", "PRBSGenerator", "PRBSChecker", "prbs_bytes"]
+
+
+# Polynomial taps (ITU-T O.150), as the degrees of the nonzero terms other than 1.
+PRBS7  = (7, 6)
+PRBS15 = (15, 14)
+PRBS23 = (23, 18)
+PRBS31 = (31, 28)
+
+
+def _unroll(taps, width):
+    # Symbolic Fibonacci LFSR: each state bit, and each output bit, is the XOR of a set of
+    # initial state bits. Returns the sets for the state after ``width`` steps and for the
+    # ``width`` output bits, first output in the LSB.
+    state = [frozenset([i]) for i in range(max(taps))]
+    output = []
+    for _ in range(width):
+        bit = reduce(lambda a, b: a ^ b, (state[tap - 1] for tap in taps))
+        output.append(bit)
+        state = [bit] + state[:-1]
+    return state, output
+
+
+def _xor_of(value, bits):
+    return reduce(xor, (value[i] for i in sorted(bits)))
+
+
+class PRBSGenerator(Elaboratable):
+    """
+    Pseudo-random binary sequence generator, producing ``width`` bits per cycle.
+    The sequence restarts from ``seed`` when ``restart`` is asserted; otherwise, ``data``
+    advances to the next ``width`` bits on each cycle with ``next`` asserted. The first bit
+    of the sequence is in the LSB of ``data``.
+    """
+    def __init__(self, width=8, taps=PRBS31, seed=None):
+        self.width = width
+        self.taps  = taps
+        self.seed  = (1 << max(taps)) - 1 if seed is None else seed
+
+        self.restart = Signal()
+        self.next    = Signal()
+        self.data    = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        state = Signal(max(self.taps), reset=self.seed)
+        next_state, output = _unroll(self.taps, self.width)
+        m.d.comb += self.data.eq(Cat(_xor_of(state, bits) for bits in output))
+
+        with m.If(self.restart):
+            m.d.sync += state.eq(self.seed)
+        with m.Elif(self.next):
+            m.d.sync += state.eq(Cat(_xor_of(state, bits) for bits in next_state))
+
+        return m
+
+
+class PRBSChecker(Elaboratable):
+    """
+    Pseudo-random binary sequence checker. ``data`` is compared against the sequence of
+    ``PRBSGenerator`` with the same parameters on each cycle with ``valid`` asserted, and
+    ``errors`` gives the number of mismatching bits. ``restart`` restarts the sequence.
+    """
+    def __init__(self, width=8, taps=PRBS31, seed=None):
+        self.width = width
+        self.taps  = taps
+        self.seed  = seed
+
+        self.restart = Signal()
+        self.valid   = Signal()
+        self.data    = Signal(width)
+        self.errors  = Signal(range(width + 1))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.gen = gen = PRBSGenerator(self.width, self.taps, self.seed)
+        m.d.comb += [
+            gen.restart.eq(self.restart),
+            gen.next.eq(self.valid),
+        ]
+
+        diff = Signal(self.width)
+        m.d.comb += diff.eq(Mux(self.valid, self.data ^ gen.data, 0))
+        m.d.comb += self.errors.eq(sum(diff[i] for i in range(self.width)))
+
+        return m
+
+
+def prbs_bytes(length, taps=PRBS31, seed=None):
+    """
+    Return the first ``length`` bytes of the sequence of a ``PRBSGenerator`` with a width of
+    8 bits and the same parameters. For host-side checking and simulation.
+    """
+    degree = max(taps)
+    state  = (1 << degree) - 1 if seed is None else seed
+    result = bytearray()
+    for _ in range(length):
+        byte = 0
+        for i in range(8):
+            bit = 0
+            for tap in taps:
+                bit ^= (state >> (tap - 1)) & 1
+            byte |= bit << i
+            state = ((state << 1) | bit) & ((1 << degree) - 1)
+        result.append(byte)
+    return bytes(result)
@@ -0,0 +1,453 @@
+import gzip
+import fnmatch
+
+import numpy as np
+from vcd import VCDWriter
+
+from nmigen import *
+from nmigen.hdl.ast import SignalDict
+from nmigen.back.pysim import Simulator, Passive
+
+from .dvi import VideoTiming, SyncGenerator, TestCardGen
+
+
+__all__ = [
+    "I2CInitiatorModel", "it6613e_pads", "register_log",
+    "rgmii_pads", "rgmii_loopback", "uart_send", "uart_recv",
+    "fast_timing", "test_card_frames", "capture_test_card", "compare_frames",
+    "hierarchy_signals", "WaveformCapture",
+]
+
+
+class I2CInitiatorModel(Elaboratable):
+    """
+    Transaction-level stand-in for ``I2CInitiator``, for simulation only.
+    Accepts the same strobes, but completes each of them in ``byte_cyc`` cycles instead of
+    clocking every bit out on SCL/SDA. Transactions are decoded directly by a model of the
+    register file of the device at 7-bit address ``address``: it acknowledges its address,
+    takes the first byte written as the register address (auto-incremented after each byte),
+    and stores the following ones. Other addresses are not acknowledged.
+    :attr regs:
+        Register file, as a 256-byte ``Memory`` initialized with ``init``.
+    :attr reg_we:
+        Register write strobe, with ``reg_addr`` and ``reg_data``. See ``register_log``.
+    """
+    def __init__(self, address, byte_cyc=2, init=None):
+        self.address  = address
+        self.byte_cyc = byte_cyc
+
+        self.busy   = Signal(reset=1)
+        self.start  = Signal()
+        self.stop   = Signal()
+        self.read   = Signal()
+        self.data_i = Signal(8)
+        self.ack_o  = Signal()
+        self.write  = Signal()
+        self.data_o = Signal(8)
+        self.ack_i  = Signal()
+
+        self.regs     = Memory(width=8, depth=256, init=init)
+        self.reg_we   = Signal()
+        self.reg_addr = Signal(8)
+        self.reg_data = Signal(8)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.wrport = wrport = self.regs.write_port()
+        m.submodules.rdport = rdport = self.regs.read_port(domain="comb")
+
+        timer = Signal(range(self.byte_cyc + 1))
+        with m.If(self.start | self.stop | self.write | self.read):
+            m.d.sync += [
+                timer.eq(self.byte_cyc - 1),
+                self.busy.eq(1),
+            ]
+        with m.Elif(timer != 0):
+            m.d.sync += timer.eq(timer - 1)
+        with m.Else():
+            m.d.sync += self.busy.eq(0)
+
+        selected = Signal()
+        reading  = Signal()
+        pointer  = Signal(8)
+        m.d.comb += [
+            rdport.addr.eq(pointer),
+            wrport.addr.eq(pointer),
+            wrport.data.eq(self.data_i),
+            self.reg_we.eq(wrport.en),
+            self.reg_addr.eq(wrport.addr),
+            self.reg_data.eq(wrport.data),
+        ]
+
+        def start_stop():
+            # A (repeated) start or a stop may end a transaction at any point.
+            with m.If(self.start):
+                m.next = "ADDR"
+            with m.Elif(self.stop):
+                m.next = "IDLE"
+
+        with m.FSM():
+            with m.State("IDLE"):
+                with m.If(self.start):
+                    m.next = "ADDR"
+
+            with m.State("ADDR"):
+                with m.If(self.write):
+                    m.d.sync += [
+                        selected.eq(self.data_i[1:] == self.address),
+                        reading.eq(self.data_i[0]),
+                        self.ack_o.eq(self.data_i[1:] == self.address),
+                    ]
+                    with m.If(self.data_i[0]):
+                        m.next = "DATA"
+                    with m.Else():
+                        m.next = "REG"
+                start_stop()
+
+            with m.State("REG"):
+                with m.If(self.write):
+                    m.d.sync += [
+                        pointer.eq(self.data_i),
+                        self.ack_o.eq(selected),
+                    ]
+                    m.next = "DATA"
+                start_stop()
+
+            with m.State("DATA"):
+                with m.If(self.write):
+                    m.d.comb += wrport.en.eq(selected & ~reading)
+                    m.d.sync += [
+                        pointer.eq(pointer + 1),
+                        self.ack_o.eq(selected & ~reading),
+                    ]
+                with m.If(self.read):
+                    m.d.sync += [
+                        self.data_o.eq(Mux(selected, rdport.data, 0xff)),
+                        pointer.eq(pointer + 1),
+                    ]
+                start_stop()
+
+        return m
+
+
+def it6613e_pads(depth=12):
+    """
+    Stand-in for the ``it6613e`` platform resource, for simulating ``DVITester``.
+    """
+    return Record([
+        ("rst",   1),
+        ("pclk",  1),
+        ("de",    1),
+        ("hsync", 1),
+        ("vsync", 1),
+        ("d", [
+            ("r", depth),
+            ("g", depth),
+            ("b", depth),
+        ]),
+        ("scl", [("i", 1), ("o", 1), ("oe", 1)]),
+        ("sda", [("i", 1), ("o", 1), ("oe", 1)]),
+    ], name="it6613e")
+
+
+def register_log(model, log):
+    """
+    Simulator process appending a ``(reg, value)`` tuple to ``log`` for every register
+    written through ``model``, an ``I2CInitiatorModel``.
+    """
+    def process():
+        yield Passive()
+        while True:
+            if (yield model.reg_we):
+                log.append(((yield model.reg_addr), (yield model.reg_data)))
+            yield
+    return process
+
+
+def rgmii_pads():
+    """
+    Stand-in for the ``eth_rgmii`` and ``uart`` platform resources, for simulating
+    ``EthernetTester``. DDR pins have the fields of a platform pin with ``xdr=2``.
+    """
+    pads = Record([
+        ("rst",     [("o", 1)]),
+        ("mdc",     [("o", 1)]),
+        ("mdio",    [("i", 1), ("o", 1), ("oe", 1)]),
+        ("tx_clk",  1),
+        ("tx_data", [("o_clk", 1), ("o0", 4), ("o1", 4)]),
+        ("tx_ctrl", [("o_clk", 1), ("o0", 1), ("o1", 1)]),
+        ("rx_clk",  [("i", 1)]),
+        ("rx_data", [("i_clk", 1), ("i0", 4), ("i1", 4)]),
+        ("rx_ctrl", [("i_clk", 1), ("i0", 1), ("i1", 1)]),
+        ("rx",      [("i", 1)]),
+        ("tx",      [("o", 1)]),
+    ], name="rgmii")
+    # The UART receive line idles high.
+    pads.rx.i.reset = 1
+    return pads
+
+
+def rgmii_loopback(pads, domain="eth_tx"):
+    """
+    Statements connecting the transmit side of ``pads`` (see ``rgmii_pads``) to its receive
+    side, as a loopback plug would, with the receive clock taken from ``domain``.
+    """
+    return [
+        pads.rx_clk.i.eq(ClockSignal(domain)),
+        pads.rx_data.i0.eq(pads.tx_data.o0),
+        pads.rx_data.i1.eq(pads.tx_data.o1),
+        pads.rx_ctrl.i0.eq(pads.tx_ctrl.o0),
+        pads.rx_ctrl.i1.eq(pads.tx_ctrl.o1),
+    ]
+
+
+def uart_send(rx, data, divisor):
+    """
+    Simulator commands sending the bytes ``data`` to the UART receive line ``rx``, with a bit
+    period of ``divisor`` cycles. Use with ``yield from``.
+    """
+    for byte in data:
+        for bit in [0, *((byte >> i) & 1 for i in range(8)), 1]:
+            yield rx.eq(bit)
+            for _ in range(divisor):
+                yield
+
+
+def uart_recv(tx, divisor, count=1):
+    """
+    Simulator commands receiving ``count`` bytes from the UART transmit line ``tx``, with a
+    bit period of ``divisor`` cycles, and returning them. Use with ``yield from``.
+    """
+    data = bytearray()
+    while len(data) < count:
+        while (yield tx):
+            yield
+        for _ in range(divisor + divisor // 2):
+            yield
+        byte = 0
+        for i in range(8):
+            byte |= (yield tx) << i
+            for _ in range(divisor):
+                yield
+        data.append(byte)
+    return bytes(data)
+
+
+def fast_timing(mode=(1024, 768, 60), width=32, height=24, ppc=1):
+    """
+    Timing of video ``mode``, scaled down to ``width`` by ``height`` visible pixels (see
+    ``VideoTiming.scaled``). Passed to ``SyncGenerator`` or ``DVITester`` in place of the real
+    timing, it lets a frame be simulated in about a thousand cycles.
+    """
+    return VideoTiming(*mode).scaled(width, height, ppc)
+
+
+def test_card_frames(width, height, frames, depth=12, color_width=None):
+    """
+    Reference model of ``TestCardGen``.
+    Renders the visible pixels of each frame index in ``frames`` (counted from reset) as
+    a ``(len(frames), height, width, 3)`` array of ``(r, g, b)`` values. With ``color_width``,
+    colors are truncated to their most significant bits, as done by ``DVITester`` for
+    narrower HDMI transmitter inputs.
+    """
+    frames = np.atleast_1d(np.asarray(frames))
+    radius = int(min(width, height) * 0.8 / 2)
+
+    x = np.arange(width)
+    y = np.arange(height)[:, None]
+    circle = (x - width//2)**2 + (y - height//2)**2 <= radius**2
+
+    # The grid moves by one pixel at the start of every vertical sync.
+    counter = (frames % 64)[:, None, None]
+    line = ((x & 63) == counter) | ((y & 63) == counter)
+
+    colors = np.array([TestCardGen.bkg_grid, TestCardGen.frg_grid, TestCardGen.circle_color],
+                      dtype=np.uint16)
+    image = colors[np.where(circle, 2, line.astype(np.intp))]
+    if color_width is not None:
+        image >>= depth - color_width
+    return image
+
+
+def capture_test_card(timing=None, frames=1, ppc=1, depth=12, color_width=None):
+    """
+    Simulate ``SyncGenerator`` and ``TestCardGen``, and capture the visible pixels of the
+    first ``frames`` frames in the same layout as ``test_card_frames``. By default, the
+    timing is ``fast_timing(ppc=ppc)``.
+    """
+    if timing is None:
+        timing = fast_timing(ppc=ppc)
+    width, height = timing.h.visible, timing.v.visible
+
+    m = Module()
+    m.submodules.syncgen = syncgen = SyncGenerator(timing, ppc)
+    m.submodules.tcgen   = tcgen   = TestCardGen(width, height, depth, ppc)
+    m.d.comb += [
+        tcgen.i_de.eq(syncgen.de),
+        tcgen.i_hsync.eq(syncgen.hsync),
+        tcgen.i_vsync.eq(syncgen.vsync),
+        tcgen.x.eq(syncgen.x),
+        tcgen.y.eq(syncgen.y),
+    ]
+
+    # One row per cycle with `de` high, holding all `ppc` pixels of each color; lanes are
+    # split apart once the simulation is over.
+    raw = np.zeros((frames * height * width // ppc, 3), dtype=np.uint64)
+
+    def process():
+        index = 0
+        while index < len(raw):
+            yield
+            if (yield tcgen.o_de):
+                raw[index] = ((yield tcgen.r), (yield tcgen.g), (yield tcgen.b))
+                index += 1
+
+    sim = Simulator(m)
+    sim.add_clock(1 / timing.pixel_clock * ppc)
+    sim.add_sync_process(process)
+    sim.run()
+
+    shifts = np.arange(ppc, dtype=np.uint64) * np.uint64(depth)
+    lanes  = (raw[:, None, :] >> shifts[:, None]) & np.uint64((1 << depth) - 1)
+    image  = lanes.astype(np.uint16).reshape(frames, height, width, 3)
+    if color_width is not None:
+        image >>= depth - color_width
+    return image
+
+
+def compare_frames(actual, expected):
+    """
+    Positions of the pixels that differ between two ``(frames, height, width, 3)`` arrays,
+    as an array of ``(frame, y, x)`` rows.
+    """
+    if actual.shape != expected.shape:
+        raise ValueError("Cannot compare frames of shape {} with frames of shape {}"
+                         .format(actual.shape, expected.shape))
+    return np.argwhere((actual != expected).any(axis=-1))
+
+
+def hierarchy_signals(fragment, hierarchy=("top",)):
+    """
+    Signals driven anywhere in an elaborated ``fragment``, as a dict of signals by
+    hierarchical name tuple, e.g. ``("top", "dvi", "syncgen", "hsync")``. Unnamed
+    subfragments are named ``U$<index>``, as in the simulator's own VCD output.
+    """
+    signals = {}
+    for domain, signal in fragment.iter_drivers():
+        if signal.name is not None:
+            signals[(*hierarchy, signal.name)] = signal
+    for index, (subfragment, name) in enumerate(fragment.subfragments):
+        if name is None:
+            name = "U${}".format(index)
+        signals.update(hierarchy_signals(subfragment, (*hierarchy, name)))
+    return signals
+
+
+class WaveformCapture:
+    """
+    Waveform capture restricted to a set of signals and a window of time.
+    Once per cycle of the domain its ``process`` is added to, the selected signals are
+    sampled and their changes written to ``filename`` as VCD, gzip-compressed if the name
+    ends with ``.gz``. Output is streamed: only the last value of each signal is kept in
+    memory.
+    :param fragment:
+        Elaborated design, as passed to the simulator; used to resolve ``patterns``.
+    :param signals:
+        Signals to capture.
+    :param patterns:
+        Shell-style patterns; signals of ``fragment`` whose dotted hierarchical name matches
+        one of them are captured, e.g. ``"top.dvi.*sync"`` or ``"top.U$*.i2c*"``.
+    :param start:
+        Capture starts on the first cycle this value is high (by default, immediately).
+    :param stop:
+        Capture stops on the ``stop_count``-th rising edge of this value after it started
+        (by default, when the simulation ends), e.g. ``vsync`` to capture whole frames.
+    :param period:
+        Clock period of the domain, in seconds, for the timestamps.
+    """
+    def __init__(self, filename, fragment=None, *, signals=(), patterns=(), start=None,
+                 stop=None, stop_count=1, period=1e-9):
+        self.filename   = filename
+        self.start      = start
+        self.stop       = stop
+        self.stop_count = stop_count
+        self.period     = period
+
+        selected = SignalDict()
+        for index, signal in enumerate(signals):
+            if not isinstance(signal, Signal):
+                raise TypeError("Object {!r} is not an nMigen signal".format(signal))
+            selected[signal] = ("top", signal.name or "${}".format(index))
+        if patterns:
+            if fragment is None:
+                raise ValueError("Capturing signals by name requires a fragment")
+            for name, signal in hierarchy_signals(fragment).items():
+                if signal in selected:
+                    continue
+                if any(fnmatch.fnmatchcase(".".join(name), pattern) for pattern in patterns):
+                    selected[signal] = name
+        if not selected:
+            raise ValueError("No signals to capture")
+
+        if filename.endswith(".gz"):
+            self._file = gzip.open(filename, "wt")
+        else:
+            self._file = open(filename, "w")
+        self._writer = VCDWriter(self._file, timescale="1 ps", comment="ecpix5_tester")
+        self._vars = []
+        for signal, (*scope, name) in selected.items():
+            if signal.decoder:
+                var = self._writer.register_var(scope, name, "string", 1,
+                                                self._decode(signal, signal.reset))
+            else:
+                var = self._writer.register_var(scope, name, "wire", signal.width, signal.reset)
+            self._vars.append((signal, var))
+        self.closed = False
+
+    @staticmethod
+    def _decode(signal, value):
+        return signal.decoder(value).expandtabs().replace(" ", "_")
+
+    def process(self):
+        yield Passive()
+        cycle    = 0
+        started  = self.start is None
+        stops    = 0
+        stop_r   = 1
+        while not self.closed:
+            if not started:
+                started = bool((yield self.start))
+            if started:
+                timestamp = round(cycle * self.period * 1e12)
+                for signal, var in self._vars:
+                    value = yield signal
+                    if signal.decoder:
+                        value = self._decode(signal, value)
+                    self._writer.change(var, timestamp, value)
+                if self.stop is not None:
+                    stop = yield self.stop
+                    if stop and not stop_r:
+                        stops += 1
+                        if stops == self.stop_count:
+                            self.close(cycle)
+                    stop_r = stop
+            cycle += 1
+            yield
+
+    def close(self, cycle=None):
+        """
+        Finish the capture. Must be called once the simulation is over, unless ``stop``
+        was reached.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.close(None if cycle is None else round(cycle * self.period * 1e12))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,6 +1,113 @@
+import re
+import json
+from importlib import resources
+
 from nmigen import *
 
+from . import litex
+
+
+__all__ = ["SOC_PINS", "SERIAL_LAYOUT", "UART_STREAM_LAYOUT", "soc_params", "soc_sources",
+           "soc_ports", "LitexSoC"]
+
+
+# LiteX SoC port: nMigen resource and subsignal (as a dotted path) it is connected to.
+# The clock and reset ports are connected to the ``sync`` domain, and ports that are not
+# listed here are left unconnected.
+SOC_PINS = {
+    "serial_rx":     ("uart", "rx"),
+    "serial_tx":     ("uart", "tx"),
+
+    "ddram_a":       ("ddr3", "a"),
+    "ddram_ba":      ("ddr3", "ba"),
+    "ddram_ras_n":   ("ddr3", "ras"),
+    "ddram_cas_n":   ("ddr3", "cas"),
+    "ddram_we_n":    ("ddr3", "we"),
+    "ddram_dm":      ("ddr3", "dm"),
+    "ddram_dq":      ("ddr3", "dq"),
+    "ddram_dqs_p":   ("ddr3", "dqs.p"),
+    "ddram_clk_p":   ("ddr3", "clk.p"),
+    "ddram_cke":     ("ddr3", "clk_en"),
+    "ddram_odt":     ("ddr3", "odt"),
+
+    "eth_clocks_tx": ("eth_rgmii", "tx_clk"),
+    "eth_clocks_rx": ("eth_rgmii", "rx_clk"),
+    "eth_rst_n":     ("eth_rgmii", "rst"),
+    "eth_mdio":      ("eth_rgmii", "mdio"),
+    "eth_mdc":       ("eth_rgmii", "mdc"),
+    "eth_rx_ctl":    ("eth_rgmii", "rx_ctrl"),
+    "eth_rx_data":   ("eth_rgmii", "rx_data"),
+    "eth_tx_ctl":    ("eth_rgmii", "tx_ctrl"),
+    "eth_tx_data":   ("eth_rgmii", "tx_data"),
+}
+
+# Internal serial lines that can replace the ``uart`` resource; ``rx`` is an input of the SoC
+# and ``tx`` an output.
+SERIAL_LAYOUT = [
+    ("rx", 1),
+    ("tx", 1),
+]
+
+# Byte streams of the UART of a SoC generated with ``uart_name="stream"`` (see
+# ``litex.generate``), synchronous to ``clk``: ``rx`` into the SoC, and ``tx`` out of it.
+# ``clk``, ``rx_ready``, ``tx_data`` and ``tx_valid`` are outputs of the SoC.
+UART_STREAM_LAYOUT = [
+    ("clk",      1),
+    ("rx_data",  8),
+    ("rx_valid", 1),
+    ("rx_ready", 1),
+    ("tx_data",  8),
+    ("tx_valid", 1),
+    ("tx_ready", 1),
+]
+
+
+def soc_params():
+    """
+    Return the parameters the LiteX SoC was generated with (see ``litex.generate``).
+    """
+    return json.loads(resources.read_text(litex, "soc.json"))["params"]
+
+
+def soc_sources():
+    """
+    Return the file names of the LiteX SoC sources, in the order they must be added (see
+    ``litex.generate``).
+    """
+    return json.loads(resources.read_text(litex, "soc.json"))["sources"]
+
+
+def soc_ports(top="ecpix5"):
+    """
+    Return the ports of the generated LiteX SoC, as a list of ``(direction, name, width)``
+    tuples in declaration order, ``direction`` being ``"i"``, ``"o"`` or ``"io"``.
+    """
+    text = resources.read_text(litex, "{}.v".format(top))
+    header = re.search(r"^module {}\s*\((.*?)\);".format(top), text, re.MULTILINE | re.DOTALL)
+    declaration = r"(input|output|inout)\s+(?:(?:wire|reg)\s+)?(?:\[(\d+):0\]\s*)?(\w+)"
+    ports = []
+    for match in re.finditer(declaration, header.group(1)):
+        direction, msb, name = match.groups()
+        ports.append(({"input": "i", "output": "o", "inout": "io"}[direction], name,
+                      int(msb) + 1 if msb is not None else 1))
+    return ports
+
+
 class LitexSoC(Elaboratable):
+    """
+    LiteX SoC, with its console on the ``uart`` resource, or on ``serial`` (a ``Record`` with
+    the ``SERIAL_LAYOUT``) if given.
+
+    If the SoC was generated with a ``stream`` UART, the SoC clock drives the ``soc`` domain,
+    and its UART streams are bridged to the console by a UART at ``uart_baudrate``, unless
+    ``stream`` (a ``Record`` with the ``UART_STREAM_LAYOUT``) is given to connect them to.
+    """
+    def __init__(self, serial=None, stream=None):
+        if serial is not None and stream is not None:
+            raise ValueError("The console is either on serial lines or on streams, not both")
+        self.serial = serial
+        self.stream = stream
+
     def elaborate(self, platform):
         m = Module()
 
@@ -12,38 +119,66 @@ class LitexSoC(Elaboratable):
                 xdr={io.name: 0   for io in res.ios},
             )
 
-        uart      = request_compat("uart", 0)
-        ddr3      = request_compat("ddr3", 0)
-        eth_rgmii = request_compat("eth_rgmii", 0)
-
-        m.submodules.soc = Instance("ecpix5",
-            i_clk100        = ClockSignal("sync"),
-            i_rst_n         = ~ResetSignal("sync"),
-
-            i_serial_rx     = uart.rx,
-            o_serial_tx     = uart.tx,
-
-            o_ddram_a       = ddr3.a,
-            o_ddram_ba      = ddr3.ba,
-            o_ddram_ras_n   = ddr3.ras,
-            o_ddram_cas_n   = ddr3.cas,
-            o_ddram_we_n    = ddr3.we,
-            o_ddram_dm      = ddr3.dm,
-            i_ddram_dq      = ddr3.dq,
-            i_ddram_dqs_p   = ddr3.dqs.p,
-            o_ddram_clk_p   = ddr3.clk.p,
-            o_ddram_cke     = ddr3.clk_en,
-            o_ddram_odt     = ddr3.odt,
-
-            o_eth_clocks_tx = eth_rgmii.tx_clk,
-            i_eth_clocks_rx = eth_rgmii.rx_clk,
-            o_eth_rst_n     = eth_rgmii.rst,
-            i_eth_mdio      = eth_rgmii.mdio,
-            o_eth_mdc       = eth_rgmii.mdc,
-            i_eth_rx_ctl    = eth_rgmii.rx_ctrl,
-            i_eth_rx_data   = eth_rgmii.rx_data,
-            o_eth_tx_ctl    = eth_rgmii.tx_ctrl,
-            o_eth_tx_data   = eth_rgmii.tx_data,
-        )
+        ports = {
+            "i_clk100": ClockSignal("sync"),
+            "i_rst_n":  ~ResetSignal("sync"),
+        }
+        requested = {}
+        stream = None
+        for direction, name, width in soc_ports():
+            if name.startswith("uart_stream_"):
+                if stream is None:
+                    stream = self.stream if self.stream is not None else \
+                             Record(UART_STREAM_LAYOUT, name="uart_stream")
+                ports["{}_{}".format(direction, name)] = \
+                    getattr(stream, name[len("uart_stream_"):])
+                continue
+            if name not in SOC_PINS:
+                continue
+            if self.serial is not None and name in ("serial_rx", "serial_tx"):
+                ports["{}_{}".format(direction, name)] = getattr(self.serial, name[len("serial_"):])
+                continue
+            resource, path = SOC_PINS[name]
+            if resource not in requested:
+                requested[resource] = request_compat(resource, 0)
+            pin = requested[resource]
+            for field in path.split("."):
+                pin = getattr(pin, field)
+            ports["{}_{}".format(direction, name)] = pin
+
+        if stream is None and self.stream is not None:
+            raise ValueError("The LiteX SoC was not generated with a stream UART")
+
+        m.submodules.soc = Instance("ecpix5", **ports)
+
+        if stream is not None:
+            m.domains.soc = ClockDomain("soc", reset_less=True)
+            m.d.comb += ClockSignal("soc").eq(stream.clk)
+
+        if stream is not None and self.stream is None:
+            from .uart import UARTStreamBridge
+
+            params = soc_params()
+            bridge = UARTStreamBridge(divisor=round(params["sys_clk_freq"] /
+                                                    params["uart_baudrate"]),
+                                      fifo_depth=16)
+            m.submodules.uart_bridge = bridge = DomainRenamer("soc")(bridge)
+            m.d.comb += [
+                bridge.sink_data.eq(stream.tx_data),
+                bridge.sink_valid.eq(stream.tx_valid),
+                stream.tx_ready.eq(bridge.sink_ready),
+                stream.rx_data.eq(bridge.source_data),
+                stream.rx_valid.eq(bridge.source_valid),
+                bridge.source_ready.eq(stream.rx_ready),
+            ]
+            if self.serial is not None:
+                rx, tx = self.serial.rx, self.serial.tx
+            else:
+                uart = platform.request("uart", 0)
+                rx, tx = uart.rx.i, uart.tx.o
+            m.d.comb += [
+                bridge.rx.eq(rx),
+                tx.eq(bridge.tx),
+            ]
 
         return m
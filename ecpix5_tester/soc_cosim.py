@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import subprocess
+from importlib import resources
+
+from . import litex, cosim
+from .soc import SOC_PINS, soc_sources
+
+
+__all__ = ["COSIM_SOURCES", "top_port_name", "patch_soc_ports", "patch_top_ports", "prepare",
+           "build", "run"]
+
+
+COSIM_SOURCES = (
+    "ecp5_models.v",
+    "ddr3_model.sv",
+    "uart_pty.sv",
+    "cosim_top.sv",
+    "sim_main.cpp",
+)
+
+
+def top_port_name(resource, path):
+    """
+    Return the name of the top-level port that nMigen creates for the subsignal ``path`` (as a
+    dotted path, see ``soc.SOC_PINS``) of resource ``resource`` number 0.
+    """
+    fields = path.split(".")
+    if fields[-1] not in ("p", "n"):
+        fields.append("io")
+    return "__".join(["{}_0".format(resource), *fields])
+
+
+def _bidir_ports(text):
+    # Ports of the LiteX SoC connected to the ``B`` terminal of a ``TRELLIS_IO``.
+    return set(re.findall(r"^\s*\.B\s*\((\w+)(?:\[\d+\])?\)", text, re.MULTILINE))
+
+
+def _declare_inout(text, names):
+    def patch(match):
+        if match.group(3) in names:
+            return "{}inout{}{}".format(*match.groups())
+        return match.group(0)
+    return re.sub(r"^(\s*)input(\s+(?:wire\s+)?(?:\[\d+:\d+\]\s*)?)(\w+)", patch, text,
+                  flags=re.MULTILINE)
+
+
+def patch_soc_ports(text):
+    """
+    Return the LiteX SoC Verilog ``text`` with every port that is connected to the ``B``
+    terminal of a ``TRELLIS_IO`` declared ``inout``. LiteX declares these ports ``input``,
+    which nextpnr accepts, but which a simulator cannot drive from inside the SoC.
+    """
+    return _declare_inout(text, _bidir_ports(text))
+
+
+def patch_top_ports(text, soc_text):
+    """
+    Return the Verilog ``text`` of the tester top-level with the ports connected to the ports
+    that ``patch_soc_ports`` declares ``inout`` in the LiteX SoC Verilog ``soc_text`` declared
+    ``inout`` as well. nMigen takes their direction from the ``ecpix5`` instance, so they are
+    inputs of every module they go through.
+    """
+    names = {top_port_name(*SOC_PINS[port]) for port in _bidir_ports(soc_text)
+             if port in SOC_PINS}
+    return _declare_inout(text, names)
+
+
+def prepare(build_dir="build/cosim", variant="85"):
+    """
+    Elaborate the tester top-level for ``variant`` with only the LiteX SoC to Verilog, and
+    write it into ``build_dir`` along with the LiteX SoC and the co-simulation sources. Returns
+    the name of the top-level module. The SoC reads its memory initialization files relative
+    to the working directory, so the simulation must be run from there.
+    """
+    from .top import elaborate
+
+    os.makedirs(build_dir, exist_ok=True)
+    for filename in soc_sources():
+        data = resources.read_binary(litex, filename)
+        if filename == "ecpix5.v":
+            soc_text = data.decode("utf-8")
+            data = patch_soc_ports(soc_text).encode("utf-8")
+        with open(os.path.join(build_dir, filename), "wb") as f:
+            f.write(data)
+    for filename in COSIM_SOURCES:
+        with open(os.path.join(build_dir, filename), "wb") as f:
+            f.write(resources.read_binary(cosim, filename))
+
+    name, text = elaborate(variant, ("soc",), "verilog")
+    with open(os.path.join(build_dir, "{}.v".format(name)), "w") as f:
+        f.write(patch_top_ports(text, soc_text))
+    return name
+
+
+def build(build_dir="build/cosim", variant="85", jobs=None):
+    """
+    Build the co-simulation of ``variant`` in ``build_dir`` with Verilator (5.0 or later, for
+    timing support); elaborating the tester top-level requires Yosys. The ``VERILATOR``
+    environment variable overrides the Verilator executable. Returns the path of the simulation
+    binary.
+    """
+    name = prepare(build_dir, variant)
+    verilator = os.environ.get("VERILATOR", "verilator")
+    sources = [filename for filename in (*soc_sources(), "{}.v".format(name), *COSIM_SOURCES)
+               if not filename.endswith(".init")]
+    subprocess.run([
+        verilator, "--cc", "--exe", "--build", "--timing",
+        "-j", str(jobs or os.cpu_count()),
+        "-Wno-fatal", "-Wno-lint", "-Wno-style",
+        "-DCOSIM_DUT={}".format(name),
+        "--top-module", "cosim_top",
+        "-o", "Vcosim_top",
+        *sources,
+    ], cwd=build_dir, check=True)
+    return os.path.join(build_dir, "obj_dir", "Vcosim_top")
+
+
+def run(build_dir="build/cosim", max_time_us=None, until=None):
+    """
+    Run the co-simulation built in ``build_dir``, for at most ``max_time_us`` microseconds
+    of simulated time if given. The SoC UART is bridged to a pseudo-terminal, whose name is
+    printed on startup. If ``until`` is given, the simulation is stopped as soon as the SoC
+    prints it, and the return code is 0 if it did and 1 otherwise.
+    """
+    args = [os.path.join("obj_dir", "Vcosim_top")]
+    if max_time_us is not None:
+        args.append("+max-time-us={}".format(max_time_us))
+    if until is None:
+        return subprocess.run(args, cwd=build_dir).returncode
+
+    until = until.encode("utf-8")
+    tail  = b""
+    with subprocess.Popen(args, cwd=build_dir, stdout=subprocess.PIPE) as process:
+        for data in iter(lambda: process.stdout.read1(4096), b""):
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+            tail = tail[-len(until):] + data
+            if until in tail:
+                process.terminate()
+                return 0
+    return 1
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .top import VARIANTS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variant", choices=VARIANTS, default="85",
+        help="platform variant (default: %(default)s)")
+    parser.add_argument("--build-dir", default="build/cosim",
+        help="directory to build and run the simulation in (default: %(default)s)")
+    parser.add_argument("--no-build", action="store_true",
+        help="run a previously built simulation")
+    parser.add_argument("--max-time-us", type=int, default=None,
+        help="stop after this many microseconds of simulated time")
+    parser.add_argument("--until", default=None,
+        help="stop as soon as the SoC prints this text, and fail if it does not "
+             "(e.g. 'Memtest OK')")
+
+    args = parser.parse_args()
+    if not args.no_build:
+        build(args.build_dir, args.variant)
+    sys.exit(run(args.build_dir, args.max_time_us, args.until))
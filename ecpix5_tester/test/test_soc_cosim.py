@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import soc_cosim
+from ..soc import SOC_PINS
+
+
+class PatchPortsTestCase(unittest.TestCase):
+    SOC_TEXT = """\
+module ecpix5 (
+    input  wire        clk100,
+    input  wire [15:0] ddram_dq,
+    input  wire        ddram_dqs_p,
+    output wire        serial_tx
+);
+TRELLIS_IO #(.DIR("BIDIR")) TRELLIS_IO (
+    .B (ddram_dq[0]),
+    .I (a),
+    .T (b),
+    .O (c)
+);
+TRELLIS_IO #(.DIR("BIDIR")) TRELLIS_IO_1 (
+    .B(ddram_dqs_p),
+    .I (a),
+    .T (b),
+    .O (c)
+);
+endmodule
+"""
+
+    def test_top_port_name(self):
+        self.assertEqual(soc_cosim.top_port_name(*SOC_PINS["ddram_dq"]), "ddr3_0__dq__io")
+        self.assertEqual(soc_cosim.top_port_name(*SOC_PINS["ddram_dqs_p"]), "ddr3_0__dqs__p")
+
+    def test_patch_soc_ports(self):
+        text = soc_cosim.patch_soc_ports(self.SOC_TEXT)
+        self.assertIn("    inout  wire [15:0] ddram_dq,", text)
+        self.assertIn("    inout  wire        ddram_dqs_p,", text)
+        self.assertIn("    input  wire        clk100,", text)
+
+    def test_patch_top_ports(self):
+        top_text = """\
+module top(ddr3_0__dq__io, ddr3_0__dqs__p, clk100_0__io);
+  input [15:0] ddr3_0__dq__io;
+  input ddr3_0__dqs__p;
+  input clk100_0__io;
+endmodule
+module soc(ddr3_0__dq__io);
+  input [15:0] ddr3_0__dq__io;
+endmodule
+"""
+        text = soc_cosim.patch_top_ports(top_text, self.SOC_TEXT)
+        self.assertEqual(text.count("inout [15:0] ddr3_0__dq__io;"), 2)
+        self.assertIn("inout ddr3_0__dqs__p;", text)
+        self.assertIn("input clk100_0__io;", text)
+
+
+@unittest.skipUnless(os.environ.get("ECPIX5_COSIM"),
+                     "set ECPIX5_COSIM=1 to run the co-simulation (about an hour)")
+class MemtestTestCase(unittest.TestCase):
+    def test_memtest(self):
+        # The BIOS initializes the Ethernet PHY before the DDR3, which takes 0.4s of
+        # simulated time.
+        build_dir = tempfile.mkdtemp(prefix="ecpix5_cosim_")
+        self.addCleanup(shutil.rmtree, build_dir)
+        soc_cosim.build(build_dir)
+        self.assertEqual(soc_cosim.run(build_dir, 2_000_000, until="Memtest OK"), 0)
@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("luna")
+
+from usb_protocol.types import USBPacketID
+from luna.gateware.test import usb_domain_test_case
+from luna.gateware.test.usb2 import USBDeviceTest
+
+from ..prbs import prbs_bytes
+from ..usb import USBTestDevice
+from ..usb_bench import (BULK_ENDPOINT, MAX_PACKET_SIZE, USB_PRBS, REQUEST_GET_COUNTERS,
+                         REQUEST_CLEAR_COUNTERS, USB_COUNTERS, prbs_errors)
+
+
+class USBTestDeviceTestCase(USBDeviceTest):
+    FRAGMENT_UNDER_TEST = USBTestDevice
+    FRAGMENT_ARGUMENTS  = {}
+
+    def initialize_signals(self):
+        # Keep the device out of reset, and the PHY always ready to transmit.
+        yield self.utmi.line_state.eq(0b01)
+        yield self.utmi.tx_ready.eq(1)
+
+    def read_counters(self):
+        handshake, data = yield from self.control_request_in(
+            0xc0, REQUEST_GET_COUNTERS, length=4 * len(USB_COUNTERS))
+        self.assertEqual(handshake, USBPacketID.ACK)
+        self.assertEqual(len(data), 4 * len(USB_COUNTERS))
+        return {name: int.from_bytes(bytes(data[4 * i:4 * i + 4]), "little")
+                for i, name in enumerate(USB_COUNTERS)}
+
+    @usb_domain_test_case
+    def test_counters_and_prbs(self):
+        # The IN endpoint buffers a packet of the sequence before it is asked for one.
+        counters = yield from self.read_counters()
+        self.assertGreater(counters["in_bytes"], 0)
+
+        yield from self.control_request_out(0x40, REQUEST_CLEAR_COUNTERS)
+        counters = yield from self.read_counters()
+        self.assertEqual(counters, {"in_bytes": 0, "out_bytes": 0, "out_errors": 0})
+
+        # OUT: the sequence from its start, then one corrupted bit.
+        data = bytearray(prbs_bytes(64, USB_PRBS))
+        handshake = yield from self.out_transaction(*data, endpoint=BULK_ENDPOINT,
+                                                    data_pid=USBPacketID.DATA0)
+        self.assertEqual(handshake, USBPacketID.ACK)
+        counters = yield from self.read_counters()
+        self.assertEqual(counters["out_bytes"], 64)
+        self.assertEqual(counters["out_errors"], 0)
+
+        data = bytearray(prbs_bytes(128, USB_PRBS)[64:])
+        data[10] ^= 0x08
+        handshake = yield from self.out_transaction(*data, endpoint=BULK_ENDPOINT,
+                                                    data_pid=USBPacketID.DATA1)
+        self.assertEqual(handshake, USBPacketID.ACK)
+        counters = yield from self.read_counters()
+        self.assertEqual(counters["out_bytes"], 128)
+        self.assertEqual(counters["out_errors"], 1)
+
+        # IN: a full packet, which must be a run of the sequence.
+        pid, data = yield from self.in_transaction(endpoint=BULK_ENDPOINT,
+                                                   data_pid=USBPacketID.DATA0)
+        self.assertEqual(pid, USBPacketID.DATA0)
+        self.assertEqual(len(data), MAX_PACKET_SIZE)
+        self.assertEqual(prbs_errors(bytes(data), USB_PRBS), 0)
+        counters = yield from self.read_counters()
+        self.assertGreaterEqual(counters["in_bytes"], MAX_PACKET_SIZE)
@@ -1,29 +1,76 @@
 from nmigen import *
 from nmigen.build import *
-from luna.gateware.platform.ecpix5 import *
 
-from .blinky import Blinky
-from .dvi import DVITester
-from .usb import USBTestDevice
-from .soc import LitexSoC
+from .cache import build_cached
+from .pll import solve_pll
+
+import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib import import_module
 
-from importlib import import_module, resources
 from . import litex
 
 
 class CRG(Elaboratable):
+    """
+    Clock and reset generator.
+    The ``sync`` domain runs from the 100 MHz board clock. The ``pixel`` domain, and any
+    additional domains given as a ``{name: frequency}`` dict, are generated by a PLL whose
+    dividers are solved for at construction time; see ``self.pll`` for the frequencies that
+    are actually achieved. Domains given in ``aux_domains`` are generated by a second PLL
+    (``self.aux_pll``), for frequencies that cannot share a VCO with the pixel clock.
+    """
+    clki_freq = 100e6
+
+    def __init__(self, pixel_freq=65e6, domains=None, aux_domains=None):
+        self.domains = {"pixel": pixel_freq, **(domains or {})}
+        self.pll = solve_pll(self.clki_freq, list(self.domains.values()))
+        self.aux_domains = dict(aux_domains or {})
+        self.aux_pll = None
+        if self.aux_domains:
+            self.aux_pll = solve_pll(self.clki_freq, list(self.aux_domains.values()))
+
     def elaborate(self, platform):
         m = Module()
 
         clk100_i   = Signal()
         m.d.comb += clk100_i.eq(platform.request("clk100").i)
 
-        m.domains.pixel = ClockDomain("pixel")
         m.domains.sync  = ClockDomain("sync")
+        m.submodules.pll = self._pll(clk100_i, self.domains, self.pll)
+        if self.aux_pll is not None:
+            m.submodules.aux_pll = self._pll(clk100_i, self.aux_domains, self.aux_pll)
+
+        m.d.comb += [
+            ClockSignal("sync").eq(clk100_i),
+            ResetSignal("sync").eq(platform.request("rst", 0).i),
+        ]
+
+        return m
+
+    def _pll(self, clki, domains, pll):
+        m = Module()
+
+        for name in domains:
+            m.domains += ClockDomain(name)
 
         pll_locked = Signal()
         pll_clkfb  = Signal()
 
+        pll_outputs = {}
+        for output, (port, name, freq) in enumerate(zip(("CLKOP", "CLKOS", "CLKOS2", "CLKOS3"),
+                                                        domains, pll.freqs)):
+            pll_outputs.update({
+                "a_FREQUENCY_PIN_{}".format(port): "{:g}".format(freq / 1e6),
+                "p_{}_ENABLE".format(port):        "ENABLED",
+                "p_{}_DIV".format(port):           pll.clko_divs[output],
+                "p_{}_CPHASE".format(port):        pll.cphase(output),
+                "p_{}_FPHASE".format(port):        0,
+                "o_{}".format(port):               ClockSignal(name),
+            })
+
         m.submodules.pll = Instance("EHXPLLL",
             a_ICP_CURRENT            = "12",
             a_LPF_RESISTOR           = "8",
@@ -38,19 +85,14 @@ class CRG(Elaboratable):
             p_OUTDIVIDER_MUXC        = "DIVC",
             p_OUTDIVIDER_MUXD        = "DIVD",
 
-            a_FREQUENCY_PIN_CLKI     = "100",
-            p_CLKI_DIV               = 20,
-            i_CLKI                   = clk100_i,
+            a_FREQUENCY_PIN_CLKI     = "{:g}".format(self.clki_freq / 1e6),
+            p_CLKI_DIV               = pll.clki_div,
+            i_CLKI                   = clki,
 
-            a_FREQUENCY_PIN_CLKOP    = "65",
-            p_CLKOP_ENABLE           = "ENABLED",
-            p_CLKOP_DIV              = 9,
-            p_CLKOP_CPHASE           = 4,
-            p_CLKOP_FPHASE           = 0,
-            o_CLKOP                  = ClockSignal("pixel"),
+            **pll_outputs,
 
             p_FEEDBK_PATH            = "INT_OP",
-            p_CLKFB_DIV              = 13,
+            p_CLKFB_DIV              = pll.clkfb_div,
             i_CLKFB                  = pll_clkfb,
             o_CLKINTFB               = pll_clkfb,
 
@@ -66,37 +108,170 @@ class CRG(Elaboratable):
             o_LOCK                   = pll_locked,
         )
 
-        m.d.comb += [
-            ClockSignal("sync").eq(clk100_i),
-            ResetSignal("sync").eq(platform.request("rst", 0).i),
-        ]
-
         return m
 
 
+# Testers are imported on demand: some of them pull in large dependencies (LUNA).
+def _blinky(top):
+    from .blinky import Blinky
+    return Blinky()
+
+def _dvi(top):
+    from .dvi import DVITester
+    return DomainRenamer("pixel")(DVITester(top.video_timing(), top.ppc))
+
+def _usb(top):
+    from .usb import USBTestDevice
+    if top.console is None:
+        return USBTestDevice()
+    if top.console_stream:
+        return USBTestDevice(stream=top.console)
+    from .soc import soc_params
+    return USBTestDevice(serial=top.console, baudrate=soc_params()["uart_baudrate"])
+
+def _soc(top):
+    from .soc import LitexSoC
+    if top.console_stream:
+        return LitexSoC(stream=top.console)
+    return LitexSoC(serial=top.console)
+
+def _eth(top):
+    from .eth import EthernetTester
+    return EthernetTester()
+
+
+TESTERS = {
+    "blinky": _blinky,
+    "dvi":    _dvi,
+    "usb":    _usb,
+    "soc":    _soc,
+    "eth":    _eth,
+}
+
+# Testers that cannot be built together: the LiteX SoC and the Ethernet tester both use the
+# RGMII port and the UART.
+EXCLUSIVE_TESTERS = (
+    ("soc", "eth"),
+)
+
+TESTER_PRESETS = {
+    "all":  ("blinky", "dvi", "usb", "soc"),
+    # Everything but the LiteX SoC, which dominates synthesis and place & route time.
+    "fast": ("blinky", "dvi", "usb"),
+    "eth":  ("blinky", "dvi", "usb", "eth"),
+}
+
+
+def check_testers(testers):
+    """
+    Check that a tester selection is valid, raising ``ValueError`` otherwise.
+    """
+    for name in testers:
+        if name not in TESTERS:
+            raise ValueError("Unknown tester {!r}; expected one of {}"
+                             .format(name, ", ".join(TESTERS)))
+    for group in EXCLUSIVE_TESTERS:
+        selected = [name for name in group if name in testers]
+        if len(selected) > 1:
+            raise ValueError("Testers {} cannot be built together"
+                             .format(" and ".join(map(repr, selected))))
+
+
+def parse_testers(spec):
+    """
+    Parse a tester selection, given either as a preset name (see ``TESTER_PRESETS``)
+    or as a comma-separated list of tester names (see ``TESTERS``).
+    """
+    if spec in TESTER_PRESETS:
+        return TESTER_PRESETS[spec]
+    testers = tuple(name.strip() for name in spec.split(",") if name.strip())
+    check_testers(testers)
+    if not testers:
+        raise ValueError("Tester selection must not be empty")
+    return tuple(name for name in TESTERS if name in testers)
+
+
+def testers_suffix(testers):
+    """
+    Name of a tester selection, as used in bitstream names; empty for the full image.
+    """
+    testers = tuple(name for name in TESTERS if name in testers)
+    for preset, preset_testers in TESTER_PRESETS.items():
+        if testers == preset_testers:
+            return "" if preset == "all" else preset
+    return "-".join(testers)
+
+
+def parse_video_mode(spec):
+    """
+    Parse a video mode given as ``<width>x<height>@<framerate>``, e.g. ``1920x1080@60``.
+    """
+    try:
+        size, framerate = spec.split("@")
+        width, height = size.split("x")
+        return int(width), int(height), int(framerate)
+    except ValueError:
+        raise ValueError("Invalid video mode {!r}; expected e.g. 1920x1080@60".format(spec))
+
+
 class Top(Elaboratable):
+    """
+    Tester top-level.
+    The DVI tester generates ``video_mode`` (width, height, framerate), with ``ppc``
+    pixels per clock cycle of its core logic. With ``usb_console``, the console of the LiteX
+    SoC is a CDC-ACM function of the USB tester instead of the UART; it is connected to the
+    UART streams of the SoC if it was generated with a ``stream`` UART, and to its serial lines
+    otherwise.
+    """
+    def __init__(self, testers=TESTER_PRESETS["all"], video_mode=(1024, 768, 60), ppc=1,
+                 usb_console=False):
+        check_testers(testers)
+        if usb_console and not {"usb", "soc"} <= set(testers):
+            raise ValueError("The USB console requires both the 'usb' and 'soc' testers")
+        self.testers = tuple(testers)
+        self.video_mode = tuple(video_mode)
+        self.ppc = ppc
+        self.console = None
+        self.console_stream = False
+        if usb_console:
+            from .soc import SERIAL_LAYOUT, UART_STREAM_LAYOUT, soc_params
+            if soc_params()["uart_name"] == "stream":
+                self.console = Record(UART_STREAM_LAYOUT, name="console")
+                self.console_stream = True
+            else:
+                self.console = Record(SERIAL_LAYOUT, name="console")
+                self.console.rx.reset = 1
+                self.console.tx.reset = 1
+
+    def video_timing(self):
+        from .dvi import VideoTiming
+        return VideoTiming(*self.video_mode)
+
     def elaborate(self, platform):
         m = Module()
-        m.submodules.crg    = CRG()
-        m.submodules.blinky = Blinky()
-        m.submodules.dvi    = DomainRenamer("pixel")(DVITester())
-        m.submodules.usb    = USBTestDevice()
-        m.submodules.soc    = LitexSoC()
+        crg_args = {}
+        if "dvi" in self.testers:
+            pixel_freq = self.video_timing().pixel_clock
+            domains = {}
+            if self.ppc > 1:
+                domains["pixel_div"] = pixel_freq // self.ppc
+            crg_args.update(pixel_freq=pixel_freq, domains=domains)
+        if "eth" in self.testers:
+            crg_args.update(aux_domains={"eth_tx": 125e6})
+        m.submodules.crg = CRG(**crg_args)
+        for name in self.testers:
+            m.submodules[name] = TESTERS[name](self)
         return m
 
 
-if __name__ == "__main__":
-    import argparse
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--variant", choices=("85", "45"), default="85",
-        help="platform variant (default: %(default)s)")
+VARIANTS = {
+    "85": "ECPIX5_85F_Platform",
+    "45": "ECPIX5_45F_Platform",
+}
 
-    args = parser.parse_args()
-    if args.variant == "85":
-        platform = ECPIX5_85F_Platform()
-    else:
-        platform = ECPIX5_45F_Platform()
+def make_platform(variant, testers=TESTER_PRESETS["all"], add_sources=True):
+    platforms = import_module("luna.gateware.platform.ecpix5")
+    platform  = getattr(platforms, VARIANTS[variant])()
 
     platform.add_resources([
         Resource("sd_card", 0,
@@ -131,12 +306,157 @@ if __name__ == "__main__":
             ),
         ])
 
-    # Add LiteX SoC files
-    platform.add_file("Ram_1w_1rs_Generic.v", resources.read_text(litex, "Ram_1w_1rs_Generic.v"))
-    platform.add_file("VexRiscvLitexSmpCluster_Cc1_Iw32Is4096Iy1_Dw32Ds4096Dy1_ITs4DTs4_Ood_Wm.v", resources.read_text(litex, "VexRiscvLitexSmpCluster_Cc1_Iw32Is4096Iy1_Dw32Ds4096Dy1_ITs4DTs4_Ood_Wm.v"))
-    platform.add_file("mem.init",   resources.read_text(litex, "mem.init"))
-    platform.add_file("mem_1.init", resources.read_text(litex, "mem_1.init"))
-    platform.add_file("mem_2.init", resources.read_text(litex, "mem_2.init"))
-    platform.add_file("ecpix5.v",   resources.read_text(litex, "ecpix5.v"))
+    if not add_sources or "soc" not in testers:
+        return platform
+
+    # Read the LiteX SoC sources in place rather than copying them into the build plan; Yosys
+    # finds the memory initialization files next to the Verilog that refers to them. Their
+    # digests are part of the script, so that the build cache still covers their contents.
+    from .soc import soc_sources
+
+    script = []
+    for filename in soc_sources():
+        path = os.path.join(os.path.dirname(os.path.abspath(litex.__file__)), filename)
+        with open(path, "rb") as f:
+            script.append("# {} sha256 {}".format(filename, hashlib.sha256(f.read()).hexdigest()))
+        if filename.endswith(".v"):
+            script.append('read_verilog "{}"'.format(path))
+    script = "\n".join(script)
+
+    toolchain_prepare = platform.toolchain_prepare
+    def prepare_with_litex(fragment, name, **kwargs):
+        if "script_after_read" in kwargs:
+            kwargs["script_after_read"] = script + "\n" + kwargs["script_after_read"]
+        else:
+            kwargs["script_after_read"] = script
+        return toolchain_prepare(fragment, name, **kwargs)
+    platform.toolchain_prepare = prepare_with_litex
+
+    return platform
+
+
+def bitstream_name(variant, testers=TESTER_PRESETS["all"]):
+    suffix = testers_suffix(testers)
+    if suffix:
+        return "top_{}_{}".format(variant, suffix)
+    return "top_{}".format(variant)
+
+
+def elaborate(variant, testers=TESTER_PRESETS["all"], format="rtlil", **design):
+    """
+    Elaborate the design for ``variant`` without running the toolchain, and return its
+    name and its RTLIL or Verilog text. Only Verilog output requires Yosys.
+    Remaining arguments are passed to ``Top``.
+    """
+    from nmigen.back import rtlil, verilog
 
-    platform.build(Top(), do_program=True)
+    platform = make_platform(variant, testers, add_sources=False)
+    name = bitstream_name(variant, testers)
+    # Stop `Platform.prepare` once I/O buffers and ports are in place, before the toolchain
+    # templates are rendered.
+    platform.toolchain_prepare = lambda fragment, name, **kwargs: fragment
+    fragment = platform.prepare(Top(testers, **design), name)
+    if format == "rtlil":
+        text, _ = rtlil.convert_fragment(fragment, name)
+    elif format == "verilog":
+        text, _ = verilog.convert_fragment(fragment, name, strip_internal_attrs=True)
+    else:
+        raise ValueError("Unknown output format {!r}".format(format))
+    return name, text
+
+
+def build(variant, build_dir="build", testers=TESTER_PRESETS["all"], do_program=False,
+          use_cache=True, cache_dir=None, **design):
+    """
+    Build the bitstream for ``variant`` with the given ``testers`` in ``build_dir``
+    (see ``bitstream_name`` for the file name). Returns the bitstream name, the wall-clock
+    time spent, in seconds, and whether the bitstream was taken from the build cache.
+    Remaining arguments are passed to ``Top``.
+    """
+    start = time.perf_counter()
+    platform = make_platform(variant, testers)
+    name = bitstream_name(variant, testers)
+    if use_cache:
+        cached = build_cached(platform, Top(testers, **design), name=name, build_dir=build_dir,
+                              cache_dir=cache_dir, do_program=do_program)
+    else:
+        cached = False
+        platform.build(Top(testers, **design), name=name, build_dir=build_dir, do_program=do_program)
+    return name, time.perf_counter() - start, cached
+
+
+def build_parallel(variants, build_dir="build", testers=TESTER_PRESETS["all"],
+                   use_cache=True, cache_dir=None, **design):
+    """
+    Build several variants concurrently, one process per variant, each in its own
+    ``<build_dir>/<variant>`` directory. Returns a dict of ``(name, time, cached)`` tuples.
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=len(variants)) as executor:
+        futures = {executor.submit(build, variant, os.path.join(build_dir, variant), testers,
+                                   use_cache=use_cache, cache_dir=cache_dir, **design): variant
+                   for variant in variants}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def _format_result(name, elapsed, cached):
+    return "{}: {:.1f}s{}".format(name, elapsed, " (cached)" if cached else "")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variant", choices=(*VARIANTS, "all"), default="85",
+        help="platform variant, or 'all' to build every variant in parallel "
+             "(default: %(default)s)")
+    parser.add_argument("--testers", type=parse_testers, default="all",
+        help="testers to include, either a preset ({}) or a comma-separated list of "
+             "{} (default: %(default)s)".format(", ".join(TESTER_PRESETS), ", ".join(TESTERS)))
+    parser.add_argument("--video-mode", type=parse_video_mode, default="1024x768@60",
+        help="video mode generated by the DVI tester (default: %(default)s)")
+    parser.add_argument("--ppc", type=int, choices=(1, 2, 4), default=1,
+        help="pixels generated per clock cycle by the DVI tester (default: %(default)s)")
+    parser.add_argument("--usb-console", action="store_true",
+        help="connect the LiteX SoC console to a CDC-ACM function of the USB tester instead "
+             "of the UART")
+    parser.add_argument("--build-dir", default="build",
+        help="build directory (default: %(default)s)")
+    parser.add_argument("--elaborate", choices=("rtlil", "verilog"), default=None,
+        help="only elaborate the design and write it to the build directory in the given "
+             "format, without running the toolchain")
+    parser.add_argument("--no-program", action="store_true",
+        help="do not program the board after building")
+    parser.add_argument("--no-cache", action="store_true",
+        help="always run the toolchain, even if an identical design was built before")
+    parser.add_argument("--cache-dir", default=None,
+        help="bitstream cache directory (default: $ECPIX5_TESTER_CACHE or "
+             "~/.cache/ecpix5_tester)")
+
+    args = parser.parse_args()
+    design = {"video_mode": args.video_mode, "ppc": args.ppc, "usb_console": args.usb_console}
+    if args.elaborate is not None:
+        extension = {"rtlil": "il", "verilog": "v"}[args.elaborate]
+        variants  = list(VARIANTS) if args.variant == "all" else [args.variant]
+        os.makedirs(args.build_dir, exist_ok=True)
+        for variant in variants:
+            name, text = elaborate(variant, args.testers, args.elaborate, **design)
+            filename = os.path.join(args.build_dir, "{}.{}".format(name, extension))
+            with open(filename, "w") as f:
+                f.write(text)
+            print(filename)
+    elif args.variant == "all":
+        start = time.perf_counter()
+        results = build_parallel(list(VARIANTS), args.build_dir, args.testers,
+                                 use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                                 **design)
+        for variant in VARIANTS:
+            print(_format_result(*results[variant]))
+        print("total: {:.1f}s".format(time.perf_counter() - start))
+    else:
+        print(_format_result(*build(args.variant, args.build_dir, args.testers,
+                                    do_program=not args.no_program,
+                                    use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                                    **design)))
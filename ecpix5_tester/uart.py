@@ -0,0 +1,366 @@
+import struct
+
+from nmigen import *
+from nmigen.lib.cdc import FFSynchronizer
+from nmigen.lib.fifo import SyncFIFOBuffered, AsyncFIFO
+
+
+__all__ = ["UARTTransmitter", "UARTReceiver", "UARTStreamBridge", "SoCStreamBridge",
+           "RegisterBridge", "read_register", "write_register"]
+
+
+class UARTTransmitter(Elaboratable):
+    """
+    8N1 UART transmitter, sending one bit every ``divisor`` cycles.
+    A byte is accepted from ``data`` on each cycle with both ``valid`` and ``ready`` asserted.
+    """
+    def __init__(self, divisor):
+        self.divisor = divisor
+
+        self.tx    = Signal(reset=1)
+        self.data  = Signal(8)
+        self.valid = Signal()
+        self.ready = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        timer = Signal(range(self.divisor))
+        shreg = Signal(10)
+        count = Signal(range(11))
+
+        with m.If(timer != 0):
+            m.d.sync += timer.eq(timer - 1)
+        with m.Elif(count != 0):
+            m.d.sync += [
+                self.tx.eq(shreg[0]),
+                shreg.eq(shreg[1:]),
+                count.eq(count - 1),
+                timer.eq(self.divisor - 1),
+            ]
+        with m.Else():
+            m.d.comb += self.ready.eq(1)
+            with m.If(self.valid):
+                m.d.sync += [
+                    shreg.eq(Cat(C(0, 1), self.data, C(1, 1))),
+                    count.eq(10),
+                ]
+
+        return m
+
+
+class UARTReceiver(Elaboratable):
+    """
+    8N1 UART receiver, for a bit period of ``divisor`` cycles.
+    ``valid`` is asserted for one cycle when a byte is received in ``data``; bytes whose stop
+    bit is not set are discarded.
+    """
+    def __init__(self, divisor):
+        self.divisor = divisor
+
+        self.rx    = Signal(reset=1)
+        self.data  = Signal(8)
+        self.valid = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        rx = Signal(reset=1)
+        m.submodules += FFSynchronizer(self.rx, rx, reset=1)
+
+        timer = Signal(range(self.divisor + self.divisor // 2))
+        shreg = Signal(9)
+        count = Signal(range(10))
+        m.d.comb += self.data.eq(shreg[:8])
+
+        with m.FSM():
+            with m.State("IDLE"):
+                with m.If(~rx):
+                    # Sample in the middle of the first data bit.
+                    m.d.sync += [
+                        timer.eq(self.divisor + self.divisor // 2 - 1),
+                        count.eq(9),
+                    ]
+                    m.next = "DATA"
+            with m.State("DATA"):
+                with m.If(timer == 0):
+                    m.d.sync += [
+                        shreg.eq(Cat(shreg[1:], rx)),
+                        count.eq(count - 1),
+                        timer.eq(self.divisor - 1),
+                    ]
+                    with m.If(count == 1):
+                        m.next = "STOP"
+                with m.Else():
+                    m.d.sync += timer.eq(timer - 1)
+            with m.State("STOP"):
+                m.d.comb += self.valid.eq(shreg[8])
+                m.next = "IDLE"
+
+        return m
+
+
+class UARTStreamBridge(Elaboratable):
+    """
+    Bridge between byte streams and a UART with a bit period of ``divisor`` cycles, with a
+    FIFO of ``fifo_depth`` bytes in each direction.
+    Bytes accepted from ``sink_data`` (on each cycle with both ``sink_valid`` and
+    ``sink_ready`` asserted) are sent on ``tx``. Bytes received on ``rx`` are output on
+    ``source_data``; ``source_last`` marks the last byte available once ``rx`` has been idle
+    for two characters, so that a packetizer can send what it has. Bytes received while the
+    FIFO is full are dropped.
+    """
+    def __init__(self, divisor, fifo_depth=2048):
+        self.divisor    = divisor
+        self.fifo_depth = fifo_depth
+
+        self.rx = Signal(reset=1)
+        self.tx = Signal(reset=1)
+
+        self.sink_data    = Signal(8)
+        self.sink_valid   = Signal()
+        self.sink_ready   = Signal()
+
+        self.source_data  = Signal(8)
+        self.source_valid = Signal()
+        self.source_ready = Signal()
+        self.source_last  = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.transmitter = transmitter = UARTTransmitter(self.divisor)
+        m.submodules.tx_fifo = tx_fifo = SyncFIFOBuffered(width=8, depth=self.fifo_depth)
+        m.d.comb += [
+            tx_fifo.w_data.eq(self.sink_data),
+            tx_fifo.w_en.eq(self.sink_valid),
+            self.sink_ready.eq(tx_fifo.w_rdy),
+            transmitter.data.eq(tx_fifo.r_data),
+            transmitter.valid.eq(tx_fifo.r_rdy),
+            tx_fifo.r_en.eq(transmitter.ready),
+            self.tx.eq(transmitter.tx),
+        ]
+
+        m.submodules.receiver = receiver = UARTReceiver(self.divisor)
+        m.submodules.rx_fifo = rx_fifo = SyncFIFOBuffered(width=8, depth=self.fifo_depth)
+        m.d.comb += [
+            receiver.rx.eq(self.rx),
+            rx_fifo.w_data.eq(receiver.data),
+            rx_fifo.w_en.eq(receiver.valid),
+            self.source_data.eq(rx_fifo.r_data),
+            rx_fifo.r_en.eq(self.source_valid & self.source_ready),
+        ]
+
+        idle_cycles = 20 * self.divisor
+        idle = Signal(range(idle_cycles + 1))
+        with m.If(receiver.valid):
+            m.d.sync += idle.eq(0)
+        with m.Elif(idle != idle_cycles):
+            m.d.sync += idle.eq(idle + 1)
+
+        # The last byte in the FIFO is held back until the line is idle, as it may not be the
+        # last of a burst.
+        with m.If(rx_fifo.level > 1):
+            m.d.comb += self.source_valid.eq(1)
+        with m.Elif(idle == idle_cycles):
+            m.d.comb += [
+                self.source_valid.eq(rx_fifo.r_rdy),
+                self.source_last.eq(1),
+            ]
+
+        return m
+
+
+class SoCStreamBridge(Elaboratable):
+    """
+    Bridge between byte streams and the UART streams of a LiteX SoC generated with a ``stream``
+    UART (``stream``, a ``Record`` with the ``soc.UART_STREAM_LAYOUT``, in ``soc_domain``),
+    with the same interface as ``UARTStreamBridge``.
+    Bytes accepted from ``sink_data`` are sent to the SoC; bytes from the SoC are output on
+    ``source_data``, through a FIFO of ``fifo_depth`` bytes, and ``source_last`` marks the last
+    byte available once the SoC has not sent anything for ``idle_cycles`` cycles. The SoC waits
+    while the FIFO is full.
+    """
+    def __init__(self, stream, soc_domain="soc", fifo_depth=2048, idle_cycles=1024):
+        self.stream      = stream
+        self.soc_domain  = soc_domain
+        self.fifo_depth  = fifo_depth
+        self.idle_cycles = idle_cycles
+
+        self.sink_data    = Signal(8)
+        self.sink_valid   = Signal()
+        self.sink_ready   = Signal()
+
+        self.source_data  = Signal(8)
+        self.source_valid = Signal()
+        self.source_ready = Signal()
+        self.source_last  = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        stream = self.stream
+
+        m.submodules.tx_cdc = tx_cdc = AsyncFIFO(width=8, depth=16,
+                                                 r_domain=self.soc_domain, w_domain="sync")
+        m.d.comb += [
+            tx_cdc.w_data.eq(self.sink_data),
+            tx_cdc.w_en.eq(self.sink_valid),
+            self.sink_ready.eq(tx_cdc.w_rdy),
+            stream.rx_data.eq(tx_cdc.r_data),
+            stream.rx_valid.eq(tx_cdc.r_rdy),
+            tx_cdc.r_en.eq(stream.rx_ready),
+        ]
+
+        m.submodules.rx_cdc = rx_cdc = AsyncFIFO(width=8, depth=16,
+                                                 r_domain="sync", w_domain=self.soc_domain)
+        m.submodules.rx_fifo = rx_fifo = SyncFIFOBuffered(width=8, depth=self.fifo_depth)
+        m.d.comb += [
+            rx_cdc.w_data.eq(stream.tx_data),
+            rx_cdc.w_en.eq(stream.tx_valid),
+            stream.tx_ready.eq(rx_cdc.w_rdy),
+            rx_fifo.w_data.eq(rx_cdc.r_data),
+            rx_fifo.w_en.eq(rx_cdc.r_rdy),
+            rx_cdc.r_en.eq(rx_fifo.w_rdy),
+            self.source_data.eq(rx_fifo.r_data),
+            rx_fifo.r_en.eq(self.source_valid & self.source_ready),
+        ]
+
+        idle = Signal(range(self.idle_cycles + 1))
+        with m.If(rx_fifo.w_en & rx_fifo.w_rdy):
+            m.d.sync += idle.eq(0)
+        with m.Elif(idle != self.idle_cycles):
+            m.d.sync += idle.eq(idle + 1)
+
+        # As in ``UARTStreamBridge``, the last byte is held back until the SoC is idle.
+        with m.If(rx_fifo.level > 1):
+            m.d.comb += self.source_valid.eq(1)
+        with m.Elif(idle == self.idle_cycles):
+            m.d.comb += [
+                self.source_valid.eq(rx_fifo.r_rdy),
+                self.source_last.eq(1),
+            ]
+
+        return m
+
+
+class RegisterBridge(Elaboratable):
+    """
+    Access to 32-bit registers over a UART, with a bit period of ``divisor`` cycles.
+    ``registers`` is a list of ``(signal, writable)`` pairs; register ``n`` is the ``n``-th.
+
+    The host sends a command byte: ``n`` to read register ``n``, which is answered with its
+    value as 4 bytes, little endian; or ``0x80 | n`` followed by 4 bytes, little endian, to
+    write it. Writes are not answered.
+
+    Before each read, ``snapshot`` is asserted for one cycle. With ``external_snapshot``, the
+    value is only sampled once ``snapshot_done`` is then asserted, which allows registers in
+    other clock domains to be captured consistently; otherwise, it is sampled immediately.
+    """
+    def __init__(self, registers, divisor, external_snapshot=False):
+        if len(registers) > 0x80:
+            raise ValueError("RegisterBridge supports at most 128 registers, not {}"
+                             .format(len(registers)))
+        for signal, writable in registers:
+            if len(signal) > 32:
+                raise ValueError("Register {!r} is wider than 32 bits".format(signal))
+        self.registers = list(registers)
+        self.divisor   = divisor
+        self.external_snapshot = external_snapshot
+
+        self.rx = Signal(reset=1)
+        self.tx = Signal(reset=1)
+
+        self.snapshot      = Signal()
+        self.snapshot_done = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.receiver = receiver = UARTReceiver(self.divisor)
+        m.submodules.transmitter = transmitter = UARTTransmitter(self.divisor)
+        m.d.comb += [
+            receiver.rx.eq(self.rx),
+            self.tx.eq(transmitter.tx),
+        ]
+
+        if not self.external_snapshot:
+            m.d.comb += self.snapshot_done.eq(1)
+
+        index = Signal(7)
+        value = Signal(32)
+        count = Signal(range(5))
+
+        with m.FSM():
+            with m.State("COMMAND"):
+                with m.If(receiver.valid):
+                    m.d.sync += [
+                        index.eq(receiver.data[:7]),
+                        count.eq(4),
+                    ]
+                    with m.If(receiver.data[7]):
+                        m.next = "WRITE"
+                    with m.Else():
+                        m.d.comb += self.snapshot.eq(1)
+                        m.next = "SNAPSHOT"
+
+            with m.State("SNAPSHOT"):
+                with m.If(self.snapshot_done):
+                    with m.Switch(index):
+                        for n, (signal, writable) in enumerate(self.registers):
+                            with m.Case(n):
+                                m.d.sync += value.eq(signal)
+                        with m.Default():
+                            m.d.sync += value.eq(0)
+                    m.next = "READ"
+
+            with m.State("READ"):
+                m.d.comb += [
+                    transmitter.data.eq(value[:8]),
+                    transmitter.valid.eq(1),
+                ]
+                with m.If(transmitter.ready):
+                    m.d.sync += [
+                        value.eq(value[8:]),
+                        count.eq(count - 1),
+                    ]
+                    with m.If(count == 1):
+                        m.next = "COMMAND"
+
+            with m.State("WRITE"):
+                with m.If(receiver.valid):
+                    m.d.sync += [
+                        value.eq(Cat(value[8:], receiver.data)),
+                        count.eq(count - 1),
+                    ]
+                    with m.If(count == 1):
+                        m.next = "STORE"
+
+            with m.State("STORE"):
+                with m.Switch(index):
+                    for n, (signal, writable) in enumerate(self.registers):
+                        if writable:
+                            with m.Case(n):
+                                m.d.sync += signal.eq(value)
+                m.next = "COMMAND"
+
+        return m
+
+
+def read_register(port, index):
+    """
+    Read register ``index`` of a ``RegisterBridge`` through the serial ``port`` (any object
+    with ``read`` and ``write`` methods, such as a ``serial.Serial``).
+    """
+    port.write(bytes([index]))
+    data = port.read(4)
+    if len(data) != 4:
+        raise TimeoutError("No answer when reading register {}".format(index))
+    return struct.unpack("<I", data)[0]
+
+
+def write_register(port, index, value):
+    """
+    Write ``value`` to register ``index`` of a ``RegisterBridge`` through the serial ``port``.
+    """
+    port.write(bytes([0x80 | index]) + struct.pack("<I", value & 0xffffffff))
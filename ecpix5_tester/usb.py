@@ -1,20 +1,139 @@
 from nmigen import *
+from usb_protocol.types import USBRequestType, USBTransferType
 from usb_protocol.emitters import DeviceDescriptorCollection
+from usb_protocol.emitters.descriptors import cdc
 
 from luna.gateware.platform.ecpix5 import *
+from luna.gateware.stream.generator import StreamSerializer
+from luna.gateware.usb.stream import USBInStreamInterface
 from luna.gateware.usb.usb2.device import USBDevice
+from luna.gateware.usb.usb2.request import USBRequestHandler
+from luna.gateware.usb.usb2.endpoints.stream import USBStreamInEndpoint, USBStreamOutEndpoint
 
+from .prbs import PRBSGenerator, PRBSChecker
+from .uart import UARTStreamBridge, SoCStreamBridge
+from .usb_bench import (VENDOR_ID, PRODUCT_ID, BULK_ENDPOINT, MAX_PACKET_SIZE, USB_PRBS,
+                        REQUEST_GET_COUNTERS, REQUEST_CLEAR_COUNTERS, USB_COUNTERS)
 
-__all__ = ["USBTestDevice"]
+
+__all__ = ["CounterRequestHandler", "ACMRequestHandler", "USBTestDevice"]
+
+
+class CounterRequestHandler(USBRequestHandler):
+    """
+    Vendor requests of ``USBTestDevice`` (see ``usb_bench``). ``REQUEST_GET_COUNTERS``
+    answers with ``counters``, as 32-bit little endian words sampled when the request is
+    received; ``REQUEST_CLEAR_COUNTERS`` asserts ``clear`` for one cycle.
+    """
+    def __init__(self, counters):
+        super().__init__()
+        self.counters = counters
+        self.clear = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        interface = self.interface
+        setup     = interface.setup
+
+        snapshot = Signal(32 * len(self.counters))
+        m.submodules.transmitter = transmitter = StreamSerializer(
+            data_length=len(snapshot) // 8, domain="usb", stream_type=USBInStreamInterface,
+            max_length_width=len(setup.length))
+        m.d.comb += [transmitter.data[i].eq(snapshot.word_select(i, 8))
+                     for i in range(len(snapshot) // 8)]
+
+        with m.If(setup.type == USBRequestType.VENDOR):
+            with m.Switch(setup.request):
+                with m.Case(REQUEST_GET_COUNTERS):
+                    with m.If(setup.received):
+                        m.d.usb += snapshot.eq(Cat(self.counters))
+                    with m.If(interface.data_requested):
+                        m.d.comb += [
+                            transmitter.stream.attach(interface.tx),
+                            transmitter.max_length.eq(setup.length),
+                            transmitter.start.eq(1),
+                        ]
+                    with m.If(interface.status_requested):
+                        m.d.comb += interface.handshakes_out.ack.eq(1)
+
+                with m.Case(REQUEST_CLEAR_COUNTERS):
+                    with m.If(interface.status_requested):
+                        m.d.comb += [
+                            self.send_zlp(),
+                            self.clear.eq(1),
+                        ]
+
+                with m.Case():
+                    with m.If(interface.status_requested | interface.data_requested):
+                        m.d.comb += interface.handshakes_out.stall.eq(1)
+
+        return m
+
+
+class ACMRequestHandler(USBRequestHandler):
+    """
+    Class requests of the CDC-ACM function of ``USBTestDevice``. Line coding and control line
+    state requests are accepted and ignored, as the console runs at a fixed rate.
+    """
+    SET_LINE_CODING        = 0x20
+    SET_CONTROL_LINE_STATE = 0x22
+
+    def elaborate(self, platform):
+        m = Module()
+
+        interface = self.interface
+        setup     = interface.setup
+
+        with m.If(setup.type == USBRequestType.CLASS):
+            with m.Switch(setup.request):
+                with m.Case(self.SET_LINE_CODING, self.SET_CONTROL_LINE_STATE):
+                    with m.If(interface.rx_ready_for_response):
+                        m.d.comb += interface.handshakes_out.ack.eq(1)
+                    with m.If(interface.status_requested):
+                        m.d.comb += self.send_zlp()
+
+                with m.Case():
+                    with m.If(interface.status_requested | interface.data_requested):
+                        m.d.comb += interface.handshakes_out.stall.eq(1)
+
+        return m
 
 
 class USBTestDevice(Elaboratable):
+    """
+    High-speed USB test device, on the ULPI port.
+    The bulk IN endpoint streams an endless PRBS, and the bulk OUT endpoint checks received
+    data against it; byte and error counters are read through vendor requests. See
+    ``usb_bench`` for the host side.
+
+    If ``serial`` is given (a ``Record`` with the ``soc.SERIAL_LAYOUT``), the device also has
+    a CDC-ACM function bridged to it at ``baudrate``, to be used as the LiteX SoC console. If
+    ``stream`` is given instead (a ``Record`` with the ``soc.UART_STREAM_LAYOUT``), the function
+    is connected to the UART streams of the SoC, and runs at the speed of the SoC.
+
+    The device uses the platform's ULPI port, unless it is given a UTMI ``bus``, in which case
+    the ``usb`` domain is clocked from outside (as in simulation).
+    """
+    # CDC-ACM function: notification endpoint (never used, always NAKed), and data endpoints.
+    ACM_NOTIFY_ENDPOINT = 3
+    ACM_DATA_ENDPOINT   = 2
+    ACM_FIFO_DEPTH      = 2048
+
+    def __init__(self, serial=None, baudrate=1_000_000, bus=None, stream=None):
+        if serial is not None and stream is not None:
+            raise ValueError("The console is either on serial lines or on streams, not both")
+        self.serial   = serial
+        self.baudrate = baudrate
+        self.bus      = bus
+        self.stream   = stream
+
     def create_descriptors(self):
         descriptors = DeviceDescriptorCollection()
 
         with descriptors.DeviceDescriptor() as d:
-            d.idVendor           = 0x16d0
-            d.idProduct          = 0xf3b
+            d.idVendor           = VENDOR_ID
+            d.idProduct          = PRODUCT_ID
             d.iManufacturer      = "LUNA"
             d.iProduct           = "Test Device"
             d.iSerialNumber      = "1234"
@@ -25,25 +144,110 @@ class USBTestDevice(Elaboratable):
                 i.bInterfaceNumber = 0
 
                 with i.EndpointDescriptor() as e:
-                    e.bEndpointAddress = 0x01
-                    e.wMaxPacketSize   = 64
+                    e.bEndpointAddress = BULK_ENDPOINT
+                    e.wMaxPacketSize   = MAX_PACKET_SIZE
 
                 with i.EndpointDescriptor() as e:
-                    e.bEndpointAddress = 0x81
-                    e.wMaxPacketSize   = 64
+                    e.bEndpointAddress = 0x80 | BULK_ENDPOINT
+                    e.wMaxPacketSize   = MAX_PACKET_SIZE
+
+            if self.serial is not None or self.stream is not None:
+                self._add_acm_descriptors(c, first_interface=1)
 
         return descriptors
 
+    def _add_acm_descriptors(self, c, first_interface):
+        with c.InterfaceDescriptor() as i:
+            i.bInterfaceNumber   = first_interface
+            i.bInterfaceClass    = 0x02 # Communications
+            i.bInterfaceSubclass = 0x02 # Abstract Control Model
+            i.bInterfaceProtocol = 0x01 # AT commands
+
+            i.add_subordinate_descriptor(cdc.HeaderDescriptorEmitter())
+
+            union = cdc.UnionFunctionalDescriptorEmitter()
+            union.bControlInterface      = first_interface
+            union.bSubordinateInterface0 = first_interface + 1
+            i.add_subordinate_descriptor(union)
+
+            call_management = cdc.CallManagementFunctionalDescriptorEmitter()
+            call_management.bDataInterface = first_interface + 1
+            i.add_subordinate_descriptor(call_management)
+
+            with i.EndpointDescriptor() as e:
+                e.bEndpointAddress = 0x80 | self.ACM_NOTIFY_ENDPOINT
+                e.bmAttributes     = USBTransferType.INTERRUPT
+                e.wMaxPacketSize   = 8
+                e.bInterval        = 11
+
+        with c.InterfaceDescriptor() as i:
+            i.bInterfaceNumber   = first_interface + 1
+            i.bInterfaceClass    = 0x0a # CDC data
+
+            with i.EndpointDescriptor() as e:
+                e.bEndpointAddress = self.ACM_DATA_ENDPOINT
+                e.wMaxPacketSize   = MAX_PACKET_SIZE
+
+            with i.EndpointDescriptor() as e:
+                e.bEndpointAddress = 0x80 | self.ACM_DATA_ENDPOINT
+                e.wMaxPacketSize   = MAX_PACKET_SIZE
+
     def elaborate(self, platform):
         m = Module()
 
-        m.domains.usb = ClockDomain("usb")
-
-        bus = platform.request(platform.default_usb_connection)
-        m.submodules.usb = usb = USBDevice(bus=bus, handle_clocking=True)
+        if self.bus is None:
+            m.domains.usb = ClockDomain("usb")
+            bus = platform.request(platform.default_usb_connection)
+            m.submodules.usb = usb = USBDevice(bus=bus, handle_clocking=True)
+        else:
+            m.submodules.usb = usb = USBDevice(bus=self.bus, handle_clocking=False)
 
         descriptors = self.create_descriptors()
-        usb.add_standard_control_endpoint(descriptors)
+        control_ep = usb.add_standard_control_endpoint(descriptors)
+
+        in_bytes   = Signal(32)
+        out_bytes  = Signal(32)
+        out_errors = Signal(32)
+        counters = {"in_bytes": in_bytes, "out_bytes": out_bytes, "out_errors": out_errors}
+        request_handler = CounterRequestHandler([counters[name] for name in USB_COUNTERS])
+        control_ep.add_request_handler(request_handler)
+
+        # Bulk IN: free-running PRBS.
+        stream_in = USBStreamInEndpoint(endpoint_number=BULK_ENDPOINT,
+                                        max_packet_size=MAX_PACKET_SIZE)
+        usb.add_endpoint(stream_in)
+        m.submodules.prbs_in = prbs_in = DomainRenamer("usb")(PRBSGenerator(8, USB_PRBS))
+        m.d.comb += [
+            stream_in.stream.valid.eq(1),
+            stream_in.stream.payload.eq(prbs_in.data),
+            prbs_in.next.eq(stream_in.stream.ready),
+        ]
+
+        # Bulk OUT: PRBS checker, restarted when the counters are cleared.
+        stream_out = USBStreamOutEndpoint(endpoint_number=BULK_ENDPOINT,
+                                          max_packet_size=MAX_PACKET_SIZE)
+        usb.add_endpoint(stream_out)
+        m.submodules.prbs_out = prbs_out = DomainRenamer("usb")(PRBSChecker(8, USB_PRBS))
+        m.d.comb += [
+            stream_out.stream.ready.eq(1),
+            prbs_out.restart.eq(request_handler.clear),
+            prbs_out.valid.eq(stream_out.stream.valid),
+            prbs_out.data.eq(stream_out.stream.payload),
+        ]
+
+        with m.If(request_handler.clear):
+            m.d.usb += [counter.eq(0) for counter in counters.values()]
+        with m.Else():
+            with m.If(stream_in.stream.valid & stream_in.stream.ready):
+                m.d.usb += in_bytes.eq(in_bytes + 1)
+            with m.If(stream_out.stream.valid):
+                m.d.usb += [
+                    out_bytes.eq(out_bytes + 1),
+                    out_errors.eq(out_errors + prbs_out.errors),
+                ]
+
+        if self.serial is not None or self.stream is not None:
+            self._elaborate_acm(m, usb, control_ep)
 
         m.d.comb += [
             usb.connect.eq(1),
@@ -51,3 +255,39 @@ class USBTestDevice(Elaboratable):
         ]
 
         return m
+
+    def _elaborate_acm(self, m, usb, control_ep):
+        control_ep.add_request_handler(ACMRequestHandler())
+
+        notify_in = USBStreamInEndpoint(endpoint_number=self.ACM_NOTIFY_ENDPOINT,
+                                        max_packet_size=8)
+        usb.add_endpoint(notify_in)
+
+        data_in = USBStreamInEndpoint(endpoint_number=self.ACM_DATA_ENDPOINT,
+                                      max_packet_size=MAX_PACKET_SIZE)
+        usb.add_endpoint(data_in)
+        data_out = USBStreamOutEndpoint(endpoint_number=self.ACM_DATA_ENDPOINT,
+                                        max_packet_size=MAX_PACKET_SIZE)
+        usb.add_endpoint(data_out)
+
+        if self.stream is not None:
+            bridge = SoCStreamBridge(self.stream, fifo_depth=self.ACM_FIFO_DEPTH)
+        else:
+            # The ULPI PHY clocks the ``usb`` domain at 60 MHz.
+            bridge = UARTStreamBridge(divisor=round(60e6 / self.baudrate),
+                                      fifo_depth=self.ACM_FIFO_DEPTH)
+            m.d.comb += [
+                self.serial.rx.eq(bridge.tx),
+                bridge.rx.eq(self.serial.tx),
+            ]
+        m.submodules.acm_bridge = bridge = DomainRenamer("usb")(bridge)
+        m.d.comb += [
+            bridge.sink_data.eq(data_out.stream.payload),
+            bridge.sink_valid.eq(data_out.stream.valid),
+            data_out.stream.ready.eq(bridge.sink_ready),
+
+            data_in.stream.payload.eq(bridge.source_data),
+            data_in.stream.valid.eq(bridge.source_valid),
+            data_in.stream.last.eq(bridge.source_last),
+            bridge.source_ready.eq(data_in.stream.ready),
+        ]
@@ -0,0 +1,142 @@
+import sys
+import time
+
+from .prbs import PRBS15, prbs_bytes
+
+
+__all__ = ["VENDOR_ID", "PRODUCT_ID", "BULK_ENDPOINT", "MAX_PACKET_SIZE", "USB_PRBS",
+           "REQUEST_GET_COUNTERS", "REQUEST_CLEAR_COUNTERS", "USB_COUNTERS",
+           "prbs_errors", "read_counters", "clear_counters", "run_benchmark", "format_result"]
+
+
+VENDOR_ID  = 0x16d0
+PRODUCT_ID = 0x0f3b
+
+# Bulk OUT endpoint 0x01 and bulk IN endpoint 0x81 of ``USBTestDevice``.
+BULK_ENDPOINT   = 1
+MAX_PACKET_SIZE = 512
+
+# The OUT stream is checked against this sequence from the start, after the counters are
+# cleared; the IN stream is an endless run of it, starting anywhere. With a period of
+# 2**15 - 1 bits, the sequence also repeats every 2**15 - 1 bytes, so the host can send a
+# precomputed buffer over and over.
+USB_PRBS = PRBS15
+
+# Vendor requests, to the device.
+REQUEST_GET_COUNTERS   = 0x01
+REQUEST_CLEAR_COUNTERS = 0x02
+
+# Counters returned by ``REQUEST_GET_COUNTERS``, in order, as 32-bit little endian words.
+# ``REQUEST_CLEAR_COUNTERS`` also restarts the sequence expected on the OUT endpoint.
+USB_COUNTERS = ("in_bytes", "out_bytes", "out_errors")
+
+
+def prbs_errors(data, taps=USB_PRBS, start=0):
+    """
+    Check that ``data`` is a run of the PRBS with the given ``taps``, from any starting point,
+    and return the number of bits of ``data`` (from bit ``start``, first bit in the LSB of the
+    first byte) that do not follow from the previous ones. A single flipped bit is counted
+    once for each tap, plus one.
+    """
+    degree = max(taps)
+    value = int.from_bytes(data, "little")
+    syndrome = value
+    for tap in taps:
+        syndrome ^= value << tap
+    syndrome &= (1 << (len(data) * 8)) - 1
+    syndrome >>= max(start, degree)
+    return bin(syndrome).count("1")
+
+
+def read_counters(device):
+    """
+    Return the counters of ``device`` (a ``usb.core.Device``), as a dict.
+    """
+    data = device.ctrl_transfer(0xc0, REQUEST_GET_COUNTERS, 0, 0, 4 * len(USB_COUNTERS))
+    return {name: int.from_bytes(bytes(data[4 * i:4 * i + 4]), "little")
+            for i, name in enumerate(USB_COUNTERS)}
+
+
+def clear_counters(device):
+    device.ctrl_transfer(0x40, REQUEST_CLEAR_COUNTERS, 0, 0)
+
+
+def run_benchmark(device, direction, duration=5.0, transfer_size=1 << 20, timeout=1000):
+    """
+    Stream data in ``direction`` (``"in"`` or ``"out"``) to or from the bulk endpoints of
+    ``device`` for ``duration`` seconds, with transfers of ``transfer_size`` bytes, and check
+    it against the PRBS. Returns a dict with the number of bytes transferred, the time it took,
+    the number of bytes counted by the device, and the number of PRBS errors.
+    """
+    clear_counters(device)
+    total = errors = 0
+    if direction == "out":
+        period = prbs_bytes((1 << max(USB_PRBS)) - 1, USB_PRBS)
+        buffer = period * max(1, transfer_size // len(period))
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            total += device.write(BULK_ENDPOINT, buffer, timeout)
+        elapsed = time.perf_counter() - start
+        counters = read_counters(device)
+        device_bytes, errors = counters["out_bytes"], counters["out_errors"]
+    elif direction == "in":
+        # The last bytes of each transfer are checked again along with the next one, as the
+        # first bits of a transfer only follow from them.
+        overlap = (max(USB_PRBS) + 7) // 8
+        tail = b""
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            data = bytes(device.read(0x80 | BULK_ENDPOINT, transfer_size, timeout))
+            errors += prbs_errors(tail + data, USB_PRBS, start=len(tail) * 8)
+            total += len(data)
+            tail = data[-overlap:]
+        elapsed = time.perf_counter() - start
+        device_bytes = read_counters(device)["in_bytes"]
+    else:
+        raise ValueError("Unknown direction {!r}; expected 'in' or 'out'".format(direction))
+
+    return {
+        "bytes":        total,
+        "time":         elapsed,
+        "device_bytes": device_bytes,
+        "errors":       errors,
+    }
+
+
+def format_result(direction, result):
+    return "{:>3}: {} bytes in {:.2f}s, {:.1f} MB/s, {} errors".format(
+        direction.upper(), result["bytes"], result["time"],
+        result["bytes"] / result["time"] / 1e6, result["errors"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import usb.core
+
+    parser = argparse.ArgumentParser(
+        description="Measure the bulk throughput of the USB test device, and check the data.")
+    parser.add_argument("--direction", choices=("in", "out", "both"), default="both",
+        help="direction to test, as seen from the host (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0,
+        help="duration of each test, in seconds (default: %(default)s)")
+    parser.add_argument("--transfer-size", type=int, default=1 << 20,
+        help="size of each bulk transfer, in bytes (default: %(default)s)")
+
+    args = parser.parse_args()
+    device = usb.core.find(idVendor=VENDOR_ID, idProduct=PRODUCT_ID)
+    if device is None:
+        sys.exit("USB test device {:04x}:{:04x} not found".format(VENDOR_ID, PRODUCT_ID))
+    device.set_configuration()
+
+    failed = False
+    for direction in (("out", "in") if args.direction == "both" else (args.direction,)):
+        result = run_benchmark(device, direction, args.duration, args.transfer_size)
+        print(format_result(direction, result))
+        # The IN endpoint buffers data the host has not read yet, so only OUT byte counts
+        # must match exactly.
+        if direction == "out" and result["device_bytes"] != result["bytes"] & 0xffffffff:
+            print("  device received {} bytes".format(result["device_bytes"]))
+            failed = True
+        failed |= result["errors"] != 0
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,305 @@
+/*
+ * Small raw deflate decoder, after Mark Adler's puff (zlib/contrib/puff).
+ * Speed is not a concern: the serial link is much slower. It needs no heap, and about
+ * 2 KiB of stack.
+ */
+
+#include "inflate.h"
+
+#define MAXBITS   15  /* maximum bits in a code */
+#define MAXLCODES 286 /* maximum number of literal/length codes */
+#define MAXDCODES 30  /* maximum number of distance codes */
+#define MAXCODES  (MAXLCODES + MAXDCODES)
+#define FIXLCODES 288 /* number of fixed literal/length codes */
+
+struct state {
+	unsigned char *out;
+	unsigned long outlen;
+	unsigned long outcnt;
+
+	const unsigned char *in;
+	unsigned long inlen;
+	unsigned long incnt;
+	int overrun;
+
+	unsigned int bitbuf;
+	int bitcnt;
+};
+
+struct huffman {
+	short *count;  /* number of symbols of each length */
+	short *symbol; /* symbols, ordered by code */
+};
+
+static int bits(struct state *s, int need)
+{
+	unsigned long val = s->bitbuf;
+
+	while (s->bitcnt < need) {
+		if (s->incnt == s->inlen) {
+			s->overrun = 1;
+			return 0;
+		}
+		val |= (unsigned long)s->in[s->incnt++] << s->bitcnt;
+		s->bitcnt += 8;
+	}
+	s->bitbuf = val >> need;
+	s->bitcnt -= need;
+	return val & ((1UL << need) - 1);
+}
+
+static int stored(struct state *s)
+{
+	unsigned int len;
+
+	s->bitbuf = 0;
+	s->bitcnt = 0;
+	if (s->incnt + 4 > s->inlen)
+		return INFLATE_INPUT;
+	len = s->in[s->incnt] | (s->in[s->incnt + 1] << 8);
+	if (s->in[s->incnt + 2] != (~len & 0xff) || s->in[s->incnt + 3] != ((~len >> 8) & 0xff))
+		return INFLATE_INVALID;
+	s->incnt += 4;
+	if (s->incnt + len > s->inlen)
+		return INFLATE_INPUT;
+	if (s->outcnt + len > s->outlen)
+		return INFLATE_OUTPUT;
+	while (len--)
+		s->out[s->outcnt++] = s->in[s->incnt++];
+	return INFLATE_OK;
+}
+
+static int decode(struct state *s, const struct huffman *h)
+{
+	int len, code = 0, first = 0, index = 0, count;
+
+	for (len = 1; len <= MAXBITS; len++) {
+		code |= bits(s, 1);
+		if (s->overrun)
+			return INFLATE_INPUT;
+		count = h->count[len];
+		if (code - count < first)
+			return h->symbol[index + (code - first)];
+		index += count;
+		first += count;
+		first <<= 1;
+		code <<= 1;
+	}
+	return INFLATE_INVALID;
+}
+
+/* Returns 0 for a complete code, > 0 for an incomplete one, < 0 for an oversubscribed one. */
+static int construct(struct huffman *h, const short *length, int n)
+{
+	int symbol, len, left;
+	short offs[MAXBITS + 1];
+
+	for (len = 0; len <= MAXBITS; len++)
+		h->count[len] = 0;
+	for (symbol = 0; symbol < n; symbol++)
+		h->count[length[symbol]]++;
+	if (h->count[0] == n)
+		return 0;
+
+	left = 1;
+	for (len = 1; len <= MAXBITS; len++) {
+		left <<= 1;
+		left -= h->count[len];
+		if (left < 0)
+			return left;
+	}
+
+	offs[1] = 0;
+	for (len = 1; len < MAXBITS; len++)
+		offs[len + 1] = offs[len] + h->count[len];
+	for (symbol = 0; symbol < n; symbol++)
+		if (length[symbol] != 0)
+			h->symbol[offs[length[symbol]]++] = symbol;
+	return left;
+}
+
+static int codes(struct state *s, const struct huffman *lencode, const struct huffman *distcode)
+{
+	static const short lbase[29] = {
+		3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31,
+		35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258};
+	static const short lext[29] = {
+		0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2,
+		3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0};
+	static const short dbase[30] = {
+		1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193,
+		257, 385, 513, 769, 1025, 1537, 2049, 3073, 4097, 6145,
+		8193, 12289, 16385, 24577};
+	static const short dext[30] = {
+		0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6,
+		7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13};
+	int symbol, len;
+	unsigned long dist;
+
+	do {
+		symbol = decode(s, lencode);
+		if (symbol < 0)
+			return symbol;
+		if (symbol < 256) {
+			if (s->outcnt == s->outlen)
+				return INFLATE_OUTPUT;
+			s->out[s->outcnt++] = symbol;
+		} else if (symbol > 256) {
+			symbol -= 257;
+			if (symbol >= 29)
+				return INFLATE_INVALID;
+			len = lbase[symbol] + bits(s, lext[symbol]);
+
+			symbol = decode(s, distcode);
+			if (symbol < 0)
+				return symbol;
+			if (symbol >= 30)
+				return INFLATE_INVALID;
+			dist = dbase[symbol] + bits(s, dext[symbol]);
+			if (s->overrun)
+				return INFLATE_INPUT;
+			if (dist > s->outcnt)
+				return INFLATE_INVALID;
+			if (s->outcnt + len > s->outlen)
+				return INFLATE_OUTPUT;
+			while (len--) {
+				s->out[s->outcnt] = s->out[s->outcnt - dist];
+				s->outcnt++;
+			}
+		}
+	} while (symbol != 256);
+	return INFLATE_OK;
+}
+
+static int fixed(struct state *s)
+{
+	static int built;
+	static short lencnt[MAXBITS + 1], lensym[FIXLCODES];
+	static short distcnt[MAXBITS + 1], distsym[MAXDCODES];
+	static struct huffman lencode = {lencnt, lensym};
+	static struct huffman distcode = {distcnt, distsym};
+
+	if (!built) {
+		short lengths[FIXLCODES];
+		int symbol;
+
+		for (symbol = 0; symbol < 144; symbol++)
+			lengths[symbol] = 8;
+		for (; symbol < 256; symbol++)
+			lengths[symbol] = 9;
+		for (; symbol < 280; symbol++)
+			lengths[symbol] = 7;
+		for (; symbol < FIXLCODES; symbol++)
+			lengths[symbol] = 8;
+		construct(&lencode, lengths, FIXLCODES);
+
+		for (symbol = 0; symbol < MAXDCODES; symbol++)
+			lengths[symbol] = 5;
+		construct(&distcode, lengths, MAXDCODES);
+		built = 1;
+	}
+	return codes(s, &lencode, &distcode);
+}
+
+static int dynamic(struct state *s)
+{
+	static const short order[19] = {
+		16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15};
+	int nlen, ndist, ncode, index, err;
+	short lengths[MAXCODES];
+	short lencnt[MAXBITS + 1], lensym[MAXLCODES];
+	short distcnt[MAXBITS + 1], distsym[MAXDCODES];
+	struct huffman lencode = {lencnt, lensym};
+	struct huffman distcode = {distcnt, distsym};
+
+	nlen = bits(s, 5) + 257;
+	ndist = bits(s, 5) + 1;
+	ncode = bits(s, 4) + 4;
+	if (nlen > MAXLCODES || ndist > MAXDCODES)
+		return INFLATE_INVALID;
+
+	for (index = 0; index < ncode; index++)
+		lengths[order[index]] = bits(s, 3);
+	for (; index < 19; index++)
+		lengths[order[index]] = 0;
+	if (s->overrun)
+		return INFLATE_INPUT;
+	if (construct(&lencode, lengths, 19) != 0)
+		return INFLATE_INVALID;
+
+	index = 0;
+	while (index < nlen + ndist) {
+		int symbol, len;
+
+		symbol = decode(s, &lencode);
+		if (symbol < 0)
+			return symbol;
+		if (symbol < 16) {
+			lengths[index++] = symbol;
+			continue;
+		}
+		len = 0;
+		if (symbol == 16) {
+			if (index == 0)
+				return INFLATE_INVALID;
+			len = lengths[index - 1];
+			symbol = 3 + bits(s, 2);
+		} else if (symbol == 17)
+			symbol = 3 + bits(s, 3);
+		else
+			symbol = 11 + bits(s, 7);
+		if (s->overrun)
+			return INFLATE_INPUT;
+		if (index + symbol > nlen + ndist)
+			return INFLATE_INVALID;
+		while (symbol--)
+			lengths[index++] = len;
+	}
+	if (lengths[256] == 0)
+		return INFLATE_INVALID;
+
+	/* Incomplete codes are only allowed for a single length 1 code. */
+	err = construct(&lencode, lengths, nlen);
+	if (err && (err < 0 || nlen != lencode.count[0] + lencode.count[1]))
+		return INFLATE_INVALID;
+	err = construct(&distcode, lengths + nlen, ndist);
+	if (err && (err < 0 || ndist != distcode.count[0] + distcode.count[1]))
+		return INFLATE_INVALID;
+
+	return codes(s, &lencode, &distcode);
+}
+
+int inflate(unsigned char *dest, unsigned long *destlen,
+            const unsigned char *src, unsigned long srclen)
+{
+	struct state s;
+	int last, type, err;
+
+	s.out = dest;
+	s.outlen = *destlen;
+	s.outcnt = 0;
+	s.in = src;
+	s.inlen = srclen;
+	s.incnt = 0;
+	s.overrun = 0;
+	s.bitbuf = 0;
+	s.bitcnt = 0;
+
+	do {
+		last = bits(&s, 1);
+		type = bits(&s, 2);
+		if (s.overrun)
+			err = INFLATE_INPUT;
+		else if (type == 0)
+			err = stored(&s);
+		else if (type == 1)
+			err = fixed(&s);
+		else if (type == 2)
+			err = dynamic(&s);
+		else
+			err = INFLATE_INVALID;
+	} while (err == INFLATE_OK && !last);
+
+	*destlen = s.outcnt;
+	return err;
+}
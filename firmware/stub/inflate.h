@@ -0,0 +1,17 @@
+#ifndef __INFLATE_H
+#define __INFLATE_H
+
+#define INFLATE_OK         0
+#define INFLATE_OUTPUT    -1 /* the output does not fit in the destination */
+#define INFLATE_INPUT     -2 /* the input ends before the last block */
+#define INFLATE_INVALID   -3 /* the input is not a valid raw deflate stream */
+
+/*
+ * Decompress the raw deflate stream (RFC 1951, without zlib or gzip header) of ``srclen``
+ * bytes at ``src`` into at most ``*destlen`` bytes at ``dest``. On return, ``*destlen`` is
+ * the number of bytes written.
+ */
+int inflate(unsigned char *dest, unsigned long *destlen,
+            const unsigned char *src, unsigned long srclen);
+
+#endif /* __INFLATE_H */
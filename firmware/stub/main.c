@@ -0,0 +1,339 @@
+/*
+ * Serial boot stub.
+ *
+ * Loaded by the BIOS serialboot at STUB_ADDRESS, this receives compressed chunks from
+ * ``ecpix5_tester.host.boot``, then decompresses them into place and jumps to the boot
+ * address. Chunks are received into a staging area with their CRC computed on the fly, and
+ * acknowledged at once so that the host can keep a window of them in flight: the UART FIFO
+ * is only 16 bytes deep, so nothing slower than a table lookup is done while bytes arrive.
+ *
+ * The frame format and constants must match host/boot.py.
+ */
+
+#include <stdint.h>
+
+#include <generated/csr.h>
+#include <generated/mem.h>
+#include <irq.h>
+#include <system.h>
+
+#include "inflate.h"
+
+#ifndef UART_EV_TX
+#define UART_EV_TX 0x1
+#define UART_EV_RX 0x2
+#endif
+
+#define VERSION       1
+#define WINDOW        16
+#define MAX_CHUNK     (64 * 1024)
+#define MAX_PAYLOAD   (12 + MAX_CHUNK + MAX_CHUNK / 1024 + 64)
+#define MAX_CHUNKS    4096
+#define MAX_CHECKSUMS 1024
+
+#define STAGING_BASE  0x42000000
+#define STAGING_END   0x47f00000 /* STUB_ADDRESS */
+
+#define HOST_MAGIC    0x5a
+#define STUB_MAGIC    0xa5
+
+#define CMD_HELLO     0x01 /* -> version, window, maximum chunk, staging size */
+#define CMD_CHECKSUM  0x02 /* address, length, block size -> CRC32 of each block */
+#define CMD_DATA      0x03 /* address, length, CRC32, compressed data */
+#define CMD_BOOT      0x04 /* address, r1, r2, r3 -> number of chunks, then jumps */
+
+#define STATUS_OK     0x00
+#define STATUS_CRC    0x01 /* corrupted frame; seq is the next expected data frame */
+#define STATUS_ERROR  0x02 /* payload is an error code, and a chunk index for CMD_BOOT */
+
+#define ERROR_COMMAND 1
+#define ERROR_RANGE   2
+#define ERROR_FULL    3
+#define ERROR_INFLATE 4
+#define ERROR_CHECK   5
+
+struct chunk {
+	uint32_t address;
+	uint32_t length;
+	uint32_t crc;
+	const uint8_t *data;
+	uint32_t size;
+};
+
+static struct chunk chunks[MAX_CHUNKS];
+static uint8_t checksums[4 * MAX_CHECKSUMS];
+static uint32_t crc_table[256];
+
+static uint8_t serial_getc(void)
+{
+	uint8_t c;
+
+	while (uart_rxempty_read());
+	c = uart_rxtx_read();
+	uart_ev_pending_write(UART_EV_RX);
+	return c;
+}
+
+static void serial_putc(uint8_t c)
+{
+	while (uart_txfull_read());
+	uart_rxtx_write(c);
+	uart_ev_pending_write(UART_EV_TX);
+}
+
+static void crc32_init(void)
+{
+	uint32_t c;
+	int i, k;
+
+	for (i = 0; i < 256; i++) {
+		c = i;
+		for (k = 0; k < 8; k++)
+			c = c & 1 ? 0xedb88320 ^ (c >> 1) : c >> 1;
+		crc_table[i] = c;
+	}
+}
+
+static inline uint32_t crc32_update(uint32_t crc, uint8_t c)
+{
+	return crc_table[(crc ^ c) & 0xff] ^ (crc >> 8);
+}
+
+static uint32_t crc32(const uint8_t *data, uint32_t length)
+{
+	uint32_t crc = 0xffffffff;
+
+	while (length--)
+		crc = crc32_update(crc, *data++);
+	return ~crc;
+}
+
+static uint32_t get_u32(const uint8_t *p)
+{
+	return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static void put_u32(uint8_t *p, uint32_t value)
+{
+	p[0] = value;
+	p[1] = value >> 8;
+	p[2] = value >> 16;
+	p[3] = value >> 24;
+}
+
+/*
+ * Receive a frame, with its payload into ``buffer``. Returns the payload length, or -1 if
+ * the frame is corrupted.
+ */
+static int receive(uint8_t *cmd, uint8_t *seq, uint8_t *buffer)
+{
+	uint8_t header[6], trailer[4];
+	uint32_t crc, length, i;
+
+	while (serial_getc() != HOST_MAGIC);
+
+	crc = 0xffffffff;
+	for (i = 0; i < sizeof(header); i++) {
+		header[i] = serial_getc();
+		crc = crc32_update(crc, header[i]);
+	}
+	length = get_u32(header + 2);
+	if (length > MAX_PAYLOAD)
+		return -1;
+	for (i = 0; i < length; i++) {
+		buffer[i] = serial_getc();
+		crc = crc32_update(crc, buffer[i]);
+	}
+	for (i = 0; i < sizeof(trailer); i++)
+		trailer[i] = serial_getc();
+	if (get_u32(trailer) != ~crc)
+		return -1;
+
+	*cmd = header[0];
+	*seq = header[1];
+	return length;
+}
+
+static void send(uint8_t status, uint8_t seq, const uint8_t *payload, uint32_t length)
+{
+	uint8_t header[6] = {status, seq};
+	uint8_t trailer[4];
+	uint32_t crc = 0xffffffff;
+	uint32_t i;
+
+	put_u32(header + 2, length);
+	serial_putc(STUB_MAGIC);
+	for (i = 0; i < sizeof(header); i++) {
+		serial_putc(header[i]);
+		crc = crc32_update(crc, header[i]);
+	}
+	for (i = 0; i < length; i++) {
+		serial_putc(payload[i]);
+		crc = crc32_update(crc, payload[i]);
+	}
+	put_u32(trailer, ~crc);
+	for (i = 0; i < sizeof(trailer); i++)
+		serial_putc(trailer[i]);
+}
+
+static void send_u32(uint8_t status, uint8_t seq, uint32_t value)
+{
+	uint8_t payload[4];
+
+	put_u32(payload, value);
+	send(status, seq, payload, sizeof(payload));
+}
+
+static void send_error(uint8_t seq, uint32_t error, uint32_t index)
+{
+	uint8_t payload[8];
+
+	put_u32(payload, error);
+	put_u32(payload + 4, index);
+	send(STATUS_ERROR, seq, payload, sizeof(payload));
+}
+
+/* Decompress and check all chunks. Returns the index of the first bad one, or -1. */
+static int unpack(unsigned int count, uint32_t *error)
+{
+	unsigned long length;
+	unsigned int i;
+
+	for (i = 0; i < count; i++) {
+		length = chunks[i].length;
+		if (inflate((uint8_t *)chunks[i].address, &length, chunks[i].data, chunks[i].size)) {
+			*error = ERROR_INFLATE;
+			return i;
+		}
+		if (length != chunks[i].length ||
+		    crc32((const uint8_t *)chunks[i].address, length) != chunks[i].crc) {
+			*error = ERROR_CHECK;
+			return i;
+		}
+	}
+	return -1;
+}
+
+static void __attribute__((noreturn)) jump(uint32_t address, uint32_t r1, uint32_t r2,
+					     uint32_t r3)
+{
+	/* Let the last reply out before the UART is reconfigured. */
+	busy_wait(10);
+	irq_setmask(0);
+	irq_setie(0);
+	flush_cpu_icache();
+	flush_cpu_dcache();
+#ifdef CONFIG_L2_SIZE
+	flush_l2_cache();
+#endif
+	((void (*)(unsigned long, unsigned long, unsigned long))address)(r1, r2, r3);
+	while (1);
+}
+
+int main(void)
+{
+	uint8_t *staging = (uint8_t *)STAGING_BASE;
+	unsigned int count = 0;
+	uint8_t expected = 0;
+	uint8_t reply[12];
+	uint8_t cmd, seq;
+	uint32_t address, size, block, error;
+	unsigned int i;
+	int length, bad;
+
+	crc32_init();
+
+	while (1) {
+		/* Every frame is received into the staging area; only data frames stay there. */
+		length = receive(&cmd, &seq, staging);
+		if (length < 0) {
+			send(STATUS_CRC, expected, 0, 0);
+			continue;
+		}
+
+		switch (cmd) {
+		case CMD_HELLO:
+			staging = (uint8_t *)STAGING_BASE;
+			count = 0;
+			expected = 0;
+			reply[0] = VERSION;
+			reply[1] = WINDOW;
+			reply[2] = reply[3] = 0;
+			put_u32(reply + 4, MAX_CHUNK);
+			put_u32(reply + 8, STAGING_END - STAGING_BASE - MAX_PAYLOAD);
+			send(STATUS_OK, seq, reply, sizeof(reply));
+			break;
+
+		case CMD_CHECKSUM:
+			address = get_u32(staging);
+			size = get_u32(staging + 4);
+			block = get_u32(staging + 8);
+			if (length != 12 || block == 0 || size > MAX_CHECKSUMS * block) {
+				send_error(seq, ERROR_COMMAND, 0);
+				break;
+			}
+			for (i = 0; size > 0; i++) {
+				if (block > size)
+					block = size;
+				put_u32(checksums + 4 * i, crc32((const uint8_t *)address, block));
+				address += block;
+				size -= block;
+			}
+			send(STATUS_OK, seq, checksums, 4 * i);
+			break;
+
+		case CMD_DATA:
+			if (seq != expected) {
+				/* Frames sent after a corrupted one are dropped; repeated ones (after a
+				 * lost acknowledgement) are acknowledged again. */
+				if ((uint8_t)(expected - seq) <= WINDOW)
+					send(STATUS_OK, expected - 1, 0, 0);
+				break;
+			}
+			if (length < 12 || get_u32(staging + 4) > MAX_CHUNK) {
+				send_error(seq, ERROR_COMMAND, 0);
+				break;
+			}
+			if (get_u32(staging) < MAIN_RAM_BASE ||
+			    get_u32(staging) + get_u32(staging + 4) > STAGING_BASE) {
+				send_error(seq, ERROR_RANGE, 0);
+				break;
+			}
+			if (count == MAX_CHUNKS ||
+			    staging + length + 4 + MAX_PAYLOAD > (uint8_t *)STAGING_END) {
+				send_error(seq, ERROR_FULL, 0);
+				break;
+			}
+			chunks[count].address = get_u32(staging);
+			chunks[count].length = get_u32(staging + 4);
+			chunks[count].crc = get_u32(staging + 8);
+			chunks[count].data = staging + 12;
+			chunks[count].size = length - 12;
+			count++;
+			/* Keep the staged data word aligned. */
+			staging += (length + 3) & ~3;
+			send(STATUS_OK, expected++, 0, 0);
+			break;
+
+		case CMD_BOOT:
+			if (length != 16) {
+				send_error(seq, ERROR_COMMAND, 0);
+				break;
+			}
+			bad = unpack(count, &error);
+			if (bad >= 0) {
+				send_error(seq, error, bad);
+				break;
+			}
+			send_u32(STATUS_OK, seq, count);
+			jump(get_u32(staging), get_u32(staging + 4), get_u32(staging + 8),
+			     get_u32(staging + 12));
+
+		default:
+			send_error(seq, ERROR_COMMAND, 0);
+			break;
+		}
+	}
+
+	return 0;
+}
@@ -25,12 +25,19 @@ setup(
     install_requires=[
         "nmigen>=0.1,<0.5",
         "nmigen-boards",
+        "numpy",
     ],
     entry_points={
         "console_scripts": [
+            "ecpix5-test = ecpix5_tester.host.orchestrator:main",
+            "ecpix5-standin = ecpix5_tester.host.standin:main",
+            "ecpix5-boot = ecpix5_tester.host.boot:main",
         ]
     },
     extras_require={
     },
     packages=find_packages(),
+    package_data={
+        "ecpix5_tester.host.recordings": ["*.log"],
+    },
 )